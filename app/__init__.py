@@ -2,7 +2,9 @@ import os
 
 from flask import Flask
 
-from .utils.config import Config, FileConfig
+from .utils.config import Config, FileConfig, ConfigContext
+from .utils.jobs import JobManager, DEFAULT_JOB_TTL, DEFAULT_MAX_FINISHED_JOBS
+from .utils.sessions import SessionStore, DEFAULT_SESSION_TIMEOUT, DEFAULT_MAX_SESSIONS
 
 
 def create_app():
@@ -21,16 +23,28 @@ def create_app():
     # load the type specific configs
     for c_type in app.config["base"]["config_types"]:
         app.config[c_type] = FileConfig(os.path.join(app.instance_path, f"config_{c_type}.json"))
+    # precompute the values of every config that are needed by the calculations
+    app.config["contexts"] = {c_type: ConfigContext.from_config(c_type, app.config[c_type])
+                              for c_type in app.config["base"]["config_types"]}
+    # background jobs for long-running calculations
+    app.config["jobs"] = JobManager(app, app.config["base"]["job_workers"] or 1,
+                                    app.config["base"]["job_ttl"] or DEFAULT_JOB_TTL,
+                                    app.config["base"]["max_finished_jobs"] or DEFAULT_MAX_FINISHED_JOBS)
+    # state of the allocation sessions
+    app.config["sessions"] = SessionStore(app.config["base"]["session_timeout"] or DEFAULT_SESSION_TIMEOUT,
+                                          app.config["base"]["max_sessions"] or DEFAULT_MAX_SESSIONS)
 
     from .blueprints import index, dashboard, getFunction, getConvolution, getAllocation, getAllocationComplete, \
-        getQualityLoss, uploadCustomerData
+        getQualityLoss, uploadCustomerData, jobs, allocationSession
     app.register_blueprint(index.bp)
     app.register_blueprint(dashboard.bp)
     app.register_blueprint(getFunction.bp)
     app.register_blueprint(getConvolution.bp)
     app.register_blueprint(getAllocation.bp)
+    app.register_blueprint(allocationSession.bp)
     app.register_blueprint(getAllocationComplete.bp)
     app.register_blueprint(getQualityLoss.bp)
     app.register_blueprint(uploadCustomerData.bp)
+    app.register_blueprint(jobs.bp)
 
     return app
@@ -0,0 +1,156 @@
+from typing import Dict, Any
+
+from flask import Blueprint, request, jsonify
+from werkzeug.exceptions import BadRequest
+
+from app.calculations.allocation.session import AllocationSession
+from app.utils.config import get_config_context, get_workers
+from app.utils.ingestion import read_components, to_data_frame, count_values
+from app.utils.requests import parse_qc_strategy
+from app.utils.sessions import get_session_store
+
+bp = Blueprint("allocation_session", __name__)
+
+
+@bp.route("/allocationSession", methods=["POST"])
+def create_allocation_session():
+    """
+    Starts an allocation of two components whose batches arrive (and leave) one at a time.
+    Only the pairs of a new batch are evaluated, the pairs of all previous batches are kept.
+
+    Params: same as /getAllocation (except algorithm, the allocation is always solved as linear assignment).
+
+    Input
+    -----
+    JSON array of the initial characteristic values of both components (see /getAllocation).
+    The batches may be empty.
+
+    Output
+    ------
+    JSON dictionary (see get_allocation_session).
+    """
+    method = request.args.get("method", "mean")
+    qc = parse_qc_strategy(request.args.get("qc_strategy", ""))
+    bins = int(request.args.get("bins"))
+    components = read_components(1)
+    if len(components) != 2:
+        raise BadRequest("allocation sessions only support two components")
+
+    batch_size = next((count_values(component["batches"][0]) for component in components if component["batches"]),
+                      None)
+    settings_dict = {
+        "config": get_config_context(request.args["c"]),
+        "bins": bins,
+        "workers": get_workers(request.args.get("workers")),
+        "convolution": request.args.get("convolution"),
+        "batch_size": batch_size,
+        "component_names": [component["name"] for component in components],
+    }
+    session = AllocationSession(qc, method, settings_dict)
+    for component_idx, component in enumerate(components):
+        for batch in component["batches"]:
+            session.add_batch(component_idx, to_data_frame(batch))
+
+    session_id = get_session_store().add(session)
+    return jsonify(_session_status(session_id, session))
+
+
+@bp.route("/allocationSession/<session_id>", methods=["GET"])
+def get_allocation_session(session_id):
+    """
+    Returns the current allocation of a session.
+
+    Output
+    ------
+    JSON dictionary.
+
+    {
+        "id": <session id>,
+        # number of batches of both components
+        "batches": [3, 4],
+        # the optimal batch allocation, like /getAllocation
+        "permutation": [0, 3, 2],
+        "values": [0.35, -0.3, 0]
+    }
+    """
+    store = get_session_store()
+    with store.lock(session_id):
+        return jsonify(_session_status(session_id, store.get(session_id)))
+
+
+@bp.route("/allocationSession/<session_id>", methods=["DELETE"])
+def delete_allocation_session(session_id):
+    """
+    Ends a session.
+    """
+    get_session_store().remove(session_id)
+    return jsonify({"id": session_id})
+
+
+@bp.route("/allocationSession/<session_id>/<component>", methods=["POST"])
+def add_allocation_session_batch(session_id, component):
+    """
+    Adds a batch of the given component (name) and re-optimizes the allocation.
+
+    Input
+    -----
+    JSON dictionary of the characteristic values of the batch.
+    {
+        "functional characteristic 1": [ Values for functional characteristic 1 ],
+        "functional characteristic 2": [ Values for functional characteristic 2 ],
+        ...
+    }
+
+    Output
+    ------
+    JSON dictionary (see get_allocation_session), with the index of the new batch as "batch".
+    """
+    store = get_session_store()
+    with store.lock(session_id):
+        session = store.get(session_id)
+        first_batch = session.settings_dict["batch_size"] is None
+        if first_batch:
+            session.settings_dict["batch_size"] = count_values(request.json)
+        try:
+            batch_idx = session.add_batch(_component_index(session, component), to_data_frame(request.json))
+        except Exception:
+            if first_batch:
+                session.settings_dict["batch_size"] = None
+            raise
+        result = _session_status(session_id, session)
+    result["batch"] = batch_idx
+    return jsonify(result)
+
+
+@bp.route("/allocationSession/<session_id>/<component>/<int:batch_idx>", methods=["DELETE"])
+def remove_allocation_session_batch(session_id, component, batch_idx):
+    """
+    Removes a batch of the given component (name), e.g. after it has been assembled,
+    and re-optimizes the allocation. The indices of all following batches of the component are decreased.
+
+    Output
+    ------
+    JSON dictionary (see get_allocation_session).
+    """
+    store = get_session_store()
+    with store.lock(session_id):
+        session = store.get(session_id)
+        session.remove_batch(_component_index(session, component), batch_idx)
+        return jsonify(_session_status(session_id, session))
+
+
+def _component_index(session: AllocationSession, component: str) -> int:
+    component_names = session.settings_dict["component_names"]
+    if component not in component_names:
+        raise BadRequest("unknown component " + component)
+    return component_names.index(component)
+
+
+def _session_status(session_id: str, session: AllocationSession) -> Dict[str, Any]:
+    permutation, values = session.allocate()
+    return {
+        "id": session_id,
+        "batches": [len(batches) for batches in session.components],
+        "permutation": permutation,
+        "values": values,
+    }
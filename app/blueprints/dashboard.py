@@ -1,6 +1,3 @@
-import json
-import os
-
 import numpy as np
 import pandas as pd
 from flask import (
@@ -11,8 +8,9 @@ from flask import current_app as app
 from app.calculations.functionalmodel import get_batch_function
 from app.calculations.math import bins_center
 from app.calculations.qualitylossfunc import calculate_quality_loss
-from app.utils.requests import get_tolerances, get_fulfillment_axis_range
+from app.utils.config import get_config_context
 from app.utils.standards import get_standard_characteristic_values
+from app.utils.user_data import get_component_data
 
 bp = Blueprint("dashboard", __name__)
 
@@ -74,12 +72,11 @@ def supplier_dashboard(current_config):
 
 
 def get_quality_loss_discrete(current_config: str):
-    tolerances = get_tolerances(current_config)
-    bins = app.config[current_config]["Bins"]
-    boundaries = get_fulfillment_axis_range(tolerances, bins)
-    x_axes = [np.linspace(*bounds, bins) for bounds in boundaries]
-    tolerances = get_tolerances(current_config)
-    inefficiency_costs = app.config[current_config]["QualityLoss"]["InefficiencyCosts"]
+    context = get_config_context(current_config)
+    bins = context.bins
+    x_axes = [np.linspace(*bounds, bins) for bounds in context.axis_range(bins)]
+    tolerances = context.tolerances
+    inefficiency_costs = context.inefficiency_costs
     return [{"x": x_axis.tolist(),
              "y": calculate_quality_loss(bins_center(x_axis), 0, inefficiency_costs, tol).tolist()} for x_axis, tol
             in zip(x_axes, tolerances)]
@@ -87,12 +84,12 @@ def get_quality_loss_discrete(current_config: str):
 
 def get_standard_distributions(current_config: str, component_names):
     histograms = {}
-    bins = app.config[current_config]["Bins"]
-    tolerances = get_tolerances(current_config)
-    boundaries = get_fulfillment_axis_range(tolerances, bins)
+    context = get_config_context(current_config)
+    bins = context.bins
+    boundaries = context.axis_range(bins)
 
     def function_hist_for_characteristic_values(component: str, characteristic_values: pd.DataFrame):
-        distributions = get_batch_function(characteristic_values, current_config, True)
+        distributions = get_batch_function(characteristic_values, context, True)
         histograms[component] = []
         for test_point in range(len(distributions.columns)):
             histogram = np.histogram(distributions[distributions.columns[test_point]], bins=bins,
@@ -110,13 +107,9 @@ def get_standard_distributions(current_config: str, component_names):
         if component["name"] in component_names:
             continue
         # add saved component
-        file_name = os.path.join(app.instance_path, "saved_data", current_config, component["name"] + ".json")
-        if not os.path.isfile(file_name):
+        dataset = get_component_data(current_config, component["name"])
+        if dataset is None:
             continue
-        with open(file_name, "r") as f:
-            batches = json.load(f)
-
-        characteristic_values = pd.concat([pd.DataFrame(y) for x in batches for y in x], axis=0).reset_index()
-        function_hist_for_characteristic_values(component["name"], characteristic_values)
+        function_hist_for_characteristic_values(component["name"], dataset.frame())
 
     return histograms
@@ -1,8 +1,9 @@
-import pandas as pd
 from flask import Blueprint, request, jsonify
 
 from app.calculations.allocations import allocate
-from app.utils.requests import parse_qc_strategy
+from app.utils.config import get_config_context, get_workers
+from app.utils.ingestion import read_components, to_data_frame, count_values
+from app.utils.requests import parse_qc_strategy, parse_search_budget
 
 bp = Blueprint("allocate", __name__)
 
@@ -52,6 +53,10 @@ def get_allocation():
         "permutation": [0, 1, 2],
         "values": [0.35, -0.3, 0]
     }
+
+    For more than two components (only the metaheuristic and branch and bound algorithms), "permutation" contains
+    one allocation sequence per further component. The metaheuristic algorithms also return the best value so far
+    as "trace", the branch and bound algorithm returns the optimality gap as "optimality".
     """
     ####################################################################
     # READ INPUTS                                                      #
@@ -63,26 +68,34 @@ def get_allocation():
     qc = parse_qc_strategy(qc_strategy)
 
     bins = int(request.args.get("bins"))
-    batch_size = len(list(request.json[0]["batches"][0].values())[0])
-    current_config = request.args["c"]
+    request_components = read_components(1)
+    batch_size = count_values(request_components[0]["batches"][0])
+    current_config = get_config_context(request.args["c"])
 
     # parse distributions
     components = []
-    for component in request.json:
+    for component in request_components:
         batches = []
         for batch in component["batches"]:
-            batches.append(pd.DataFrame.from_dict(batch))
+            batches.append(to_data_frame(batch))
         components.append(batches)
 
     # todo: replace with struct
     settings_dict = {
         "config": current_config,
         "bins": bins,
+        "workers": get_workers(request.args.get("workers")),
+        "convolution": request.args.get("convolution"),
+        **parse_search_budget(request.args),
         "batch_size": batch_size,
-        "component_names": [component["name"] for component in request.json],
+        "component_names": [component["name"] for component in request_components],
     }
 
     # noinspection PyTypeChecker
     optimal_permutation, scalar = allocate(components, qc, method, algorithm, settings_dict)
 
-    return jsonify({"permutation": optimal_permutation, "values": scalar})
+    result = {"permutation": optimal_permutation, "values": scalar}
+    for key in ("trace", "optimality"):
+        if key in settings_dict:
+            result[key] = settings_dict[key]
+    return jsonify(result)
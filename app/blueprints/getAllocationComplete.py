@@ -1,8 +1,13 @@
+from typing import Any, Dict, List, Optional, Tuple
+
 import pandas as pd
 from flask import Blueprint, request, jsonify
 
 from app.calculations.allocations import allocate_complete
-from app.utils.requests import parse_qc_strategy
+from app.utils.config import get_config_context, get_workers
+from app.utils.ingestion import read_components, to_data_frame, count_values
+from app.utils.qc_strategy import QcStrategy
+from app.utils.requests import parse_qc_strategy, parse_search_budget
 
 bp = Blueprint("allocate_complete", __name__)
 
@@ -70,34 +75,53 @@ def get_allocation_complete():
         }
     ]
     """
-    ####################################################################
-    # READ INPUTS                                                      #
-    ####################################################################
+    return jsonify(calculate_allocation_complete(*parse_allocation_complete_request()))
+
+
+def parse_allocation_complete_request() -> Tuple[List[List[List[pd.DataFrame]]], Optional[QcStrategy], str, str,
+                                                 Dict[str, Any]]:
+    """
+    Reads the inputs of an allocation request (see get_allocation_complete).
 
+    Returns
+    -------
+    Tuple[List[List[List[pd.DataFrame]]], Optional[QcStrategy], str, str, Dict[str, Any]]
+        the arguments of calculate_allocation_complete.
+    """
     algorithm = request.args.get("algorithm", "brute_force")
     method = request.args.get("method", "mean")
     qc_strategy = request.args.get("qc_strategy", "")
     qc = parse_qc_strategy(qc_strategy)
 
     bins = int(request.args.get("bins"))
-    batch_size = len(list(request.json[0]["batches"][0][0].values())[0])
-    current_config = request.args["c"]
+    request_components = read_components(2)
+    batch_size = count_values(request_components[0]["batches"][0][0])
+    current_config = get_config_context(request.args["c"])
 
     # parse distributions
     components_batches = []
-    for component in request.json:
-        components_batches.append(
-            [[pd.DataFrame.from_dict(klt) for klt in batch] for batch in component["batches"]])
+    for component in request_components:
+        components_batches.append([[to_data_frame(klt) for klt in batch] for batch in component["batches"]])
 
     # todo: replace with struct
     settings_dict = {
         "config": current_config,
         "bins": bins,
+        "workers": get_workers(request.args.get("workers")),
+        "convolution": request.args.get("convolution"),
+        **parse_search_budget(request.args),
         "batch_size": batch_size,
-        "component_names": [component["name"] for component in request.json],
+        "component_names": [component["name"] for component in request_components],
     }
+    return components_batches, qc, method, algorithm, settings_dict
+
 
+def calculate_allocation_complete(components_batches: List[List[List[pd.DataFrame]]], qc: Optional[QcStrategy],
+                                  method: str, algorithm: str, settings_dict: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Calculates the response of an allocation request (see get_allocation_complete).
+    """
     # noinspection PyTypeChecker
     optimal_permutation = allocate_complete(components_batches, qc, method, algorithm, settings_dict)
 
-    return jsonify([{"batch": batch, "klts": klts} for batch, klts in optimal_permutation])
+    return [{"batch": batch, "klts": klts} for batch, klts in optimal_permutation]
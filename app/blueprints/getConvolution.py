@@ -1,10 +1,11 @@
-import pandas as pd
 from flask import (
     Blueprint, request, jsonify
 )
 
 from app.calculations.allocation.valuation_methods import supported_valuation_methods
 from app.calculations.convolutions import convolve_with_boundary, qc_convolution
+from app.utils.config import get_config_context
+from app.utils.ingestion import read_components, to_data_frame
 from app.utils.requests import parse_distribution, parse_qc_strategy
 
 bp = Blueprint("convolute", __name__)
@@ -16,6 +17,9 @@ def get_convolution():
     Calculates the convolution of two or more distributions.
     All distributions must be centered around zero.
 
+    The optional request argument method=fft convolves all distributions at once using the FFT
+    instead of pairwise (method=direct, default).
+
     Input
     -----
     JSON array of distributions.
@@ -52,7 +56,7 @@ def get_convolution():
     # parse distributions from request
     distributions = [parse_distribution(dic) for dic in distributions]
     # convolution of all distributions
-    y, x = convolve_with_boundary(distributions, boundary, bins)
+    y, x = convolve_with_boundary(distributions, boundary, bins, request.args.get("method", "direct"))
 
     return jsonify({"x": x.tolist(), "y": y.tolist()})
 
@@ -103,16 +107,15 @@ def get_simulate_assembly():
         ...
     ]
     """
-    component_names = [component["name"] for component in request.json]
-    components = request.json
-    for componentIdx in range(len(components)):
-        components[componentIdx] = pd.DataFrame.from_dict(components[componentIdx]["characteristics"])
+    request_components = read_components(0)
+    component_names = [component["name"] for component in request_components]
+    components = [to_data_frame(component["characteristics"]) for component in request_components]
 
     qc_strategy = request.args.get("qc_strategy", "")
     qc = parse_qc_strategy(qc_strategy)
     bins = int(request.args.get("bins"))
 
-    current_config = request.args["c"]
+    current_config = get_config_context(request.args["c"])
 
     # noinspection PyTypeChecker
     convolutions = qc_convolution(current_config, components, qc, bins, None)
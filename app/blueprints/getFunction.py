@@ -4,6 +4,7 @@ from flask import (
 )
 
 from app.calculations import functionalmodel
+from app.utils.config import get_config_context
 
 bp = Blueprint("functionalmodel", __name__)
 
@@ -34,7 +35,7 @@ def get_function():
     """
 
     # config values
-    current_config = request.args["c"]
+    current_config = get_config_context(request.args["c"])
 
     # create a data frame from the contents of the json request
     characteristic_values = pd.DataFrame.from_dict(request.json)
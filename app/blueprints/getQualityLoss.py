@@ -1,6 +1,4 @@
-import json
-import os
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
@@ -12,12 +10,15 @@ from werkzeug.exceptions import BadRequest
 
 from app.calculations.allocations import allocate_complete
 from app.calculations.convolutions import qc_convolution
+from app.calculations.functionalmodel import FulfillmentCache
 from app.calculations.qualitylossfunc import calculate_quality_loss_discrete
+from app.utils.config import ConfigContext, get_config_context, get_workers
+from app.utils.ingestion import read_components, to_data_frame, count_values
 from app.utils.qc_strategy import QcStrategy
-from app.utils.requests import get_tolerances, parse_qc_strategy
-from app.utils.standards import get_standard_characteristic_values
+from app.utils.requests import parse_qc_strategy
+from app.utils.standards import get_standard_dataset, sample_standard_klts
 from app.utils.types import Histogram
-from app.utils.user_data import get_user_data
+from app.utils.user_data import get_user_data, get_component_data
 
 bp = Blueprint("qualityloss", __name__)
 
@@ -74,41 +75,48 @@ def get_quality_loss():
         ...
     ]
     """
+    return jsonify(calculate_quality_losses(*parse_quality_loss_request()))
+
+
+def parse_quality_loss_request() -> Tuple[List[List[List[pd.DataFrame]]], Optional[QcStrategy], Dict[str, Any]]:
+    """
+    Reads the inputs of a quality loss request (see get_quality_loss),
+    including the saved and standard components.
+
+    Returns
+    -------
+    Tuple[List[List[List[pd.DataFrame]]], Optional[QcStrategy], Dict[str, Any]]
+        the arguments of calculate_quality_losses.
+    """
     bins = int(request.args.get("bins"))
     current_config = request.args["c"]
+    context = get_config_context(current_config)
     if "qc_strategy" in request.args:
         qc_strategy = request.args.get("qc_strategy", "")
     else:
         qc_strategy = get_user_data(current_config)["qcStrategy"]
     qc = parse_qc_strategy(qc_strategy)
 
-    tolerances = get_tolerances(current_config)
-    inefficiency_costs = app.config[current_config]["QualityLoss"]["InefficiencyCosts"]
-    target_means = [app.config[current_config]["MeanValues"][test_point] for test_point in
-                    app.config[current_config]["TestPoints"]]
-    weights = app.config[current_config]["TestPointWeights"]
-
-    components = request.json
+    components = read_components(2)
+    request_component_names = [component["name"] for component in components]
     for component in app.config[current_config]["Components"]:
-        if component["name"] not in [c["name"] for c in request.json]:
+        if component["name"] not in request_component_names:
             # add saved component
-            file_name = os.path.join(app.instance_path, "saved_data", current_config, component["name"] + ".json")
-            if not os.path.isfile(file_name):
+            dataset = get_component_data(current_config, component["name"])
+            if dataset is None:
                 raise BadRequest("missing component data " + component["name"])
-            with open(file_name, "r") as f:
-                batches = json.load(f)
             components.append({
                 "name": component["name"],
-                "batches": batches
+                "batches": dataset.klts()
             })
 
     # parse distributions from request
-    convolution_histograms = []
     settings_dict = {
-        "config": current_config,
+        "config": context,
         "bins": bins,
+        "workers": get_workers(request.args.get("workers")),
         "component_names": [component["name"] for component in components],
-        "batch_size": next((len(list(component["batches"][0][0].values())[0]) for component in components if
+        "batch_size": next((count_values(component["batches"][0][0]) for component in components if
                             isinstance(component["batches"], list))),
         "klt_number": next(
             (len(component["batches"][0]) for component in components if isinstance(component["batches"], list))),
@@ -124,16 +132,11 @@ def get_quality_loss():
             # this uses the .csv files in the root directory and samples the correct amount of batches
             # alternatively to sampling, the file could be used "as is" like the following:
             # components_batches.append(current_config, get_standard_characteristic_values_batches(component["name"]))
-            batches = []
-            for batch in range(settings_dict["batch_number"]):
-                klts = []
-                for klt in range(settings_dict["klt_number"]):
-                    seed = (batch + 1) * settings_dict["klt_number"] + (klt + 1)
-                    klts.append(
-                        get_standard_characteristic_values(current_config, component["name"],
-                                                           settings_dict["batch_size"], seed))
-                batches.append(klts)
-            components_batches.append(batches)
+            values = sample_standard_klts(current_config, component["name"], settings_dict["batch_number"],
+                                          settings_dict["klt_number"], settings_dict["batch_size"])
+            columns = get_standard_dataset(current_config, component["name"]).columns
+            components_batches.append(
+                [[pd.DataFrame(klt, columns=columns, copy=False) for klt in batch] for batch in values])
         elif component["batches"] == "optimal":
             # calculate optimal batch
             batches = []
@@ -146,14 +149,33 @@ def get_quality_loss():
                             other_values = other_component["batches"][batch][klt]
                             for key, values in other_values.items():
                                 tol_center = app.config[current_config]["MeanValues"][key]
-                                characteristic_values[key] = [v + (tol_center - v) * 2 for v in values]
+                                values = np.asarray(values, dtype=np.float64)
+                                characteristic_values[key] = values + (tol_center - values) * 2
                     klts.append(pd.DataFrame(characteristic_values))
                 batches.append(klts)
             components_batches.append(batches)
         else:
             components_batches.append(
-                [[pd.DataFrame.from_dict(klt) for klt in batch] for batch in component["batches"]])
+                [[to_data_frame(klt) for klt in batch] for batch in component["batches"]])
+
+    return components_batches, qc, settings_dict
+
 
+def calculate_quality_losses(components_batches: List[List[List[pd.DataFrame]]], qc: Optional[QcStrategy],
+                             settings_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Calculates the response of a quality loss request (see get_quality_loss).
+    """
+    context = settings_dict["config"]
+    bins = settings_dict["bins"]
+    tolerances = context.tolerances
+    inefficiency_costs = context.inefficiency_costs
+    target_means = context.test_point_means
+    weights = context.weights.tolist()
+
+    convolution_histograms = []
+    # the fulfillments of the klts are calculated once, for the allocation as well as for the convolution
+    cache = settings_dict.setdefault("fulfillments", FulfillmentCache())
     # noinspection PyTypeChecker
     optimal_permutation = allocate_complete(components_batches, qc, "cpk", "brute_force", settings_dict)
     for base_batch_idx, (comparison_batch_idx, comparison_klts_idx) in zip(range(len(optimal_permutation)),
@@ -162,7 +184,7 @@ def get_quality_loss():
         comparison_klts = [components_batches[1][comparison_batch_idx][klt_idx] for klt_idx in comparison_klts_idx]
         # noinspection PyTypeChecker
         convolution_histograms.extend(
-            batch_convolution(current_config, [base_klts, comparison_klts], qc, bins, weights))
+            batch_convolution(context, [base_klts, comparison_klts], qc, bins, weights, cache))
 
     convolutions = merge_histograms(convolution_histograms)
 
@@ -177,14 +199,15 @@ def get_quality_loss():
         "losses": losses,
         "convolutions": [{"x": x.tolist(), "y": (y * n_components).tolist()} for (y, x) in convolutions]
     }
-    if np.isclose(tolerances, get_tolerances(current_config)).all():
+    if np.isclose(tolerances, context.tolerances).all():
         result["loss"] = np.average(losses[:-1], weights=weights)
 
-    return jsonify(result)
+    return result
 
 
-def batch_convolution(current_config: str, components: List[List[pd.DataFrame]], qc: Optional[QcStrategy], bins: int,
-                      weights: Optional[List[float]]) -> List[List[Histogram]]:
+def batch_convolution(current_config: ConfigContext, components: List[List[pd.DataFrame]], qc: Optional[QcStrategy],
+                      bins: int, weights: Optional[List[float]],
+                      cache: Optional[FulfillmentCache] = None) -> List[List[Histogram]]:
     """
     For a list of batches or klts, calculates the convolution of multiple components
     for a given quality strategy.
@@ -192,7 +215,7 @@ def batch_convolution(current_config: str, components: List[List[pd.DataFrame]],
     Parameters
     ----------
     current_config
-        name of the configuration that should be used for the functional model.
+        context of the configuration that should be used for the functional model.
     components
         list of components where every entry contains a list of batches or klts.
         Each batch or klt is a data frame of characteristic values.
@@ -202,6 +225,8 @@ def batch_convolution(current_config: str, components: List[List[pd.DataFrame]],
         number of bins for the resulting histogram.
     weights
         list of weights if the weighted test point should be calculated as well.
+    cache
+        fulfillments and histograms of the batches or klts, see qc_convolution.
 
     Returns
     -------
@@ -211,7 +236,8 @@ def batch_convolution(current_config: str, components: List[List[pd.DataFrame]],
     result = []
     for batch_idx in range(len(components[0])):
         result.append(
-            qc_convolution(current_config, [component[batch_idx] for component in components], qc, bins, weights))
+            qc_convolution(current_config, [component[batch_idx] for component in components], qc, bins, weights,
+                           cache))
     return result
 
 
@@ -0,0 +1,85 @@
+from flask import Blueprint, jsonify
+from werkzeug.exceptions import Conflict
+
+from app.blueprints.getAllocationComplete import parse_allocation_complete_request, calculate_allocation_complete
+from app.blueprints.getQualityLoss import parse_quality_loss_request, calculate_quality_losses
+from app.utils.jobs import get_job_manager
+
+bp = Blueprint("jobs", __name__)
+
+
+@bp.route("/jobs/getAllocationComplete", methods=["POST"])
+def submit_allocation_complete():
+    """
+    Submits an allocation as background job.
+    Takes the same parameters and body as /getAllocationComplete.
+
+    Output
+    ------
+    JSON dictionary with the job status (see get_job), HTTP status 202.
+    """
+    *args, settings_dict = parse_allocation_complete_request()
+    job = get_job_manager().submit(calculate_allocation_complete, *args, settings_dict=settings_dict)
+    return jsonify(job.to_dict()), 202
+
+
+@bp.route("/jobs/getQualityLoss", methods=["POST"])
+def submit_quality_loss():
+    """
+    Submits a quality loss calculation as background job.
+    Takes the same parameters and body as /getQualityLoss.
+
+    Output
+    ------
+    JSON dictionary with the job status (see get_job), HTTP status 202.
+    """
+    *args, settings_dict = parse_quality_loss_request()
+    job = get_job_manager().submit(calculate_quality_losses, *args, settings_dict=settings_dict)
+    return jsonify(job.to_dict()), 202
+
+
+@bp.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """
+    Returns the status and progress of a job.
+
+    Output
+    ------
+    JSON dictionary.
+
+    {
+        "id": <job id>,
+        "status": <pending|running|finished|failed|cancelled>,
+        # number of evaluated and (so far) known steps of the calculation
+        "progress": {
+            "done": <done>,
+            "total": <total>
+        },
+        # only if the job failed
+        "error": <error message>
+    }
+    """
+    return jsonify(get_job_manager().get(job_id).to_dict())
+
+
+@bp.route("/jobs/<job_id>/result", methods=["GET"])
+def get_job_result(job_id):
+    """
+    Returns the result of a finished job, which is the same as the response of the synchronous endpoint.
+    """
+    job = get_job_manager().get(job_id)
+    if job.status != "finished":
+        raise Conflict(f"job {job_id} is {job.status}")
+    return jsonify(job.result)
+
+
+@bp.route("/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    """
+    Cancels a job and discards it, including its result.
+
+    Output
+    ------
+    JSON dictionary with the last job status (see get_job).
+    """
+    return jsonify(get_job_manager().cancel(job_id).to_dict())
@@ -1,13 +1,9 @@
-import json
-import os.path
-
 from flask import (
     Blueprint, request
 )
-from flask import current_app as app
 from werkzeug.exceptions import BadRequest
 
-from app.utils.user_data import get_user_data, save_user_data
+from app.utils.user_data import get_user_data, save_user_data, save_component_data
 
 bp = Blueprint("customerdata", __name__)
 
@@ -31,12 +27,7 @@ def get_function(data_type):
 
     if data_type == "componentData":
         for component, data in data.items():
-            dir_name = os.path.join(app.instance_path, "saved_data", current_config)
-            if not os.path.exists(dir_name):
-                os.makedirs(dir_name)
-            file_name = os.path.join(dir_name, component + ".json")
-            with open(file_name, "w") as f:
-                json.dump(data, f)
+            save_component_data(current_config, component, data)
     elif data_type == "qcStrategy":
         settings = get_user_data(current_config)
         settings["qcStrategy"] = data
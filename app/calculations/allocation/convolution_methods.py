@@ -1,43 +1,69 @@
 ##################################################################
 # METHODS HOW TWO DISTRIBUTIONS ARE CONVOLUTED                   #
 ##################################################################
-from typing import List, Dict, Any, Callable, Optional
+from typing import List, Dict, Any, Callable, Optional, Union, Sequence
 
 import numpy as np
 import pandas as pd
+from werkzeug.exceptions import BadRequest
 
 from app.calculations.convolutions import convolve_with_boundary
-from app.calculations.functionalmodel import get_batch_function
-from app.calculations.simulation import simulate_assembly
+from app.calculations.functionalmodel import get_cached_batch_function, get_cached_histograms
+from app.calculations.math import AnyDistribution
+from app.calculations.simulation import simulate_assembly_fulfillments
 from app.utils.qc_strategy import QcStrategy
-from app.utils.requests import parse_array_as_hist, get_fulfillment_axis_range, get_tolerances
 from app.utils.types import Histogram
 
 
 def default_convolution(batches_a: pd.DataFrame, batches_b: pd.DataFrame,
                         settings_dict: Dict[str, Any]) -> List[Histogram]:
+    return default_convolution_multi([batches_a, batches_b], settings_dict)
+
+
+def default_convolution_multi(batches: Sequence[pd.DataFrame], settings_dict: Dict[str, Any]) -> List[Histogram]:
+    """
+    Convolutes one batch of every component (conventional assembly of two or more components).
+    The histograms of every batch are only calculated once, if the settings contain a fulfillment cache.
+    """
     bins = settings_dict["bins"]
-    tolerances = get_tolerances(settings_dict["config"])
-    axis_range = get_fulfillment_axis_range(tolerances, bins)
+    axis_range = settings_dict["config"].axis_range(bins)
+
+    distributions = [get_cached_histograms(batch, settings_dict) for batch in batches]
+    return [convolve_with_boundary(list(test_point_distributions), boundary, bins) for
+            *test_point_distributions, boundary in zip(*distributions, axis_range)]
+
+
+def moments_convolution(batches_a: pd.DataFrame, batches_b: pd.DataFrame,
+                        settings_dict: Dict[str, Any]) -> List[AnyDistribution]:
+    """
+    Convolutes two batches only by their mean and standard deviation (of every test point),
+    instead of their histograms. The means and variances of independent components add up exactly,
+    so there is no binning error, but the valuation can only use the mean and standard deviation.
+    """
+    return moments_convolution_multi([batches_a, batches_b], settings_dict)
 
-    functions_a = get_batch_function(batches_a, settings_dict["config"])
-    functions_b = get_batch_function(batches_b, settings_dict["config"])
-    distributions_a = [parse_array_as_hist(functions_a[functions_a.columns[test_point]], bins, axis_range[test_point])
-                       for test_point in range(len(functions_a.columns))]
-    distributions_b = [parse_array_as_hist(functions_b[functions_b.columns[test_point]], bins, axis_range[test_point])
-                       for test_point in range(len(functions_b.columns))]
-    return [convolve_with_boundary([a, b], boundary, bins) for a, b, boundary in
-            zip(distributions_a, distributions_b, axis_range)]
+
+def moments_convolution_multi(batches: Sequence[pd.DataFrame],
+                              settings_dict: Dict[str, Any]) -> List[AnyDistribution]:
+    """
+    Convolutes one batch of every component by their mean and standard deviation (see moments_convolution).
+    """
+    functions = [get_cached_batch_function(batch, settings_dict).to_numpy() for batch in batches]
+    return [sum((AnyDistribution.from_ndarray(values) for values in test_point_values[1:]),
+                AnyDistribution.from_ndarray(test_point_values[0]))
+            for test_point_values in zip(*(function.T for function in functions))]
 
 
 def simulation_convolution(qc_strategy: QcStrategy, batches_a: pd.DataFrame, batches_b: pd.DataFrame,
                            settings_dict: Dict[str, Any]) -> List[Histogram]:
-    result, _ = simulate_assembly(qc_strategy, batches_a, batches_b, settings_dict["config"])
+    assert len(batches_a) == len(batches_b), f"{len(batches_a)} != {len(batches_b)}"
+    result, _ = simulate_assembly_fulfillments(qc_strategy, get_cached_batch_function(batches_a, settings_dict).to_numpy(),
+                                               get_cached_batch_function(batches_b, settings_dict).to_numpy(),
+                                               settings_dict["config"])
     distributions = np.transpose(np.array(result), (1, 0))
 
     bins = settings_dict["bins"]
-    tolerances = get_tolerances(settings_dict["config"])
-    axis_range = get_fulfillment_axis_range(tolerances, bins)
+    axis_range = settings_dict["config"].axis_range(bins)
     return [np.histogram(distribution, bins, boundary, density=True) for distribution, boundary in
             zip(distributions, axis_range)]
 
@@ -67,13 +93,56 @@ def simulate_ascending_descending_grouped(batches_a: pd.DataFrame, batches_b: pd
     return simulation_convolution(QcStrategy.ascending_descending_grouped, batches_a, batches_b, settings_dict)
 
 
-ConvolutionMethod = Callable[[pd.DataFrame, pd.DataFrame, Dict[str, Any]], List[Histogram]]
+ConvolutionMethod = Callable[[pd.DataFrame, pd.DataFrame, Dict[str, Any]], List[Union[Histogram, AnyDistribution]]]
 
-supported_convolution_methods: Dict[Optional[QcStrategy], ConvolutionMethod] = {
+supported_convolution_methods: Dict[Union[None, QcStrategy, str], ConvolutionMethod] = {
     None: default_convolution,
     QcStrategy.selective_assembly: simulate_selective,
     QcStrategy.individual_assembly: simulate_individual,
     QcStrategy.individual_assembly_greedy: simulate_individual_greedy,
     QcStrategy.ascending_descending: simulate_ascending_descending,
     QcStrategy.ascending_descending_grouped: simulate_ascending_descending_grouped,
+    # opt-in, only for the mean, mean_std and cpk valuation of conventional assembly (see get_convolution_method)
+    "moments": moments_convolution,
+}
+
+
+def get_convolution_method(qc_strategy: Optional[QcStrategy], settings_dict: Dict[str, Any]) -> ConvolutionMethod:
+    """
+    Selects the convolution method of a quality control strategy.
+
+    Parameters
+    ----------
+    qc_strategy
+        quality control strategy.
+    settings_dict
+        Optional settings. "convolution" can select an alternative convolution method ("moments")
+        for conventional assembly.
+
+    Returns
+    -------
+    ConvolutionMethod
+        the convolution method.
+    """
+    convolution = settings_dict.get("convolution")
+    if convolution is not None:
+        if qc_strategy is not None:
+            raise BadRequest("convolution " + str(convolution) + " only supports conventional assembly")
+        if not isinstance(convolution, str) or convolution not in supported_convolution_methods:
+            raise BadRequest("Unknown convolution " + str(convolution))
+        return supported_convolution_methods[convolution]
+    if qc_strategy not in supported_convolution_methods:
+        raise BadRequest(
+            "Only " + str(supported_convolution_methods.keys) + " convolution methods supported"
+        )
+    return supported_convolution_methods[qc_strategy]
+
+
+# convolutes one batch of every component, if a convolution method supports more than two components
+MultiConvolutionMethod = Callable[[Sequence[pd.DataFrame], Dict[str, Any]], List[Union[Histogram, AnyDistribution]]]
+
+# the quality control strategies assemble pairs of components, so only conventional assembly is supported
+multi_convolution_methods: Dict[ConvolutionMethod, MultiConvolutionMethod] = {
+    default_convolution: default_convolution_multi,
+    moments_convolution: moments_convolution_multi,
 }
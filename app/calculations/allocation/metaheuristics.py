@@ -0,0 +1,351 @@
+####################################################################
+# METAHEURISTICS FOR THE ALLOCATION OF TWO OR MORE COMPONENTS      #
+####################################################################
+import math
+import time
+from typing import List, Tuple, Callable, Optional, Dict, Any
+
+import numpy as np
+
+# default budget of the search, see SearchBudget
+DEFAULT_ITERATIONS = 2000
+DEFAULT_TIME_LIMIT = 30.
+DEFAULT_SEED = 42
+
+# the temperature of the simulated annealing cools down to this fraction of the initial temperature
+ANNEALING_FINAL_TEMPERATURE = 1e-3
+# parameters of the genetic algorithm
+POPULATION_SIZE = 20
+ELITE_SIZE = 2
+TOURNAMENT_SIZE = 3
+MUTATION_RATE = 0.2
+# number of random swaps that perturb a local optimum of the 2-opt search
+PERTURBATION_SWAPS = 3
+
+# scalar value of a tuple of batches (one batch index per component), i.e. of an assembled module
+TupleCost = Callable[[Tuple[int, ...]], float]
+
+
+class SearchBudget:
+    """
+    Iteration and time budget of a search, which also records the trace of the best value so far.
+
+    An iteration is a single evaluated candidate, i.e. a swap (simulated annealing, 2-opt) or an offspring (genetic).
+    If a progress is given (see app.utils.jobs.Progress), every iteration is reported to it.
+    """
+
+    def __init__(self, iterations: int = DEFAULT_ITERATIONS, time_limit: float = DEFAULT_TIME_LIMIT,
+                 progress: Optional[Any] = None):
+        self.iterations = iterations
+        self.time_limit = time_limit
+        self.progress = progress
+        self.iteration = 0
+        self.best = math.inf
+        # best value so far, whenever it improves
+        self.trace: List[Dict[str, float]] = []
+        self._start = time.perf_counter()
+        if progress is not None:
+            progress.add_total(iterations)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    def exhausted(self) -> bool:
+        return self.iteration >= self.iterations or self.elapsed() >= self.time_limit
+
+    def fraction(self) -> float:
+        """
+        Returns
+        -------
+        float
+            used fraction of the budget (iterations or time, whichever is larger), between 0 and 1.
+        """
+        return min(1., max(self.iteration / max(1, self.iterations), self.elapsed() / self.time_limit))
+
+    def step(self):
+        self.iteration += 1
+        if self.progress is not None:
+            self.progress.update()
+
+    def record(self, value: float):
+        """
+        Records the value of a candidate in the trace, if it improves the best value so far.
+        """
+        if value < self.best:
+            self.best = value
+            self.trace.append({"iteration": self.iteration, "time": self.elapsed(), "value": value})
+
+    def finish(self):
+        # the search may stop early, e.g. by its time limit
+        if self.progress is not None and self.iteration < self.iterations:
+            self.progress.update(self.iterations - self.iteration)
+
+
+class MultiAssignment:
+    """
+    Allocation of the batches of several components, with the scalar value of every allocated tuple.
+
+    The i-th tuple consists of the i-th batch of the first component and the batch permutations[k][i]
+    of every further component k. Like in the other optimization algorithms, only the first n batches
+    of every component are allocated, where n is the smallest number of batches.
+    Swapping two batches of a component only re-evaluates the (at most two) affected tuples.
+    """
+
+    def __init__(self, tuple_cost: TupleCost, permutations: List[np.ndarray], n: int,
+                 costs: Optional[np.ndarray] = None):
+        self.tuple_cost = tuple_cost
+        # for every further component (k = 1, ..., K - 1), a permutation of all its batches
+        self.permutations = permutations
+        self.n = n
+        self.costs = costs if costs is not None else np.array([tuple_cost(self.tuple(i)) for i in range(n)])
+
+    @staticmethod
+    def initial(tuple_cost: TupleCost, sizes: List[int],
+                rng: Optional[np.random.Generator] = None) -> "MultiAssignment":
+        """
+        Creates the identity allocation, or a random allocation if a random generator is given.
+
+        Parameters
+        ----------
+        tuple_cost
+            scalar value of a tuple.
+        sizes
+            number of batches of every component.
+        rng
+            random generator.
+        """
+        permutations = [np.arange(size) if rng is None else rng.permutation(size) for size in sizes[1:]]
+        return MultiAssignment(tuple_cost, permutations, min(sizes))
+
+    def tuple(self, i: int) -> Tuple[int, ...]:
+        return (i,) + tuple(int(permutation[i]) for permutation in self.permutations)
+
+    def total(self) -> float:
+        return float(self.costs.sum())
+
+    def copy(self) -> "MultiAssignment":
+        return MultiAssignment(self.tuple_cost, [permutation.copy() for permutation in self.permutations], self.n,
+                               self.costs.copy())
+
+    def swap_delta(self, component: int, i: int, j: int) -> Tuple[float, Dict[int, float]]:
+        """
+        Evaluates swapping the i-th and j-th batch of a component (without applying it).
+
+        Parameters
+        ----------
+        component
+            index of the further component (0 for the second component).
+        i
+            position of the first batch, must be allocated (i < n).
+        j
+            position of the second batch, which may be unallocated (j >= n).
+
+        Returns
+        -------
+        float
+            change of the total value.
+        Dict[int, float]
+            the new values of the affected tuples.
+        """
+        permutation = self.permutations[component]
+        permutation[i], permutation[j] = permutation[j], permutation[i]
+        try:
+            affected = {position: self.tuple_cost(self.tuple(position)) for position in (i, j) if position < self.n}
+        finally:
+            permutation[i], permutation[j] = permutation[j], permutation[i]
+        return sum(value - self.costs[position] for position, value in affected.items()), affected
+
+    def apply_swap(self, component: int, i: int, j: int, affected: Dict[int, float]):
+        permutation = self.permutations[component]
+        permutation[i], permutation[j] = permutation[j], permutation[i]
+        for position, value in affected.items():
+            self.costs[position] = value
+
+    def random_swap(self, rng: np.random.Generator) -> Optional[Tuple[int, int, int]]:
+        """
+        Returns
+        -------
+        Optional[Tuple[int, int, int]]
+            a random component, allocated position i and different position j, or None if there is no swap.
+        """
+        components = [k for k, permutation in enumerate(self.permutations) if len(permutation) > 1]
+        if not components or self.n == 0:
+            return None
+        component = components[rng.integers(len(components))]
+        i = int(rng.integers(self.n))
+        j = int(rng.integers(len(self.permutations[component]) - 1))
+        return component, i, j + (j >= i)
+
+
+def simulated_annealing(assignment: MultiAssignment, budget: SearchBudget,
+                        rng: np.random.Generator) -> MultiAssignment:
+    """
+    Improves the allocation by random swaps, which are also accepted if they are worse with a probability that
+    decreases with the temperature. The temperature cools down geometrically over the budget.
+
+    Parameters
+    ----------
+    assignment
+        initial allocation, which is modified.
+    budget
+        budget of the search.
+    rng
+        random generator.
+
+    Returns
+    -------
+    MultiAssignment
+        the best allocation.
+    """
+    best = assignment.copy()
+    budget.record(best.total())
+    # the initial temperature accepts a worsening by the typical spread of the tuple values
+    initial_temperature = float(assignment.costs.std()) if assignment.n > 1 else 0.
+    if initial_temperature == 0:
+        initial_temperature = max(1e-9, abs(assignment.total()) / max(1, assignment.n))
+
+    total = assignment.total()
+    while not budget.exhausted():
+        move = assignment.random_swap(rng)
+        if move is None:
+            break
+        temperature = initial_temperature * ANNEALING_FINAL_TEMPERATURE ** budget.fraction()
+        delta, affected = assignment.swap_delta(*move)
+        budget.step()
+        if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+            assignment.apply_swap(*move, affected)
+            total += delta
+            if total < budget.best:
+                # recompute the sum, so that rounding errors of the deltas do not accumulate
+                total = assignment.total()
+                if total < best.total():
+                    best = assignment.copy()
+                budget.record(total)
+    budget.finish()
+    return best
+
+
+def genetic_algorithm(assignment: MultiAssignment, budget: SearchBudget,
+                      rng: np.random.Generator) -> MultiAssignment:
+    """
+    Evolves a population of allocations by tournament selection, order crossover of the batch permutations
+    and random swaps as mutation. The best allocations are kept in every generation (elitism).
+
+    Parameters
+    ----------
+    assignment
+        initial allocation, which is part of the initial population.
+    budget
+        budget of the search.
+    rng
+        random generator.
+
+    Returns
+    -------
+    MultiAssignment
+        the best allocation.
+    """
+    sizes = [assignment.n] + [len(permutation) for permutation in assignment.permutations]
+    population = [assignment] + [MultiAssignment.initial(assignment.tuple_cost, sizes, rng)
+                                 for _ in range(POPULATION_SIZE - 1)]
+    for individual in population:
+        budget.record(individual.total())
+
+    while not budget.exhausted():
+        population.sort(key=MultiAssignment.total)
+        offspring = [individual for individual in population[:ELITE_SIZE]]
+        while len(offspring) < POPULATION_SIZE and not budget.exhausted():
+            parent_a = _tournament(population, rng)
+            parent_b = _tournament(population, rng)
+            permutations = [_order_crossover(a, b, rng) for a, b in zip(parent_a.permutations, parent_b.permutations)]
+            child = MultiAssignment(assignment.tuple_cost, permutations, assignment.n)
+            if rng.random() < MUTATION_RATE:
+                move = child.random_swap(rng)
+                if move is not None:
+                    _, affected = child.swap_delta(*move)
+                    child.apply_swap(*move, affected)
+            budget.step()
+            budget.record(child.total())
+            offspring.append(child)
+        population = offspring
+    budget.finish()
+    return min(population, key=MultiAssignment.total)
+
+
+def iterated_two_opt(assignment: MultiAssignment, budget: SearchBudget,
+                     rng: np.random.Generator) -> MultiAssignment:
+    """
+    Applies every improving swap of two batches until no swap improves the allocation (2-opt local optimum),
+    then perturbs the best allocation by a few random swaps and repeats.
+
+    Parameters
+    ----------
+    assignment
+        initial allocation, which is modified.
+    budget
+        budget of the search.
+    rng
+        random generator.
+
+    Returns
+    -------
+    MultiAssignment
+        the best allocation.
+    """
+    best = assignment.copy()
+    budget.record(best.total())
+    while not budget.exhausted():
+        improved = True
+        while improved and not budget.exhausted():
+            improved = False
+            for component, permutation in enumerate(assignment.permutations):
+                for i in range(assignment.n):
+                    for j in range(i + 1, len(permutation)):
+                        if budget.exhausted():
+                            break
+                        delta, affected = assignment.swap_delta(component, i, j)
+                        budget.step()
+                        if delta < 0:
+                            assignment.apply_swap(component, i, j, affected)
+                            improved = True
+                            budget.record(assignment.total())
+        if assignment.total() < best.total():
+            best = assignment.copy()
+
+        # perturb the best local optimum
+        assignment = best.copy()
+        for _ in range(PERTURBATION_SWAPS):
+            move = assignment.random_swap(rng)
+            if move is None:
+                budget.finish()
+                return best
+            _, affected = assignment.swap_delta(*move)
+            assignment.apply_swap(*move, affected)
+    budget.finish()
+    return best
+
+
+def _tournament(population: List[MultiAssignment], rng: np.random.Generator) -> MultiAssignment:
+    contestants = rng.choice(len(population), size=min(TOURNAMENT_SIZE, len(population)), replace=False)
+    return min((population[contestant] for contestant in contestants), key=MultiAssignment.total)
+
+
+def _order_crossover(parent_a: np.ndarray, parent_b: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    Order crossover (OX) of two permutations: a random slice is copied from the first parent,
+    the remaining positions are filled with the missing values in the order of the second parent.
+    """
+    size = len(parent_a)
+    if size < 2:
+        return parent_a.copy()
+    start, end = np.sort(rng.choice(size + 1, size=2, replace=False))
+    child = np.empty_like(parent_a)
+    child[start:end] = parent_a[start:end]
+    remaining = parent_b[~np.isin(parent_b, parent_a[start:end])]
+    child[:start] = remaining[:start]
+    child[end:] = remaining[start:]
+    return child
+
+
+# search for the given initial allocation, budget and random generator
+Metaheuristic = Callable[[MultiAssignment, SearchBudget, np.random.Generator], MultiAssignment]
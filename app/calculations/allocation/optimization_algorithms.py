@@ -1,15 +1,26 @@
 ####################################################################
 # OPTIMIZATION ALGORITHMS                                          #
 ####################################################################
-from typing import List, Any, Dict, Tuple, Callable
+from typing import List, Any, Dict, Tuple, Callable, Union
 
 import numpy as np
 import pandas as pd
-from flask import current_app as app
+from tqdm import tqdm
 
-from app.calculations.allocation.convolution_methods import ConvolutionMethod
-from app.calculations.allocation.valuation_methods import ValuationMethod
-from app.calculations.optimization import brute_force
+from werkzeug.exceptions import BadRequest
+
+from app.calculations.allocation.convolution_methods import ConvolutionMethod, multi_convolution_methods
+from app.calculations.allocation.metaheuristics import SearchBudget, MultiAssignment, Metaheuristic, \
+    simulated_annealing, genetic_algorithm, iterated_two_opt, DEFAULT_ITERATIONS, DEFAULT_TIME_LIMIT, DEFAULT_SEED
+from app.calculations.allocation.parallel import evaluate_pairs
+from app.calculations.allocation.valuation_methods import ValuationMethod, batched_valuation_methods, \
+    stack_histograms
+from app.calculations.math import AnyDistribution
+from app.calculations.optimization import brute_force, linear_assignment, branch_and_bound, DEFAULT_NODE_BUDGET
+from app.utils.types import Histogram
+
+# maximum size of the stacked histograms that are valuated at once, see PairwiseEvaluator.cost_matrix
+VALUATION_MEMORY_BUDGET = 64 * 2 ** 20
 
 
 def evaluate_batches(batches_a: pd.DataFrame, batches_b: pd.DataFrame, convolution_method: ConvolutionMethod,
@@ -38,13 +49,205 @@ def evaluate_batches(batches_a: pd.DataFrame, batches_b: pd.DataFrame, convoluti
     """
     # Simulate assembly of all components + calculation of functional fulfillment for each test point.
     distributions = convolution_method(batches_a, batches_b, settings_dict)
+    return valuate_distributions(distributions, valuation_method, settings_dict)
+
+
+def valuate_distributions(distributions: List[Union[Histogram, AnyDistribution]], valuation_method: ValuationMethod,
+                          settings_dict: Dict[str, Any]) -> float:
+    """
+    Converts the convoluted distributions of all test points into a single scalar value.
+
+    Parameters
+    ----------
+    distributions
+        for every test point, the convoluted distribution.
+    valuation_method
+        Method for converting a distribution into a scalar value.
+    settings_dict
+        Optional settings.
+
+    Returns
+    -------
+    float
+        weighted scalar value of all test points.
+    """
     # Apply method for converting a distribution into a scalar value
     scalars = [valuation_method(distributions[test_point], test_point, settings_dict) for test_point in
                range(len(distributions))]
-    weights = app.config[settings_dict["config"]]["TestPointWeights"]
+    weights = settings_dict["config"].weights
     return np.average(scalars, weights=weights)
 
 
+def evaluate_histograms(distributions: List[List[Histogram]], valuation_method: ValuationMethod,
+                        settings_dict: Dict[str, Any]) -> np.ndarray:
+    """
+    Valuates the convoluted histograms of many batch pairs at once with the batched variant of the valuation method.
+
+    Parameters
+    ----------
+    distributions
+        for every pair, the histogram of every test point (with the same bin edges for all pairs).
+    valuation_method
+        Method for converting a distribution into a scalar value, must have a batched variant.
+    settings_dict
+        Optional settings.
+
+    Returns
+    -------
+    np.ndarray
+        for every pair, the same scalar value as evaluate_batches.
+    """
+    probabilities, edges = stack_histograms(distributions)
+    scalars = batched_valuation_methods[valuation_method](probabilities, edges, settings_dict)
+    return np.average(scalars, axis=1, weights=settings_dict["config"].weights)
+
+
+class PairwiseEvaluator:
+    """
+    Memoized evaluation of batch pairs, shared by all optimization algorithms.
+
+    Every pair is keyed by the (component, batch index) of both batches,
+    so that each batch combination is only convoluted and valuated once.
+    """
+
+    def __init__(self, components: Tuple[List[pd.DataFrame], ...], convolution_method: ConvolutionMethod,
+                 valuation_method: ValuationMethod, settings_dict: Dict[str, Any]):
+        self.components = components
+        self.convolution_method = convolution_method
+        self.valuation_method = valuation_method
+        self.settings_dict = settings_dict
+        self._values: Dict[Tuple[Tuple[int, int], Tuple[int, int]], float] = {}
+        # cache statistics
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, index_a: int, index_b: int, component_a: int = 0, component_b: int = 1) -> float:
+        """
+        Evaluates two batches of two components, or returns the previously evaluated value.
+
+        Parameters
+        ----------
+        index_a
+            batch index of the first component.
+        index_b
+            batch index of the second component.
+        component_a
+            index of the first component.
+        component_b
+            index of the second component.
+
+        Returns
+        -------
+        float
+            scalar value for this batch combination.
+        """
+        key = ((component_a, index_a), (component_b, index_b))
+        if key in self._values:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self._values[key] = evaluate_batches(self.components[component_a][index_a],
+                                                 self.components[component_b][index_b],
+                                                 self.convolution_method, self.valuation_method, self.settings_dict)
+        return self._values[key]
+
+    def cost_matrix(self, component_a: int = 0, component_b: int = 1) -> np.ndarray:
+        """
+        Evaluates every batch of the first component against every batch of the second component.
+
+        Like in the brute-force optimization, only the first n_b batches of the first component
+        can be allocated if the first component has more batches (n_a > n_b).
+        If more than one worker is set in the settings ("workers"), the pairs are evaluated in parallel processes.
+        Every evaluated pair is reported to the progress of the settings ("progress"), if any.
+        In a single process, the convoluted histograms of all pairs are stacked and valuated at once
+        (see evaluate_histograms).
+
+        Parameters
+        ----------
+        component_a
+            index of the first component.
+        component_b
+            index of the second component.
+
+        Returns
+        -------
+        np.ndarray
+            matrix where the entry (i, j) is the scalar value of the i-th batch of the first component
+            and the j-th batch of the second component.
+        """
+        n_cols = len(self.components[component_b])
+        n_rows = min(len(self.components[component_a]), n_cols)
+        costs = np.empty((n_rows, n_cols))
+        workers = self.settings_dict.get("workers", 1)
+        progress = self.settings_dict.get("progress")
+        if workers > 1:
+            # evaluate all pairs that are not memoized yet in a pool of worker processes
+            keys = [((component_a, index_a), (component_b, index_b)) for index_a in range(n_rows)
+                    for index_b in range(n_cols)]
+            missing = [key for key in keys if key not in self._values]
+            if progress is not None:
+                progress.add_total(len(keys))
+                progress.update(len(keys) - len(missing))
+            if missing:
+                values = evaluate_pairs(missing, evaluate_batches, self.components, self.convolution_method,
+                                        self.valuation_method, self.settings_dict, workers)
+                self._values.update(zip(missing, values))
+            self.misses += len(missing)
+            self.hits += len(keys) - len(missing)
+            for key in keys:
+                (_, index_a), (_, index_b) = key
+                costs[index_a, index_b] = self._values[key]
+            return costs
+
+        if progress is not None:
+            progress.add_total(n_rows * n_cols)
+        valuation_method_batched = batched_valuation_methods.get(self.valuation_method)
+        # convoluted histograms of the pairs that are valuated together
+        pending: Dict[Tuple[Tuple[int, int], Tuple[int, int]], List[Histogram]] = {}
+        pending_bytes = 0
+        for index_a in tqdm(range(n_rows)):
+            for index_b in range(n_cols):
+                key = ((component_a, index_a), (component_b, index_b))
+                if key in self._values or valuation_method_batched is None:
+                    self(index_a, index_b, component_a, component_b)
+                else:
+                    self.misses += 1
+                    distributions = self.convolution_method(self.components[component_a][index_a],
+                                                            self.components[component_b][index_b],
+                                                            self.settings_dict)
+                    if isinstance(distributions[0], AnyDistribution):
+                        # no histograms (e.g. "moments" convolution), which are valuated pair by pair
+                        valuation_method_batched = None
+                        self._values[key] = valuate_distributions(distributions, self.valuation_method,
+                                                                  self.settings_dict)
+                    else:
+                        pending[key] = distributions
+                        pending_bytes += sum(np.size(y) for y, _ in distributions) * 8
+                        if pending_bytes > VALUATION_MEMORY_BUDGET:
+                            self._evaluate_pending(pending)
+                            pending_bytes = 0
+                if progress is not None:
+                    progress.update()
+        self._evaluate_pending(pending)
+
+        for index_a in range(n_rows):
+            for index_b in range(n_cols):
+                costs[index_a, index_b] = self._values[((component_a, index_a), (component_b, index_b))]
+        return costs
+
+    def _evaluate_pending(self, pending: Dict[Tuple[Tuple[int, int], Tuple[int, int]], List[Histogram]]):
+        """
+        Valuates the convoluted histograms of all pending pairs at once and memoizes their values.
+        """
+        if pending:
+            values = evaluate_histograms(list(pending.values()), self.valuation_method, self.settings_dict)
+            self._values.update(zip(pending, values.tolist()))
+            pending.clear()
+
+    def __repr__(self) -> str:
+        return f"PairwiseEvaluator(hits={self.hits}, misses={self.misses})"
+
+
 def apply_brute_force(components: Tuple[List[pd.DataFrame], List[pd.DataFrame]], convolution_method: ConvolutionMethod,
                       valuation_method: ValuationMethod, settings_dict: Dict[str, Any]) -> Tuple[List[int], List[float]]:
     """
@@ -68,9 +271,208 @@ def apply_brute_force(components: Tuple[List[pd.DataFrame], List[pd.DataFrame]],
     List[float]
         scalar values for this batch combination.
     """
-    return brute_force(components,
-                       lambda batch_a, batch_b: evaluate_batches(batch_a, batch_b, convolution_method, valuation_method,
-                                                                 settings_dict))
+    evaluator = PairwiseEvaluator(components, convolution_method, valuation_method, settings_dict)
+    return brute_force(evaluator.cost_matrix(), settings_dict.get("progress"))
+
+
+def apply_linear_assignment(components: Tuple[List[pd.DataFrame], List[pd.DataFrame]],
+                            convolution_method: ConvolutionMethod, valuation_method: ValuationMethod,
+                            settings_dict: Dict[str, Any]) -> Tuple[List[int], List[float]]:
+    """
+    Evaluates every batch combination once and then finds the best allocation by solving
+    the resulting linear assignment problem.
+
+    Parameters
+    ----------
+    components
+        array containing two different lists, whose elements should be evaluated against each other.
+    convolution_method
+        Method for convolution of two distributions.
+    valuation_method
+        method for converting a distribution into a scalar value.
+    settings_dict
+        Optional settings.
+
+    Returns
+    -------
+    List[int]
+        optimal allocation sequence.
+    List[float]
+        scalar values for this batch combination.
+    """
+    evaluator = PairwiseEvaluator(components, convolution_method, valuation_method, settings_dict)
+    return linear_assignment(evaluator.cost_matrix())
+
+
+class TupleEvaluator:
+    """
+    Memoized evaluation of tuples of batches (one batch of every component), i.e. of assembled modules.
+    """
+
+    def __init__(self, components: Tuple[List[pd.DataFrame], ...], convolution_method: ConvolutionMethod,
+                 valuation_method: ValuationMethod, settings_dict: Dict[str, Any]):
+        self.components = components
+        self.valuation_method = valuation_method
+        self.settings_dict = settings_dict
+        if len(components) == 2:
+            self.convolution_method = lambda batches, settings: convolution_method(*batches, settings)
+        elif convolution_method in multi_convolution_methods:
+            self.convolution_method = multi_convolution_methods[convolution_method]
+        else:
+            raise BadRequest("Only conventional assembly supports more than two components")
+        self._values: Dict[Tuple[int, ...], float] = {}
+        # cache statistics
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, indices: Tuple[int, ...]) -> float:
+        """
+        Evaluates a tuple of batches, or returns the previously evaluated value.
+
+        Parameters
+        ----------
+        indices
+            batch index of every component.
+
+        Returns
+        -------
+        float
+            scalar value for this batch combination.
+        """
+        if indices in self._values:
+            self.hits += 1
+        else:
+            self.misses += 1
+            batches = [component[index] for component, index in zip(self.components, indices)]
+            distributions = self.convolution_method(batches, self.settings_dict)
+            self._values[indices] = valuate_distributions(distributions, self.valuation_method, self.settings_dict)
+        return self._values[indices]
+
+    def cost_tensor(self) -> np.ndarray:
+        """
+        Evaluates every tuple of batches.
+
+        Like in the other optimization algorithms, only the first n batches of the first component can be allocated,
+        where n is the smallest number of batches of all components.
+        Every evaluated tuple is reported to the progress of the settings ("progress"), if any.
+
+        Returns
+        -------
+        np.ndarray
+            tensor where the entry (i, j, k, ...) is the scalar value of the i-th batch of the first component,
+            the j-th batch of the second component, the k-th batch of the third component, ...
+        """
+        shape = (min(len(component) for component in self.components),) + tuple(
+            len(component) for component in self.components[1:])
+        costs = np.empty(shape)
+        progress = self.settings_dict.get("progress")
+        if progress is not None:
+            progress.add_total(costs.size)
+        for indices in tqdm(np.ndindex(shape), total=costs.size):
+            costs[indices] = self(tuple(int(index) for index in indices))
+            if progress is not None:
+                progress.update()
+        return costs
+
+    def __repr__(self) -> str:
+        return f"TupleEvaluator(hits={self.hits}, misses={self.misses})"
+
+
+def apply_metaheuristic(metaheuristic: Metaheuristic, components: Tuple[List[pd.DataFrame], ...],
+                        convolution_method: ConvolutionMethod, valuation_method: ValuationMethod,
+                        settings_dict: Dict[str, Any]) -> Tuple[Union[List[int], List[List[int]]], List[float]]:
+    """
+    Searches a good allocation of two or more components with a metaheuristic.
+
+    Every swap of two batches only re-evaluates the affected tuples (see MultiAssignment).
+    The search is limited by the settings "iterations" and "time_limit" (seconds) and randomized by "seed".
+    The best value so far is recorded in the settings as "trace".
+
+    Parameters
+    ----------
+    metaheuristic
+        the search.
+    components
+        two or more lists of batches, whose elements should be allocated to each other.
+    convolution_method
+        Method for convolution of two distributions.
+    valuation_method
+        method for converting a distribution into a scalar value.
+    settings_dict
+        Optional settings.
+
+    Returns
+    -------
+    Union[List[int], List[List[int]]]
+        allocation sequence, for more than two components one sequence per further component.
+    List[float]
+        scalar values for this batch combination.
+    """
+    evaluator = TupleEvaluator(components, convolution_method, valuation_method, settings_dict)
+    budget = SearchBudget(settings_dict.get("iterations", DEFAULT_ITERATIONS),
+                          settings_dict.get("time_limit", DEFAULT_TIME_LIMIT), settings_dict.get("progress"))
+    rng = np.random.default_rng(settings_dict.get("seed", DEFAULT_SEED))
+    initial = MultiAssignment.initial(evaluator, [len(component) for component in components])
+    best = metaheuristic(initial, budget, rng)
+    settings_dict["trace"] = budget.trace
+
+    permutations = [permutation[:best.n].tolist() for permutation in best.permutations]
+    return permutations[0] if len(permutations) == 1 else permutations, best.costs.tolist()
+
+
+def apply_simulated_annealing(components: Tuple[List[pd.DataFrame], ...], convolution_method: ConvolutionMethod,
+                              valuation_method: ValuationMethod,
+                              settings_dict: Dict[str, Any]) -> Tuple[Union[List[int], List[List[int]]], List[float]]:
+    return apply_metaheuristic(simulated_annealing, components, convolution_method, valuation_method, settings_dict)
+
+
+def apply_genetic_algorithm(components: Tuple[List[pd.DataFrame], ...], convolution_method: ConvolutionMethod,
+                            valuation_method: ValuationMethod,
+                            settings_dict: Dict[str, Any]) -> Tuple[Union[List[int], List[List[int]]], List[float]]:
+    return apply_metaheuristic(genetic_algorithm, components, convolution_method, valuation_method, settings_dict)
+
+
+def apply_two_opt(components: Tuple[List[pd.DataFrame], ...], convolution_method: ConvolutionMethod,
+                  valuation_method: ValuationMethod,
+                  settings_dict: Dict[str, Any]) -> Tuple[Union[List[int], List[List[int]]], List[float]]:
+    return apply_metaheuristic(iterated_two_opt, components, convolution_method, valuation_method, settings_dict)
+
+
+def apply_branch_and_bound(components: Tuple[List[pd.DataFrame], ...], convolution_method: ConvolutionMethod,
+                           valuation_method: ValuationMethod,
+                           settings_dict: Dict[str, Any]) -> Tuple[Union[List[int], List[List[int]]], List[float]]:
+    """
+    Evaluates every batch combination once and then finds the best allocation of two or more components
+    by branch and bound (see branch_and_bound).
+
+    The search is limited by the setting "node_budget". The optimality gap of the found allocation
+    is stored in the settings as "optimality".
+
+    Parameters
+    ----------
+    components
+        two or more lists of batches, whose elements should be allocated to each other.
+    convolution_method
+        Method for convolution of two distributions.
+    valuation_method
+        method for converting a distribution into a scalar value.
+    settings_dict
+        Optional settings.
+
+    Returns
+    -------
+    Union[List[int], List[List[int]]]
+        allocation sequence, for more than two components one sequence per further component.
+    List[float]
+        scalar values for this batch combination.
+    """
+    if len(components) == 2:
+        costs = PairwiseEvaluator(components, convolution_method, valuation_method, settings_dict).cost_matrix()
+    else:
+        costs = TupleEvaluator(components, convolution_method, valuation_method, settings_dict).cost_tensor()
+    permutations, values, optimality = branch_and_bound(costs, settings_dict.get("node_budget", DEFAULT_NODE_BUDGET))
+    settings_dict["optimality"] = optimality
+    return permutations[0] if len(permutations) == 1 else permutations, values
 
 
 OptimizationAlgorithm = Callable[
@@ -79,4 +481,11 @@ OptimizationAlgorithm = Callable[
 
 supported_algorithms: Dict[str, OptimizationAlgorithm] = {
     "brute_force": apply_brute_force,
+    "assignment": apply_linear_assignment,
+    # exact, also for more than two components
+    "branch_and_bound": apply_branch_and_bound,
+    # metaheuristics, which also support more than two components
+    "annealing": apply_simulated_annealing,
+    "genetic": apply_genetic_algorithm,
+    "two_opt": apply_two_opt,
 }
@@ -0,0 +1,138 @@
+####################################################################
+# PARALLEL EVALUATION OF BATCH PAIRS                               #
+####################################################################
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Any, Dict, Tuple, Callable, Iterator, Optional
+
+import pandas as pd
+from tqdm import tqdm
+
+# (component index, batch index) of both evaluated batches
+PairKey = Tuple[Tuple[int, int], Tuple[int, int]]
+
+# state of a worker process, set once by the initializer
+_worker_state: Dict[str, Any] = {}
+
+# the worker processes are not forked from the server, whose other threads may hold locks (e.g. of tqdm),
+# but started by a fork server that has only imported the calculations
+if "forkserver" in multiprocessing.get_all_start_methods():
+    _mp_context = multiprocessing.get_context("forkserver")
+    _mp_context.set_forkserver_preload(["app.calculations.allocation.optimization_algorithms",
+                                        "app.calculations.allocations"])
+else:
+    _mp_context = multiprocessing.get_context("spawn")
+
+
+def _init_worker(evaluate: Callable, components: Tuple[List[pd.DataFrame], ...], convolution_method: Callable,
+                 valuation_method: Callable, settings_dict: Dict[str, Any]):
+    """
+    Stores everything needed for evaluating batch pairs in the worker process,
+    so that only the pair keys have to be sent with every task.
+    """
+    _worker_state["evaluate"] = evaluate
+    _worker_state["components"] = components
+    _worker_state["convolution_method"] = convolution_method
+    _worker_state["valuation_method"] = valuation_method
+    _worker_state["settings_dict"] = settings_dict
+
+
+def _evaluate_pair(key: PairKey) -> float:
+    (component_a, index_a), (component_b, index_b) = key
+    components = _worker_state["components"]
+    return _worker_state["evaluate"](components[component_a][index_a], components[component_b][index_b],
+                                     _worker_state["convolution_method"], _worker_state["valuation_method"],
+                                     _worker_state["settings_dict"])
+
+
+def evaluate_pairs(keys: List[PairKey], evaluate: Callable, components: Tuple[List[pd.DataFrame], ...],
+                   convolution_method: Callable, valuation_method: Callable, settings_dict: Dict[str, Any],
+                   workers: int) -> List[float]:
+    """
+    Evaluates the given batch pairs in a pool of worker processes.
+
+    The workers cannot access the flask app, therefore the settings must only contain picklable values,
+    e.g. the config context instead of the current app config.
+    The progress of the settings ("progress"), if any, is updated for every evaluated pair.
+
+    Parameters
+    ----------
+    keys
+        (component index, batch index) of both batches of every pair that should be evaluated.
+    evaluate
+        module-level function that evaluates two batches, i.e. evaluate_batches.
+    components
+        batches of every component.
+    convolution_method
+        Method for convolution of two distributions.
+    valuation_method
+        Method for converting a distribution into a scalar value.
+    settings_dict
+        Optional settings.
+    workers
+        number of worker processes.
+
+    Returns
+    -------
+    List[float]
+        for every given pair, its scalar value.
+    """
+    # the progress is reported by this process and cannot be sent to the workers
+    progress = settings_dict.get("progress")
+    settings_dict = {key: value for key, value in settings_dict.items() if key != "progress"}
+
+    workers = min(workers, len(keys))
+    # send several pairs at once to reduce the communication overhead
+    chunksize = max(1, len(keys) // (workers * 4))
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context, initializer=_init_worker,
+                                   initargs=(evaluate, components, convolution_method, valuation_method, settings_dict))
+    try:
+        values = []
+        for value in tqdm(executor.map(_evaluate_pair, keys, chunksize=chunksize), total=len(keys)):
+            values.append(value)
+            if progress is not None:
+                progress.update()
+        return values
+    finally:
+        # do not wait for the remaining pairs if the evaluation was aborted, e.g. by a cancelled job
+        executor.shutdown(cancel_futures=True)
+
+
+def map_in_order(function: Callable, arguments: List[Tuple[Any, ...]], workers: int,
+                 progress: Optional[Any] = None) -> Iterator[Any]:
+    """
+    Calls a function for independent tasks in a pool of worker processes and streams the results in order,
+    i.e. every result is returned as soon as it and all previous results are available.
+
+    Every task is sent to a worker on its own, so the arguments must be picklable.
+    The progress, if any, is updated for every result.
+
+    Parameters
+    ----------
+    function
+        module-level function.
+    arguments
+        for every task, the arguments of the function.
+    workers
+        number of worker processes.
+    progress
+        progress of a job.
+
+    Returns
+    -------
+    Iterator[Any]
+        for every task, the result of the function.
+    """
+    if not arguments:
+        return
+    if progress is not None:
+        progress.add_total(len(arguments))
+    executor = ProcessPoolExecutor(max_workers=min(workers, len(arguments)), mp_context=_mp_context)
+    try:
+        for result in executor.map(function, *zip(*arguments)):
+            if progress is not None:
+                progress.update()
+            yield result
+    finally:
+        # do not wait for the remaining tasks if the iteration was aborted, e.g. by a cancelled job
+        executor.shutdown(cancel_futures=True)
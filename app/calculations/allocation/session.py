@@ -0,0 +1,126 @@
+####################################################################
+# INCREMENTAL ALLOCATION OF ARRIVING BATCHES                       #
+####################################################################
+from typing import List, Any, Dict, Tuple, Optional
+
+import numpy as np
+import pandas as pd
+from werkzeug.exceptions import BadRequest
+
+from app.calculations.allocation.convolution_methods import get_convolution_method
+from app.calculations.allocation.optimization_algorithms import evaluate_batches
+from app.calculations.allocation.parallel import evaluate_pairs
+from app.calculations.allocation.valuation_methods import supported_valuation_methods
+from app.calculations.functionalmodel import FulfillmentCache
+from app.calculations.optimization import linear_assignment
+from app.utils.qc_strategy import QcStrategy
+
+
+class AllocationSession:
+    """
+    Allocation of the batches of two components, which is updated whenever a batch arrives or leaves.
+
+    The scalar values of all batch pairs are kept in a cost matrix,
+    so that adding a batch only evaluates the pairs of the new batch, i.e. a new row or column.
+    The allocation itself is solved as linear assignment problem (see apply_linear_assignment).
+    """
+
+    def __init__(self, qc_strategy: Optional[QcStrategy], valuation_method: str, settings_dict: Dict[str, Any]):
+        if valuation_method not in supported_valuation_methods:
+            raise BadRequest("Only " + str(supported_valuation_methods.keys) + " valuation methods supported")
+        if settings_dict.get("convolution") == "moments" and valuation_method == "qualityloss":
+            raise BadRequest("the quality loss requires a histogram convolution")
+        self.convolution_method = get_convolution_method(qc_strategy, settings_dict)
+        self.valuation_method = supported_valuation_methods[valuation_method]
+        self.settings_dict = settings_dict
+        # fulfillments and histograms of all current batches
+        self.settings_dict.setdefault("fulfillments", FulfillmentCache())
+        # batches of both components
+        self.components: Tuple[List[pd.DataFrame], List[pd.DataFrame]] = ([], [])
+        # entry (i, j) is the scalar value of the i-th batch of the first and the j-th batch of the second component
+        self.costs = np.empty((0, 0))
+
+    def add_batch(self, component: int, batch: pd.DataFrame) -> int:
+        """
+        Adds a batch and evaluates it against every batch of the other component.
+
+        Parameters
+        ----------
+        component
+            index of the component (0 or 1).
+        batch
+            characteristic values of the batch.
+
+        Returns
+        -------
+        int
+            index of the new batch.
+        """
+        self._check_component(component)
+        self.components[component].append(batch)
+        index = len(self.components[component]) - 1
+        other = 1 - component
+
+        keys = [((0, index), (1, other_index)) if component == 0 else ((0, other_index), (1, index))
+                for other_index in range(len(self.components[other]))]
+        try:
+            values = np.array(self._evaluate(keys))
+        except Exception:
+            # a rejected batch (e.g. with unknown characteristics) must not stay in the session
+            self.components[component].pop()
+            self.settings_dict["fulfillments"].discard(batch)
+            raise
+        if component == 0:
+            self.costs = np.vstack([self.costs, values[np.newaxis]])
+        else:
+            self.costs = np.hstack([self.costs, values[:, np.newaxis]])
+        return index
+
+    def remove_batch(self, component: int, index: int):
+        """
+        Removes a batch, e.g. after it has been assembled. The indices of all following batches are decreased.
+
+        Parameters
+        ----------
+        component
+            index of the component (0 or 1).
+        index
+            index of the batch.
+        """
+        self._check_component(component)
+        if not 0 <= index < len(self.components[component]):
+            raise BadRequest(f"unknown batch {index} of component {component}")
+        self.settings_dict["fulfillments"].discard(self.components[component][index])
+        del self.components[component][index]
+        self.costs = np.delete(self.costs, index, axis=component)
+
+    def allocate(self) -> Tuple[List[int], List[float]]:
+        """
+        Solves the allocation for the current batches.
+
+        Like in the other optimization algorithms, only the first n_b batches of the first component
+        are allocated if the first component has more batches (n_a > n_b).
+
+        Returns
+        -------
+        List[int]
+            optimal allocation sequence.
+        List[float]
+            scalar values for this batch combination.
+        """
+        n_rows = min(self.costs.shape)
+        return linear_assignment(self.costs[:n_rows])
+
+    def _evaluate(self, keys: List[Tuple[Tuple[int, int], Tuple[int, int]]]) -> List[float]:
+        workers = self.settings_dict.get("workers", 1)
+        if workers > 1 and len(keys) > 1:
+            return evaluate_pairs(keys, evaluate_batches, self.components, self.convolution_method,
+                                  self.valuation_method, self.settings_dict, workers)
+        return [evaluate_batches(self.components[component_a][index_a], self.components[component_b][index_b],
+                                 self.convolution_method, self.valuation_method, self.settings_dict)
+                for (component_a, index_a), (component_b, index_b) in keys]
+
+    @staticmethod
+    def _check_component(component: int):
+        if component not in (0, 1):
+            raise BadRequest("allocation sessions only support two components")
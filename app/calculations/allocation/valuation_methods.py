@@ -1,57 +1,55 @@
 ##################################################################
 # METHODS HOW A DISTRIBUTION IS CONVERTED INTO A NUMERICAL VALUE #
 ##################################################################
-from typing import Any, Dict, Callable
+from typing import Any, Dict, Callable, Union, List, Tuple
 
-from flask import current_app as app
-from scipy.stats import rv_histogram
+import numpy as np
+from werkzeug.exceptions import BadRequest
 
-from app.calculations.functionalmodel import get_function
-from app.calculations.math import cpk
-from app.calculations.qualitylossfunc import calculate_quality_loss_discrete
-from app.utils.requests import get_tolerances
+from app.calculations.math import cpk, AnyDistribution, HistogramDistribution, bins_center
+from app.calculations.qualitylossfunc import calculate_quality_loss_discrete, calculate_quality_loss
 from app.utils.types import Histogram
 
 
-def apply_mean(distribution: Histogram, test_point: int, settings_dict: Dict[str, Any]):
+def as_distribution(distribution: Union[Histogram, AnyDistribution]) -> Union[AnyDistribution, HistogramDistribution]:
+    """
+    Returns the convoluted distribution of a test point, which is either a histogram
+    or, for the "moments" convolution, only given by its mean and standard deviation.
+    """
+    if isinstance(distribution, AnyDistribution):
+        return distribution
+    return HistogramDistribution(distribution)
+
+
+def apply_mean(distribution: Union[Histogram, AnyDistribution], test_point: int, settings_dict: Dict[str, Any]):
     # when mean != 0 (ie non-relative functional fulfillment), offset value by mean
-    means = app.config[settings_dict["config"]]["MeanValues"]
-    test_point = app.config[settings_dict["config"]]["TestPoints"][test_point]
-    return abs(rv_histogram(distribution).mean() - means[test_point])
+    means = settings_dict["config"].test_point_means
+    return abs(as_distribution(distribution).mean() - means[test_point])
 
 
-def apply_mean_std(distribution: Histogram, test_point: int, settings_dict: Dict[str, Any]):
+def apply_mean_std(distribution: Union[Histogram, AnyDistribution], test_point: int, settings_dict: Dict[str, Any]):
     # when mean != 0 (ie non-relative functional fulfillment), offset value by mean
-    means = app.config[settings_dict["config"]]["MeanValues"]
-    test_point = app.config[settings_dict["config"]]["TestPoints"][test_point]
+    means = settings_dict["config"].test_point_means
 
-    hist = rv_histogram(distribution)
+    hist = as_distribution(distribution)
     return abs(hist.mean() - means[test_point] + hist.std())
 
 
-def apply_cpk(distribution: Histogram, test_point: int, settings_dict: Dict[str, Any]):
-    return -cpk(rv_histogram(distribution), *get_tolerances(settings_dict["config"])[test_point])
+def apply_cpk(distribution: Union[Histogram, AnyDistribution], test_point: int, settings_dict: Dict[str, Any]):
+    return -cpk(as_distribution(distribution), *settings_dict["config"].tolerances[test_point])
 
 
 _standard_convolutions_cache = {}
 
 
 def apply_quality_loss(distribution: Histogram, test_point: int, settings_dict: Dict[str, Any]):
+    if isinstance(distribution, AnyDistribution):
+        raise BadRequest("the quality loss requires a histogram convolution")
     current_config = settings_dict["config"]
-    inefficiency_costs = app.config[current_config]["QualityLoss"]["InefficiencyCosts"]
-
-    tolerances = get_tolerances(current_config)
-    component_names = settings_dict["component_names"]
-    characteristic_values = {}
-    for component in component_names:
-        characteristics = next((
-            x["characteristics"] for x in app.config[current_config]["Components"] if x["name"] == component))
-        means = app.config[current_config]["MeanValues"]
-        for characteristic in characteristics:
-            characteristic_values[characteristic] = means[characteristic]
-
-    convolution_means = get_function(characteristic_values, current_config, weighted=False)
-    convolution_mean = convolution_means[test_point]
+    inefficiency_costs = current_config.inefficiency_costs
+
+    tolerances = current_config.tolerances
+    convolution_mean = current_config.quality_loss_mean(settings_dict["component_names"])[test_point]
     batch_size = settings_dict["batch_size"]
     return batch_size * calculate_quality_loss_discrete(distribution, convolution_mean, inefficiency_costs,
                                                         tolerances[test_point])
@@ -65,3 +63,96 @@ supported_valuation_methods: Dict[str, ValuationMethod] = {
     "cpk": apply_cpk,
     "qualityloss": apply_quality_loss,
 }
+
+
+####################################################################
+# BATCHED VALUATION OF MANY PAIRS AT ONCE                          #
+####################################################################
+
+def stack_histograms(distributions: List[List[Histogram]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Stacks the convoluted histograms of several batch pairs.
+
+    All pairs must share the bin edges of every test point, which holds for all histogram convolution methods,
+    since their edges only depend on the axis range and the number of bins.
+
+    Parameters
+    ----------
+    distributions
+        for every pair, the histogram of every test point.
+
+    Returns
+    -------
+    np.ndarray
+        probabilities of shape (pairs, test points, bins).
+    np.ndarray
+        bin edges of shape (test points, bins + 1).
+    """
+    probabilities = np.array([[y for y, _ in pair] for pair in distributions], dtype=np.float64)
+    edges = np.array([x for _, x in distributions[0]], dtype=np.float64)
+    return probabilities, edges
+
+
+def _histogram_moments(probabilities: np.ndarray, edges: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes mean and standard deviation of stacked histograms, like HistogramDistribution.
+
+    Returns
+    -------
+    np.ndarray
+        means of shape (pairs, test points).
+    np.ndarray
+        standard deviations of shape (pairs, test points).
+    """
+    widths = edges[:, 1:] - edges[:, :-1]
+    pdf = probabilities / np.sum(probabilities * widths, axis=-1, keepdims=True)
+    mean = np.sum(pdf * (edges[:, 1:] ** 2 - edges[:, :-1] ** 2) / 2, axis=-1)
+    var = np.sum(pdf * (edges[:, 1:] ** 3 - edges[:, :-1] ** 3) / 3, axis=-1) - mean ** 2
+    return mean, np.sqrt(var)
+
+
+def apply_mean_batched(probabilities: np.ndarray, edges: np.ndarray, settings_dict: Dict[str, Any]) -> np.ndarray:
+    test_points = probabilities.shape[1]
+    means = settings_dict["config"].test_point_means[:test_points]
+    mean, _ = _histogram_moments(probabilities, edges)
+    return np.abs(mean - means)
+
+
+def apply_mean_std_batched(probabilities: np.ndarray, edges: np.ndarray, settings_dict: Dict[str, Any]) -> np.ndarray:
+    test_points = probabilities.shape[1]
+    means = settings_dict["config"].test_point_means[:test_points]
+    mean, std = _histogram_moments(probabilities, edges)
+    return np.abs(mean - means + std)
+
+
+def apply_cpk_batched(probabilities: np.ndarray, edges: np.ndarray, settings_dict: Dict[str, Any]) -> np.ndarray:
+    test_points = probabilities.shape[1]
+    lower, upper = settings_dict["config"].tolerances[:test_points].T
+    mean, std = _histogram_moments(probabilities, edges)
+    return -np.minimum(upper - mean, mean - lower) / (3 * std)
+
+
+def apply_quality_loss_batched(probabilities: np.ndarray, edges: np.ndarray,
+                               settings_dict: Dict[str, Any]) -> np.ndarray:
+    current_config = settings_dict["config"]
+    test_points = probabilities.shape[1]
+    convolution_means = current_config.quality_loss_mean(settings_dict["component_names"])[:test_points]
+    # quality loss of every bin center, shape (test points, bins)
+    losses = np.array([calculate_quality_loss(bins_center(x), target_mean, current_config.inefficiency_costs,
+                                              tolerance)
+                       for x, target_mean, tolerance in zip(edges, convolution_means, current_config.tolerances)])
+    normalized = probabilities / probabilities.sum(axis=-1, keepdims=True)
+    return settings_dict["batch_size"] * np.sum(normalized * losses, axis=-1)
+
+
+# valuates stacked histograms (pairs, test points, bins) with shared bin edges (test points, bins + 1),
+# returns the values of shape (pairs, test points)
+BatchedValuationMethod = Callable[[np.ndarray, np.ndarray, Dict[str, Any]], np.ndarray]
+
+# batched variant of every valuation method, which returns the same values as the valuation method
+batched_valuation_methods: Dict[ValuationMethod, BatchedValuationMethod] = {
+    apply_mean: apply_mean_batched,
+    apply_mean_std: apply_mean_std_batched,
+    apply_cpk: apply_cpk_batched,
+    apply_quality_loss: apply_quality_loss_batched,
+}
@@ -1,19 +1,24 @@
-from typing import List
+from typing import List, Union
 
 from werkzeug.exceptions import BadRequest
 
 from app.calculations.allocation.convolution_methods import *
 from app.calculations.allocation.optimization_algorithms import *
 from app.calculations.allocation.valuation_methods import *
+from app.calculations.allocation.parallel import map_in_order
+from app.calculations.functionalmodel import FulfillmentCache
+from app.utils.batches import ComponentBatches
 from app.utils.qc_strategy import QcStrategy
 
 
 def allocate(components: Tuple[List[pd.DataFrame], List[pd.DataFrame]],
              qc_strategy: Optional[QcStrategy] = None,
              valuation_method: str = "mean", algorithm: str = "brute_force",
-             settings_dict: Dict[str, Any] = None) -> Tuple[List[int], List[float]]:
+             settings_dict: Dict[str, Any] = None) -> Tuple[Union[List[int], List[List[int]]], List[float]]:
     """
     Allocates all batches of two or more component types.
+    Only the metaheuristic algorithms ("annealing", "genetic", "two_opt") and "branch_and_bound"
+    support more than two component types.
 
     Parameters
     ----------
@@ -29,14 +34,18 @@ def allocate(components: Tuple[List[pd.DataFrame], List[pd.DataFrame]],
         One of "mean", "mean_std", "cpk", "qualityloss".
     algorithm
         Optimization algorithm.
-        Currently, only "brute_force" is supported.
+        One of "brute_force", "assignment", "branch_and_bound", "annealing", "genetic", "two_opt".
     settings_dict
         config name etc.
+        "iterations", "time_limit" and "seed" limit the metaheuristic algorithms, which store the "trace"
+        of the best value so far. "node_budget" limits "branch_and_bound", which stores the "optimality" gap.
+        "convolution": "moments" convolutes only the means and standard deviations (see moments_convolution).
+        "fulfillments" is the FulfillmentCache of the request, which is added if missing.
 
     Returns
     -------
-    List[int]
-        optimal allocation sequence.
+    Union[List[int], List[List[int]]]
+        optimal allocation sequence, for more than two components one sequence per further component.
     List[float]
         the optimal scalar values.
     """
@@ -45,16 +54,21 @@ def allocate(components: Tuple[List[pd.DataFrame], List[pd.DataFrame]],
     ####################################################################
     if algorithm == "brute_force" and len(components) > 2:
         raise BadRequest("Brute force algorithm only supports two components")
+    if algorithm == "assignment" and len(components) > 2:
+        raise BadRequest("Assignment algorithm only supports two components")
+    if len(components) < 2:
+        raise BadRequest("Allocation requires at least two components")
     if algorithm not in supported_algorithms:
         raise BadRequest(
             "Only " + str(supported_algorithms.keys) + " algorithms supported"
         )
-    if qc_strategy not in supported_convolution_methods:
-        raise BadRequest(
-            "Only " + str(supported_convolution_methods.keys) + " convolution methods supported"
-        )
     if valuation_method not in supported_valuation_methods:
         raise BadRequest("Only " + str(supported_valuation_methods.keys) + " valuation methods supported")
+    settings_dict = settings_dict if settings_dict is not None else {}
+    # every batch is evaluated against several other batches, but its fulfillment and histograms are calculated once
+    settings_dict.setdefault("fulfillments", FulfillmentCache())
+    if settings_dict.get("convolution") == "moments" and valuation_method == "qualityloss":
+        raise BadRequest("the quality loss requires a histogram convolution")
 
     ####################################################################
     # APPLY SELECTED ALGORITHM WITH THE SELECTED METHOD                #
@@ -65,27 +79,31 @@ def allocate(components: Tuple[List[pd.DataFrame], List[pd.DataFrame]],
     optimization_algorithm = supported_algorithms[algorithm]
     # tells how two components are assembled and what the
     # resulting functional fulfillment will be
-    convolution_method = supported_convolution_methods[qc_strategy]
+    convolution_method = get_convolution_method(qc_strategy, settings_dict)
     # evaluates a given combination using mean, std, or something else
     valuation_method = supported_valuation_methods[valuation_method]
 
     # call optimization algorithm
     optimal_permutation, scalar = optimization_algorithm(components, convolution_method, valuation_method,
-                                                         settings_dict or {})
+                                                         settings_dict)
     return optimal_permutation, scalar
 
 
-def allocate_complete(components_batches: List[List[List[pd.DataFrame]]], qc_strategy: Optional[QcStrategy] = None,
+def allocate_complete(components_batches: List[Union[List[List[pd.DataFrame]], ComponentBatches]], qc_strategy: Optional[QcStrategy] = None,
                       valuation_method: str = "mean", algorithm: str = "brute_force",
                       settings_dict: Dict[str, Any] = None) -> List[Tuple[int, List[int]]]:
     """
     Iteratively allocates all batches and then for every batch all klts.
 
+    The functional fulfillment of every klt is only calculated once (see ComponentBatches and FulfillmentCache).
+    If more than one worker is set in the settings ("workers"), the klt allocations of the allocated batches
+    are calculated concurrently in worker processes.
+
     Parameters
     ----------
     components_batches
         For every component, a list of batches, which consists of a list of klts,
-        which consists of characteristic values.
+        which consists of characteristic values (or the batches of the component in one array).
     qc_strategy
         Tells how two distributions should be convoluted.
     valuation_method
@@ -94,7 +112,7 @@ def allocate_complete(components_batches: List[List[List[pd.DataFrame]]], qc_str
         One of "mean", "mean_std", "cpk", "qualityloss".
     algorithm
         Optimization algorithm.
-        Currently, only "brute_force" is supported.
+        One of "brute_force", "assignment", "branch_and_bound", "annealing", "genetic", "two_opt".
     settings_dict
         config name etc.
 
@@ -103,23 +121,61 @@ def allocate_complete(components_batches: List[List[List[pd.DataFrame]]], qc_str
     List[Tuple[int, List[int]]]
         Every entry of this list represents a) the allocated batch and b) the allocated klts for the allocated batch.
     """
-    # concat data frames on batch level:
-    components_concat = [[pd.concat(batch).reset_index(drop=True) for batch in component] for component in
-                         components_batches]
+    if len(components_batches) != 2:
+        raise BadRequest("Allocation complete only supports two components")
+    settings_dict = dict(settings_dict or {})
+    workers = settings_dict.get("workers", 1)
+
+    # the functional fulfillment of every klt is calculated once,
+    # and reused for the concatenated batches as well as for the klt allocations
+    cache = settings_dict.setdefault("fulfillments", FulfillmentCache())
+    # the batches and klts of every component are views of one contiguous array,
+    # whose functional fulfillment is calculated once
+    config = settings_dict["config"]
+    components_concat, components_klts = zip(*(
+        (component if isinstance(component, ComponentBatches) else ComponentBatches.from_klts(component, config))
+        .frames(config, cache) for component in components_batches))
+    # the caller may use the given klts again, e.g. for their convolution
+    for component, klts in zip(components_batches, components_klts):
+        if not isinstance(component, ComponentBatches):
+            for original_klts, batch_klts in zip(component, klts):
+                for original_klt, klt in zip(original_klts, batch_klts):
+                    cache.add(original_klt, cache.get(klt, config))
     # calculate optimal batch allocation
     # noinspection PyTypeChecker
-    optimal_permutation, _ = allocate(components_concat, qc_strategy, valuation_method, algorithm, settings_dict)
-    # reorder second component according to optimal allocation
-    components_batches[1] = [components_batches[1][index] for index in optimal_permutation]
-
-    result = []
-    for base_batch_idx, allocated_batch_idx in zip(range(len(optimal_permutation)), optimal_permutation):
-        base_klts = components_batches[0][base_batch_idx]
-        comparison_klts = components_batches[1][allocated_batch_idx]
-        # calculate optimal klt allocation
-        # noinspection PyTypeChecker
-        optimal_klt_permutation, _ = allocate([base_klts, comparison_klts], qc_strategy, valuation_method, algorithm,
-                                              settings_dict)
-        result.append((allocated_batch_idx, optimal_klt_permutation))
-
-    return result
+    optimal_permutation, _ = allocate(list(components_concat), qc_strategy, valuation_method, algorithm, settings_dict)
+
+    klt_pairs = [(components_klts[0][base_batch_idx], components_klts[1][allocated_batch_idx])
+                 for base_batch_idx, allocated_batch_idx in enumerate(optimal_permutation)]
+    if workers > 1 and len(klt_pairs) > 1:
+        # the klt allocations are independent, so they are calculated concurrently (one per worker process)
+        # every task only gets the fulfillments of its own klts, and is not parallelized any further
+        task_settings = {key: value for key, value in settings_dict.items() if key not in ("progress", "fulfillments")}
+        task_settings["workers"] = 1
+        tasks = [(base_klts, comparison_klts, qc_strategy, valuation_method, algorithm,
+                  {**task_settings, "fulfillments": cache.subset(base_klts + comparison_klts)})
+                 for base_klts, comparison_klts in klt_pairs]
+        klt_permutations = map_in_order(allocate_klts, tasks, workers, settings_dict.get("progress"))
+    else:
+        klt_permutations = (allocate_klts(base_klts, comparison_klts, qc_strategy, valuation_method, algorithm,
+                                          settings_dict) for base_klts, comparison_klts in klt_pairs)
+
+    return [(allocated_batch_idx, optimal_klt_permutation) for allocated_batch_idx, optimal_klt_permutation in
+            zip(optimal_permutation, klt_permutations)]
+
+
+def allocate_klts(base_klts: List[pd.DataFrame], comparison_klts: List[pd.DataFrame],
+                  qc_strategy: Optional[QcStrategy], valuation_method: str, algorithm: str,
+                  settings_dict: Dict[str, Any]) -> List[int]:
+    """
+    Allocates the klts of two allocated batches (see allocate_complete).
+
+    Returns
+    -------
+    List[int]
+        optimal allocation sequence of the klts.
+    """
+    # noinspection PyTypeChecker
+    optimal_klt_permutation, _ = allocate([base_klts, comparison_klts], qc_strategy, valuation_method, algorithm,
+                                          settings_dict)
+    return optimal_klt_permutation
@@ -1,20 +1,69 @@
-from itertools import product
-from typing import Tuple, List, Optional
+from functools import reduce
+from typing import Tuple, List, Optional, Iterator, Dict, Any, Union
 
 import numpy as np
 import pandas as pd
+from scipy.fft import rfft, irfft, next_fast_len
 from scipy.signal import convolve
 from scipy.stats import rv_continuous
+from werkzeug.exceptions import BadRequest
 
-from app.calculations.functionalmodel import get_batch_function
-from app.calculations.math import bins_boundaries
-from app.calculations.simulation import simulate_assembly
+from app.calculations.functionalmodel import FulfillmentCache
+from app.calculations.math import bins_boundaries, HistogramDistribution
+from app.calculations.simulation import simulate_assembly_fulfillments
+from app.utils.config import ConfigContext
 from app.utils.qc_strategy import QcStrategy
-from app.utils.requests import get_tolerances, get_fulfillment_axis_range, parse_array_as_hist
+from app.utils.requests import parse_array_as_hist
 from app.utils.types import Histogram
 
 
-def convolution(distributions):
+# maximum size of the (partial) cartesian products that are materialized at once
+CONVOLUTION_MEMORY_BUDGET = 64 * 2 ** 20
+
+
+def iter_convolution(distributions: List[List[float]],
+                     memory_budget: int = CONVOLUTION_MEMORY_BUDGET) -> Iterator[np.ndarray]:
+    """
+    Calculates the sums of the cartesian product from all distributions in chunks.
+
+    Parameters
+    ----------
+    distributions
+        list of distributions
+    memory_budget
+        maximum number of bytes of a single chunk (at least one value per chunk).
+
+    Returns
+    -------
+    Iterator[np.ndarray]
+        chunks of the convolution, which concatenated are in the order of itertools.product.
+    """
+    arrays = [np.asarray(distribution) for distribution in distributions]
+    chunk_size = max(1, memory_budget // max(1, max(array.itemsize for array in arrays)))
+    return _iter_sums(arrays, chunk_size)
+
+
+def _iter_sums(arrays: List[np.ndarray], chunk_size: int) -> Iterator[np.ndarray]:
+    if len(arrays) == 1:
+        for i in range(0, len(arrays[0]), chunk_size):
+            yield arrays[0][i:i + chunk_size]
+        return
+
+    rest_size = int(np.prod([len(array) for array in arrays[1:]]))
+    if rest_size <= chunk_size:
+        # materialize the sums of all other distributions once, and add chunks of rows of the first distribution
+        rest = reduce(np.add.outer, arrays[1:]).ravel()
+        rows = max(1, chunk_size // max(1, rest_size))
+        for i in range(0, len(arrays[0]), rows):
+            yield np.add.outer(arrays[0][i:i + rows], rest).ravel()
+    else:
+        # the sums of all other distributions are too large as well -> stream them for every single value
+        for value in arrays[0]:
+            for chunk in _iter_sums(arrays[1:], chunk_size):
+                yield value + chunk
+
+
+def convolution(distributions: List[List[float]], memory_budget: int = CONVOLUTION_MEMORY_BUDGET) -> List[float]:
     """
     Calculates the cartesian product from all distributions.
 
@@ -22,21 +71,21 @@ def convolution(distributions):
     ----------
     distributions
         list of distributions
+    memory_budget
+        maximum number of bytes of the intermediate chunks, see iter_convolution.
 
     Returns
     -------
     list
-        the convolution
+        the convolution, i.e. the sum of every combination of values in the order of itertools.product.
     """
-    # https://stackoverflow.com/a/46744050/14094743
-    cartesian_product_index = pd.MultiIndex.from_product(distributions)
-    cartesian_product_df = pd.DataFrame(index=cartesian_product_index).reset_index(drop=True)
-    # Calculate the sum of each row
-    conv = cartesian_product_df.sum(axis=1).tolist()
-    return conv
+    chunks = list(iter_convolution(distributions, memory_budget))
+    if len(chunks) == 0:
+        return []
+    return np.concatenate(chunks).tolist()
 
 
-def convolution2d(histograms):
+def convolution2d(histograms: List[Dict[str, Any]], memory_budget: int = CONVOLUTION_MEMORY_BUDGET) -> Dict[str, Any]:
     """
     Calculates the cartesian product from all histograms.
 
@@ -44,25 +93,32 @@ def convolution2d(histograms):
     ----------
     histograms
         list of histograms (with x and y values)
+    memory_budget
+        maximum number of bytes of the cartesian product of two histograms that is materialized at once.
 
     Returns
     -------
     dict
         the convolution
     """
-    convolution = histograms.pop(0)
-    for histogram in histograms:
-        x_prod = product(convolution["x"], histogram["x"])
-        y_prod = product(convolution["y"], histogram["y"])
-        df = pd.DataFrame((x + y for x, y in zip(x_prod, y_prod)))
-        df[4] = df[0] + df[1]
-        df[5] = df[2] * df[3]
-        df = df[[4, 5]].groupby(4).sum().reset_index()
-        convolution = {"x": df[4].values, "y": df[5].values}
-    return convolution
-
-
-def pdf_with_boundary(distribution: rv_continuous, grid: np.ndarray) -> np.ndarray:
+    x, y = np.asarray(histograms[0]["x"]), np.asarray(histograms[0]["y"])
+    for histogram in histograms[1:]:
+        other_x, other_y = np.asarray(histogram["x"]), np.asarray(histogram["y"])
+        # number of rows of the current convolution that are combined with the other histogram at once
+        rows = max(1, memory_budget // max(1, len(other_x) * (x.itemsize + y.itemsize)))
+
+        conv_x, conv_y = np.array([], dtype=np.result_type(x, other_x)), np.array([], dtype=np.result_type(y, other_y))
+        for i in range(0, len(x), rows):
+            chunk_x = np.add.outer(x[i:i + rows], other_x).ravel()
+            chunk_y = np.multiply.outer(y[i:i + rows], other_y).ravel()
+            # combine equal x values of the chunk and the previous chunks
+            conv_x, inverse = np.unique(np.concatenate([conv_x, chunk_x]), return_inverse=True)
+            conv_y = np.bincount(inverse.ravel(), weights=np.concatenate([conv_y, chunk_y]), minlength=len(conv_x))
+        x, y = conv_x, conv_y
+    return {"x": x, "y": y}
+
+
+def pdf_with_boundary(distribution: Union[rv_continuous, HistogramDistribution], grid: np.ndarray) -> np.ndarray:
     """
     Calculates the discrete probability function for a grid.
 
@@ -97,7 +153,85 @@ def pdf_with_boundary(distribution: rv_continuous, grid: np.ndarray) -> np.ndarr
     return pdf
 
 
-def convolve_with_boundary(distributions: List[rv_continuous], boundary: Tuple[float, float], bins: int) -> Histogram:
+def discrete_grid(boundary: Tuple[float, float], bins: int) -> np.ndarray:
+    """
+    Creates a discrete grid of class centers from the given boundary.
+
+    Parameters
+    ----------
+    boundary
+        lower and upper boundary.
+    bins
+        number of bins.
+
+    Returns
+    -------
+    np.ndarray
+        class centers of the grid.
+    """
+    delta = (boundary[1] - boundary[0]) / bins
+    boundary_center = (boundary[0] + delta / 2, boundary[1] - delta / 2)
+    grid = np.arange(boundary_center[0], boundary_center[1], delta)
+    if boundary_center[1] - grid[-1] > delta / 2:
+        grid = np.concatenate([grid, np.array([boundary_center[1]])])
+    assert len(grid) == bins
+    return grid
+
+
+def convolve_fft(pdfs: np.ndarray) -> np.ndarray:
+    """
+    Convolves k discrete probability functions at once by multiplying their (zero-padded) spectra.
+
+    Parameters
+    ----------
+    pdfs
+        array of shape (..., k, bins), where the last two axes contain the probability functions
+        that should be convolved with each other.
+
+    Returns
+    -------
+    np.ndarray
+        array of shape (..., k * (bins - 1) + 1) with the full (not clamped) convolution.
+    """
+    k, bins = pdfs.shape[-2:]
+    n = k * (bins - 1) + 1
+    n_fft = next_fast_len(n, real=True)
+    spectrum = np.prod(rfft(pdfs, n_fft, axis=-1), axis=-2)
+    conv_pdf = irfft(spectrum, n_fft, axis=-1)[..., :n]
+    # remove tiny negative values caused by floating point rounding
+    return np.maximum(conv_pdf, 0)
+
+
+def clamp_to_boundary(conv_pdf: np.ndarray, k: int, bins: int) -> np.ndarray:
+    """
+    Sums up everything outside the original boundary of a full k-way convolution
+    and adds the result to the border classes.
+
+    Parameters
+    ----------
+    conv_pdf
+        array of shape (..., k * (bins - 1) + 1) with the full convolution of k probability functions,
+        each with an odd number of bins centered around zero.
+    k
+        number of convolved probability functions.
+    bins
+        number of bins of each probability function.
+
+    Returns
+    -------
+    np.ndarray
+        array of shape (..., bins) with the clamped convolution.
+    """
+    # the center of the full convolution is at k * (bins - 1) / 2, the center of the result at (bins - 1) / 2
+    offset = (k - 1) * (bins - 1) // 2
+    result = conv_pdf[..., offset:offset + bins].copy()
+    result[..., 0] += conv_pdf[..., :offset].sum(axis=-1)
+    result[..., -1] += conv_pdf[..., offset + bins:].sum(axis=-1)
+    return result
+
+
+def convolve_with_boundary(distributions: List[Union[rv_continuous, HistogramDistribution]], boundary: Tuple[float, float], bins: int,
+                           method: str = "direct") -> Histogram:
     """
     Convolves multiple continuous distributions by discretizing them into a grid,
     specified by the given boundary and bin number.
@@ -117,6 +251,9 @@ def convolve_with_boundary(distributions: List[rv_continuous], boundary: Tuple[f
         lower and upper boundary.
     bins
         number of bins, which determines both the grid size and returned histogram.
+    method
+        "direct" convolves the distributions pairwise and clamps the result to the boundary after every step.
+        "fft" convolves all distributions at once and clamps the result only once, see convolve_with_boundary_batched.
 
     Returns
     -------
@@ -124,14 +261,14 @@ def convolve_with_boundary(distributions: List[rv_continuous], boundary: Tuple[f
         y and x axis of the histogram.
 
     """
+    if method == "fft":
+        return convolve_with_boundary_batched([distributions], [boundary], bins)[0]
+    if method != "direct":
+        raise BadRequest(f"unsupported convolution method {method}")
+
     # create a discrete grid from the boundaries
     # note that we need to convert to class centers
-    delta = (boundary[1] - boundary[0]) / bins
-    boundary_center = (boundary[0] + delta / 2, boundary[1] - delta / 2)
-    grid = np.arange(boundary_center[0], boundary_center[1], delta)
-    if boundary_center[1] - grid[-1] > delta / 2:
-        grid = np.concatenate([grid, np.array([boundary_center[1]])])
-    assert len(grid) == bins
+    grid = discrete_grid(boundary, bins)
 
     # calculate probability densities for the discrete grid
     pdfs = [pdf_with_boundary(dist, grid) for dist in distributions]
@@ -152,15 +289,57 @@ def convolve_with_boundary(distributions: List[rv_continuous], boundary: Tuple[f
         return conv_pdf, grid
 
 
-def qc_convolution(current_config: str, distributions: List[pd.DataFrame], qc: Optional[QcStrategy], bins: int,
-                   weights: Optional[List[float]]) -> List[Histogram]:
+def convolve_with_boundary_batched(distributions: List[List[rv_continuous]], boundaries: List[Tuple[float, float]],
+                                   bins: int) -> List[Histogram]:
+    """
+    Convolves multiple continuous distributions for every test point at once, using the FFT
+    (the product of the zero-padded spectra of all discrete probability functions).
+    The boundary clamp is applied in a single pass after all distributions are convolved.
+
+    For two distributions, the result is equal to convolve_with_boundary(method="direct")
+    up to floating point rounding (absolute deviation per class below 1e-12).
+    For more distributions, the pairwise method already clamps intermediate results, so that
+    probability outside the boundary is convolved again from the border classes. Both results then
+    differ by at most the probability that lies outside the boundary in an intermediate step,
+    and only in classes next to the border.
+
+    As the clamp requires a grid centered around zero, an even number of bins falls back to the pairwise method.
+
+    Parameters
+    ----------
+    distributions
+        for every test point, a list of probability distributions.
+        All test points must have the same number of distributions.
+    boundaries
+        for every test point, the lower and upper boundary.
+    bins
+        number of bins, which determines both the grid size and returned histograms.
+
+    Returns
+    -------
+    List[Histogram]
+        for every test point, y and x axis of the histogram.
+    """
+    if bins % 2 == 0:
+        return [convolve_with_boundary(dists, boundary, bins) for dists, boundary in zip(distributions, boundaries)]
+
+    grids = [discrete_grid(boundary, bins) for boundary in boundaries]
+    # calculate probability densities for the discrete grids, shape (test points, distributions, bins)
+    pdfs = np.array([[pdf_with_boundary(dist, grid) for dist in dists] for dists, grid in zip(distributions, grids)])
+
+    conv_pdfs = clamp_to_boundary(convolve_fft(pdfs), pdfs.shape[1], bins)
+    return [(conv_pdf, bins_boundaries(grid)) for conv_pdf, grid in zip(conv_pdfs, grids)]
+
+
+def qc_convolution(current_config: ConfigContext, distributions: List[pd.DataFrame], qc: Optional[QcStrategy], bins: int,
+                   weights: Optional[List[float]], cache: Optional[FulfillmentCache] = None) -> List[Histogram]:
     """
     Calculates the convolution of multiple distributions for a given quality strategy.
 
     Parameters
     ----------
     current_config
-        name of the configuration that should be used for the functional model.
+        context of the configuration that should be used for the functional model.
     distributions
         characteristic values for each component.
     qc
@@ -169,35 +348,40 @@ def qc_convolution(current_config: str, distributions: List[pd.DataFrame], qc: O
         number of bins for the resulting histogram.
     weights
         list of weights if the weighted test point should be calculated as well.
+    cache
+        fulfillments and histograms of data frames that are convoluted several times, e.g. the klts of a request.
 
     Returns
     -------
     List[Histogram]
         for every test point, a numpy histogram.
     """
-    tolerances = get_tolerances(current_config)
-    boundaries = get_fulfillment_axis_range(tolerances, bins)
+    boundaries = current_config.axis_range(bins)
+    if cache is None:
+        cache = FulfillmentCache()
 
     convolutions = []
     if qc is None:
-        fulfillments = [get_batch_function(component, current_config) for component in distributions]
+        histograms = [list(cache.histograms(component, current_config, bins)) for component in distributions]
 
         if weights:
             # weighted test point
-            for fulfillment in fulfillments:
-                fulfillment[len(fulfillment.columns)] = np.average(fulfillment, weights=weights, axis=1)
+            for component, component_histograms in zip(distributions, histograms):
+                weighted = np.average(cache.get(component, current_config), weights=weights, axis=1)
+                component_histograms.append(parse_array_as_hist(weighted, bins, boundaries[len(weights)]))
 
         # do a statistical convolution
-        for test_point in range(len(fulfillments[0].columns)):
-            distributions = [
-                parse_array_as_hist(fulfillment[fulfillment.columns[test_point]], bins, boundaries[test_point])
-                for fulfillment in fulfillments]
+        for test_point in range(len(histograms[0])):
             # convolution of all distributions
-            convolutions.append(convolve_with_boundary(distributions, boundaries[test_point], bins))
+            convolutions.append(convolve_with_boundary([component_histograms[test_point] for component_histograms in
+                                                        histograms], boundaries[test_point], bins))
     else:
         # simulate the quality control strategy
-        # noinspection PyTypeChecker
-        distributions, _ = simulate_assembly(qc, distributions[0], distributions[1], current_config)
+        assert len(distributions[0]) == len(distributions[1]), f"{len(distributions[0])} != {len(distributions[1])}"
+        result, _ = simulate_assembly_fulfillments(qc, cache.get(distributions[0], current_config).to_numpy(),
+                                                   cache.get(distributions[1], current_config).to_numpy(),
+                                                   current_config)
+        distributions = pd.DataFrame(result)
         # create histograms for every test point
         for test_point in range(len(distributions.columns)):
             histogram = np.histogram(distributions[distributions.columns[test_point]], bins=bins,
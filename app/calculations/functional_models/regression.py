@@ -1,4 +1,5 @@
-from typing import List, Dict
+import functools
+from typing import List, Dict, Tuple
 
 import numpy as np
 import pandas as pd
@@ -6,6 +7,136 @@ from werkzeug.exceptions import BadRequest
 
 from app.utils.types import Component
 
+# number of column orders whose coefficients and means are kept by a model
+COMPILE_CACHE_SIZE = 64
+
+
+class LinearRegressionModel:
+    """
+    A linear regression model, compiled into a coefficient matrix and a mean vector.
+
+    The fulfillments of all entries and test points are calculated at once as (X - mu) @ C.
+    Coefficients and means are selected once per order of the characteristic values of the model,
+    for the COMPILE_CACHE_SIZE most recently used orders.
+    """
+
+    def __init__(self, functional_model: Dict[str, List[float]], means: Dict[str, float]):
+        self.coef_names = list(functional_model.keys())
+        self.n_points = len(functional_model[self.coef_names[0]])
+        self._functional_model = functional_model
+        self._means = means
+        # the model lives as long as the app, so only a bounded number of column orders is kept
+        self._compile_specified = functools.lru_cache(maxsize=COMPILE_CACHE_SIZE)(self._select)
+
+    def __getstate__(self) -> Dict:
+        # the cache is not picklable, e.g. to send the model to a worker process
+        state = dict(self.__dict__)
+        del state["_compile_specified"]
+        return state
+
+    def __setstate__(self, state: Dict):
+        self.__dict__.update(state)
+        self._compile_specified = functools.lru_cache(maxsize=COMPILE_CACHE_SIZE)(self._select)
+
+    def compile(self, columns: List[str]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """
+        Selects the coefficients and means for the given characteristic values.
+
+        Parameters
+        ----------
+        columns
+            names of the characteristic values in the order they are supplied.
+
+        Returns
+        -------
+        List[str]
+            names of the characteristic values that are part of the model.
+        np.ndarray
+            mean vector with one entry per selected characteristic value.
+        np.ndarray
+            coefficient matrix, where the rows represent the selected characteristic values
+            and the columns represent the test points.
+
+        Raises
+        ------
+        BadRequest
+            if none of the characteristic values is part of the model.
+        """
+        # the cache is keyed by the characteristic values of the model only, the other columns are ignored
+        specified_values = tuple(column for column in columns if column in self._functional_model)
+        if len(specified_values) == 0:
+            raise BadRequest(f"No functional values specified!")
+        return self._compile_specified(specified_values)
+
+    def _select(self, specified_values: Tuple[str, ...]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        means = np.array([self._means[name] for name in specified_values], dtype=np.float64)
+        coefficients = np.array([self._functional_model[name] for name in specified_values], dtype=np.float64)
+        return list(specified_values), means, np.ascontiguousarray(coefficients)
+
+    def calculate_array(self, values: np.ndarray, columns: List[str]) -> np.ndarray:
+        """
+        Calculates the linear function of multiple values at once.
+
+        Parameters
+        ----------
+        values
+            a 2d array where the columns represent the characteristic values and each row is a single entry.
+        columns
+            names of the characteristic values of each column.
+
+        Returns
+        -------
+        np.ndarray
+            a 2d array where each column y represents a test point and each row x represents the functional
+            fulfillment of the x-th entry and the y-th test point.
+        """
+        specified_values, means, coefficients = self.compile(columns)
+        if len(specified_values) != len(columns):
+            values = values[:, [columns.index(name) for name in specified_values]]
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        # calculate the sum-product as follows:
+        # (characteristicValue_1 - mu) * coef_1 + ... + (characteristicValue_n - mu) * coef_n
+        return (values - means) @ coefficients
+
+    def calculate_batch(self, characteristic_values: pd.DataFrame) -> pd.DataFrame:
+        """
+        Calculates the linear function of multiple values at once.
+
+        Parameters
+        ----------
+        characteristic_values
+            a pandas data frame where the columns represent the characteristic values and each row is a single entry.
+
+        Returns
+        -------
+        pd.DataFrame
+            a pandas data frame where each column y represents a test point and each row x represents the functional
+            fulfillment of the x-th entry and the y-th test point.
+        """
+        columns = list(characteristic_values.columns)
+        specified_values, _, _ = self.compile(columns)
+        # filter data to only calculate the fulfillment of the specified values
+        values = characteristic_values[specified_values].to_numpy(dtype=np.float64)
+        return pd.DataFrame(self.calculate_array(values, specified_values))
+
+    def calculate(self, characteristic_values: Component) -> List[float]:
+        """
+        Calculates the linear function for a single item.
+
+        Parameters
+        ----------
+        characteristic_values
+            a dictionary where the keys represent the characteristic values.
+
+        Returns
+        -------
+        List[float]
+            the functional fulfillment of the item for each test point.
+        """
+        columns = list(characteristic_values.keys())
+        values = np.array([list(characteristic_values.values())], dtype=np.float64)
+        return self.calculate_array(values, columns)[0].tolist()
+
 
 def calculate_batch(characteristic_values: pd.DataFrame, functional_model: Dict[str, List[float]],
                     means: Dict[str, float]) -> pd.DataFrame:
@@ -28,29 +159,7 @@ def calculate_batch(characteristic_values: pd.DataFrame, functional_model: Dict[
         a pandas data frame where each column y represents a test point and each row x represents the functional
         fulfillment of the x-th entry and the y-th test point.
     """
-    coef_names = list(functional_model.keys())
-    n_points = len(functional_model[coef_names[0]])
-    result = pd.DataFrame(np.empty((len(characteristic_values), n_points)))
-
-    # create an intersection between the saved config values and the request values
-    # and sort the resulting specified_values list
-    specified_values = list(set(coef_names).intersection(characteristic_values.columns))
-    if len(specified_values) == 0:
-        raise BadRequest(f"No functional values specified!")
-    # filter data to only calculate the fulfillment of the specified values
-    characteristic_values = characteristic_values[specified_values]
-    # make means the same order as characteristic values.
-    means = [means[key] for key in characteristic_values.keys()]
-
-    # calculate fulfillment values for each test point
-    for i in range(n_points):
-        # order the coefficients alphabetically so that the order matches with the
-        # order of columns in the characteristic_values data frame
-        coeffs = [functional_model[key][i] for key in characteristic_values.keys()]
-        # calculate the sum-product as follows:
-        # (characteristicValue_1 - mu) * coef_1 + ... + (characteristicValue_n - mu) * coef_n
-        result.iloc[:, i] = ((characteristic_values - means) * coeffs).sum(axis=1)
-    return result
+    return LinearRegressionModel(functional_model, means).calculate_batch(characteristic_values)
 
 
 def calculate(characteristic_values: Component, functional_model: Dict[str, List[float]],
@@ -73,20 +182,4 @@ def calculate(characteristic_values: Component, functional_model: Dict[str, List
     List[float]
         the functional fulfillment of the item for each test point.
     """
-    coef_names = list(functional_model.keys())
-    n_points = len(functional_model[coef_names[0]])
-
-    # make means the same order as characteristic values.
-    means = np.array([means[key] for key in characteristic_values.keys()])
-    characteristic_values_arr = np.array(list(characteristic_values.values()))
-
-    result = []
-    # calculate fulfillment values for each test point
-    for i in range(n_points):
-        # order the coefficients alphabetically so that the order matches with the
-        # order of columns in the characteristic_values data frame
-        coeffs = np.array([functional_model[key][i] for key in characteristic_values.keys()])
-        # calculate the sum-product as follows:
-        # (characteristicValue_1 - mu) * coef_1 + ... + (characteristicValue_n - mu) * coef_n
-        result.append(((characteristic_values_arr - means) * coeffs).sum())
-    return result
+    return LinearRegressionModel(functional_model, means).calculate(characteristic_values)
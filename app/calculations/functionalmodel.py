@@ -1,15 +1,41 @@
-from typing import List
+from typing import List, Dict, Tuple, Any
 
 import numpy as np
 import pandas as pd
-from flask import current_app as app
 from werkzeug.exceptions import BadRequest
 
 from app.calculations.functional_models import regression
+from app.calculations.math import HistogramDistribution
+from app.utils.config import ConfigContext
+from app.utils.requests import parse_array_as_hist
 from app.utils.types import Component
 
 
-def get_batch_function(characteristic_values: pd.DataFrame, config: str, weighted: bool = False) -> pd.DataFrame:
+def get_model(config: ConfigContext) -> regression.LinearRegressionModel:
+    """
+    Returns the compiled functional model of the given configuration.
+
+    Parameters
+    ----------
+    config
+        context of the configuration that should be used for the functional model.
+
+    Returns
+    -------
+    regression.LinearRegressionModel
+        the compiled functional model.
+
+    Raises
+    ------
+    BadRequest
+        if the configuration does not support a functional model.
+    """
+    if config.model is None:
+        raise BadRequest("unsupported configuration " + config.name)
+    return config.model
+
+
+def get_batch_function(characteristic_values: pd.DataFrame, config: ConfigContext, weighted: bool = False) -> pd.DataFrame:
     """
     Calculates the functional fulfillment of the given characteristic values.
 
@@ -18,7 +44,7 @@ def get_batch_function(characteristic_values: pd.DataFrame, config: str, weighte
     characteristic_values
         a pandas data frame where the columns represent the characteristic values and each row is a single entry.
     config
-        name of the configuration that should be used for the functional model.
+        context of the configuration that should be used for the functional model.
     weighted
         True if another column should be returned with a weighted fulfillment over all test points.
 
@@ -28,21 +54,16 @@ def get_batch_function(characteristic_values: pd.DataFrame, config: str, weighte
         a pandas data frame where each column y represents a test point and each row x represents the functional
         fulfillment of the x-th entry and the y-th test point.
     """
-    means = app.config[config]["MeanValues"]
-    if config == "test" or config == "dummy":
-        functional_model = app.config[config]["FunctionalModel"]
-        result = regression.calculate_batch(characteristic_values, functional_model, means)
-    else:
-        raise BadRequest("unsupported configuration " + config)
+    result = get_model(config).calculate_batch(characteristic_values)
     if weighted:
         # calculate weighted test point
-        weights = app.config[config]["TestPointWeights"]
+        weights = config.weights
         result["weighted"] = np.average(result, weights=weights, axis=1)
 
     return result
 
 
-def get_function(characteristic_values: Component, config: str, weighted: bool = False) -> List[float]:
+def get_function(characteristic_values: Component, config: ConfigContext, weighted: bool = False) -> List[float]:
     """
     Calculates the functional fulfillment of the given characteristic values.
 
@@ -51,7 +72,7 @@ def get_function(characteristic_values: Component, config: str, weighted: bool =
     characteristic_values
         a dictionary where the columns represent the characteristic values and each row is a single entry.
     config
-        name of the configuration that should be used for the functional model.
+        context of the configuration that should be used for the functional model.
     weighted
         True if another column should be returned with a weighted fulfillment over all test points.
 
@@ -60,15 +81,109 @@ def get_function(characteristic_values: Component, config: str, weighted: bool =
     List[float]
         the functional fulfillment of the item for each test point.
     """
-    means = app.config[config]["MeanValues"]
-    if config == "test" or config == "dummy":
-        functional_model = app.config[config]["FunctionalModel"]
-        result = regression.calculate(characteristic_values, functional_model, means)
-    else:
-        raise BadRequest("unsupported configuration " + config)
+    result = get_model(config).calculate(characteristic_values)
     if weighted:
         # calculate weighted test point
-        weights = app.config[config]["TestPointWeights"]
+        weights = config.weights
         result.append(np.average(result, weights=weights))
 
     return result
+
+
+class FulfillmentCache:
+    """
+    Functional fulfillments of data frames (e.g. klts and batches) that are used several times during a request,
+    and the histograms of their test points.
+
+    The entries are keyed by the identity of the data frames, which are kept alive by the cache, so their ids
+    cannot be reused. When the cache is pickled (e.g. sent to a worker process together with the data frames),
+    it is rekeyed by the ids of the unpickled data frames.
+    """
+
+    def __init__(self):
+        # data frame, its fulfillment and its histograms for every number of bins
+        self._entries: Dict[int, Tuple[pd.DataFrame, pd.DataFrame, Dict[int, List[HistogramDistribution]]]] = {}
+
+    def get(self, characteristic_values: pd.DataFrame, config: ConfigContext) -> pd.DataFrame:
+        """
+        Calculates the functional fulfillment (see get_batch_function) once per data frame.
+        The returned data frame is shared and must not be modified.
+        """
+        return self._entry(characteristic_values, config)[1]
+
+    def histograms(self, characteristic_values: pd.DataFrame, config: ConfigContext,
+                   bins: int) -> List[HistogramDistribution]:
+        """
+        Calculates the histogram of the functional fulfillment of every test point once per data frame
+        and number of bins, within the axis range of the test point.
+        """
+        _, fulfillments, histograms = self._entry(characteristic_values, config)
+        if bins not in histograms:
+            axis_range = config.axis_range(bins)
+            histograms[bins] = [parse_array_as_hist(fulfillments[column], bins, axis_range[test_point])
+                                for test_point, column in enumerate(fulfillments.columns)]
+        return histograms[bins]
+
+    def add(self, characteristic_values: pd.DataFrame, fulfillments: pd.DataFrame):
+        """
+        Adds an already calculated functional fulfillment, e.g. a view of the fulfillments of a whole component
+        (see ComponentBatches).
+        """
+        self._entries[id(characteristic_values)] = (characteristic_values, fulfillments, {})
+
+    def discard(self, characteristic_values: pd.DataFrame):
+        """
+        Removes the entry of a data frame that is not used anymore, if any.
+        """
+        self._entries.pop(id(characteristic_values), None)
+
+    def subset(self, frames: List[pd.DataFrame]) -> "FulfillmentCache":
+        """
+        Returns
+        -------
+        FulfillmentCache
+            a cache with the entries of the given data frames only, e.g. to send it to a worker process.
+        """
+        subset = FulfillmentCache()
+        subset._entries = {id(frame): self._entries[id(frame)] for frame in frames if id(frame) in self._entries}
+        return subset
+
+    def _entry(self, characteristic_values: pd.DataFrame,
+               config: ConfigContext) -> Tuple[pd.DataFrame, pd.DataFrame, Dict[int, List[HistogramDistribution]]]:
+        entry = self._entries.get(id(characteristic_values))
+        if entry is None:
+            entry = (characteristic_values, get_batch_function(characteristic_values, config), {})
+            self._entries[id(characteristic_values)] = entry
+        return entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __getstate__(self) -> List[Tuple[pd.DataFrame, pd.DataFrame, Dict[int, List[HistogramDistribution]]]]:
+        return list(self._entries.values())
+
+    def __setstate__(self, state: List[Tuple[pd.DataFrame, pd.DataFrame, Dict[int, List[HistogramDistribution]]]]):
+        self._entries = {id(entry[0]): entry for entry in state}
+
+
+def get_cached_batch_function(characteristic_values: pd.DataFrame, settings_dict: Dict[str, Any]) -> pd.DataFrame:
+    """
+    Calculates the functional fulfillment of the given characteristic values (see get_batch_function),
+    or returns it from the fulfillment cache of the settings ("fulfillments"), if any.
+    """
+    cache = settings_dict.get("fulfillments")
+    if cache is None:
+        return get_batch_function(characteristic_values, settings_dict["config"])
+    return cache.get(characteristic_values, settings_dict["config"])
+
+
+def get_cached_histograms(characteristic_values: pd.DataFrame,
+                          settings_dict: Dict[str, Any]) -> List[HistogramDistribution]:
+    """
+    Calculates the histograms of the functional fulfillment of every test point (with the number of bins
+    of the settings), or returns them from the fulfillment cache of the settings ("fulfillments"), if any.
+    """
+    cache = settings_dict.get("fulfillments")
+    if cache is None:
+        cache = FulfillmentCache()
+    return cache.histograms(characteristic_values, settings_dict["config"], settings_dict["bins"])
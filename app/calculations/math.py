@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Union, Tuple
+from typing import Union, Tuple, Iterator
 
 import numpy as np
 from scipy.stats import rv_continuous
@@ -49,6 +49,71 @@ class AnyDistribution:
         return AnyDistribution(distribution.mean(), distribution.std())
 
 
+class HistogramDistribution:
+    """
+    Lightweight distribution given by a histogram, computed directly from its bin edges and probabilities.
+
+    Behaves like scipy.stats.rv_histogram (the histogram is assumed to be proportional to a density),
+    but only supports mean, var, std, pdf, cdf and ppf and does not create a scipy distribution.
+    It can also be unpacked into y and x axis like a Histogram tuple.
+    """
+    __slots__ = ("_y", "_x", "_pdf", "_cdf", "_mean", "_var")
+
+    def __init__(self, histogram: Histogram):
+        y, x = histogram
+        self._y = np.asarray(y, dtype=np.float64)
+        self._x = np.asarray(x, dtype=np.float64)
+        assert len(self._y) + 1 == len(self._x), f"{len(self._y)} + 1 != {len(self._x)}"
+        widths = self._x[1:] - self._x[:-1]
+        self._pdf = self._y / float(np.sum(self._y * widths))
+        self._cdf = np.concatenate([[0.0], np.cumsum(self._pdf * widths)])
+        self._mean = None
+        self._var = None
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        yield self._y
+        yield self._x
+
+    def _moment(self, n: int) -> float:
+        """
+        Computes the n-th non-central moment.
+        """
+        integrals = (self._x[1:] ** (n + 1) - self._x[:-1] ** (n + 1)) / (n + 1)
+        return float(np.sum(self._pdf * integrals))
+
+    def mean(self) -> float:
+        if self._mean is None:
+            self._mean = self._moment(1)
+        return self._mean
+
+    def var(self) -> float:
+        if self._var is None:
+            self._var = self._moment(2) - self.mean() ** 2
+        return self._var
+
+    def std(self) -> float:
+        return float(np.sqrt(self.var()))
+
+    def pdf(self, x: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """
+        Stepwise probability density, zero outside the histogram.
+        """
+        padded = np.concatenate([[0.0], self._pdf, [0.0]])
+        return padded[np.searchsorted(self._x, x, side="right")]
+
+    def cdf(self, x: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """
+        Cumulative distribution, linearly interpolated between the bin edges.
+        """
+        return np.interp(x, self._x, self._cdf)
+
+    def ppf(self, q: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """
+        Quantile function (inverse of the cdf).
+        """
+        return np.interp(q, self._cdf, self._x)
+
+
 def normalized_mean(distribution: np.ndarray, lower_tolerance: float, upper_tolerance: float):
     return distribution.mean() / (upper_tolerance - lower_tolerance)
 
@@ -59,8 +124,8 @@ def normalized_mean_std(distribution: np.ndarray, lower_tolerance: float, upper_
     )
 
 
-def cpk(distribution: Union[AnyDistribution, rv_continuous, np.ndarray], lower_tolerance: float,
-        upper_tolerance: float):
+def cpk(distribution: Union[AnyDistribution, HistogramDistribution, rv_continuous, np.ndarray],
+        lower_tolerance: float, upper_tolerance: float):
     mean = distribution.mean()
     std = distribution.std()
     return min((upper_tolerance - mean), (mean - lower_tolerance)) / (3 * std)
@@ -1,21 +1,32 @@
-from itertools import permutations
-from typing import List, Callable, Any, Tuple
+from typing import List, Tuple, Dict, Any, Optional
 
 import numpy as np
+from scipy.optimize import linear_sum_assignment
 from tqdm import tqdm
 
+# default maximum number of explored nodes of the branch and bound search
+DEFAULT_NODE_BUDGET = 100000
+# the brute force search checks for a cancellation every this many nodes
+BRUTE_FORCE_CHECK_INTERVAL = 10000
 
-def brute_force(arrays: Tuple[List[any], List[any]], scalar_function: Callable[[Any, Any], float]) -> Tuple[
-    List[int], List[float]]:
+
+def brute_force(costs: np.ndarray, progress: Optional[Any] = None) -> Tuple[List[int], List[float]]:
     """
     Uses brute-force optimization to find the best allocation with a minimal scalar value.
 
+    The allocations are enumerated lazily in lexicographic order (depth first, one row after another),
+    so that the memory does not grow with the number of permutations. The sum of the allocated rows is kept
+    while descending, and a partial allocation is aborted as soon as it cannot beat the best allocation,
+    even if all remaining rows got their minimum.
+
     Parameters
     ----------
-    arrays
-        two different lists, whose elements should be evaluated against each other.
-    scalar_function
-        function which evaluates two given values and returns a scalar.
+    costs
+        matrix where the entry (i, j) is the scalar value of allocating the j-th element to the i-th element.
+        Must not have more rows than columns.
+    progress
+        progress of the calculation (see app.utils.jobs.Progress), if any. Every allocation of the first row
+        is reported as a step, and a cancellation is checked every BRUTE_FORCE_CHECK_INTERVAL nodes.
 
     Returns
     -------
@@ -24,26 +35,179 @@ def brute_force(arrays: Tuple[List[any], List[any]], scalar_function: Callable[[
     List[float]
         optimal scalar value.
     """
-    n_batches_a = len(arrays[0])
-    n_batches_b = len(arrays[1])
+    n_rows, n_cols = costs.shape
+    assert n_rows <= n_cols, f"{n_rows} > {n_cols}"
+    rows = np.arange(n_rows)
+    # the lowest possible sum of the rows i, ..., n_rows - 1 (the values may be negative)
+    remaining_minima = np.concatenate([np.cumsum(costs.min(axis=1)[::-1])[::-1], [0.]]).tolist() if n_cols else [0.]
+    cost_rows = costs.tolist()
+
     # Keep track of the best value and best permutation
-    best_val = [np.inf]
-    best_perm = list(range(n_batches_b))
-    # Iterate over all possible permutations
-
-    for perm_b in tqdm(list(permutations(best_perm))):
-        current_val = []
-        # Iterate over all allocations of the current permutation
-        for index_a, index_b in enumerate(perm_b):
-            if index_a >= n_batches_a:
-                break
-            val_a = arrays[0][index_a]
-            val_b = arrays[1][index_b]
-            scalar = scalar_function(val_a, val_b)
-            current_val.append(scalar)
-
-        # Check if current permutation is better then the previous ones
-        if sum(current_val) < sum(best_val):
-            best_val = current_val
-            best_perm = list(perm_b)[:n_batches_a]
-    return best_perm, best_val
+    best_sum = np.inf
+    best_perm = list(range(n_cols))[:n_rows]
+    perm: List[int] = []
+    used = [False] * n_cols
+    nodes = 0
+
+    def allocate_row(row: int, partial_sum: float):
+        nonlocal best_sum, best_perm, nodes
+        nodes += 1
+        if progress is not None and nodes % BRUTE_FORCE_CHECK_INTERVAL == 0:
+            # raises if the job has been cancelled
+            progress.update(0)
+        if row == n_rows:
+            # Check if current permutation is better then the previous ones
+            if partial_sum < best_sum:
+                best_sum = partial_sum
+                best_perm = perm.copy()
+            return
+        for col, value in enumerate(cost_rows[row]):
+            if used[col] or partial_sum + value + remaining_minima[row + 1] >= best_sum:
+                continue
+            used[col] = True
+            perm.append(col)
+            allocate_row(row + 1, partial_sum + value)
+            perm.pop()
+            used[col] = False
+
+    if n_rows == 0:
+        return [], []
+    if progress is not None:
+        progress.add_total(n_cols)
+    # progress of the allocations of the first row
+    for first_col in tqdm(range(n_cols)):
+        value = cost_rows[0][first_col]
+        if value + remaining_minima[1] < best_sum:
+            used[first_col] = True
+            perm.append(first_col)
+            allocate_row(1, value)
+            perm.pop()
+            used[first_col] = False
+        if progress is not None:
+            progress.update()
+    return best_perm, costs[rows, best_perm].tolist()
+
+
+def linear_assignment(costs: np.ndarray) -> Tuple[List[int], List[float]]:
+    """
+    Solves the linear assignment problem for the given (possibly rectangular) cost matrix in polynomial time.
+
+    Parameters
+    ----------
+    costs
+        matrix where the entry (i, j) is the scalar value of allocating the j-th element to the i-th element.
+        Must not have more rows than columns.
+
+    Returns
+    -------
+    List[int]
+        optimal allocation sequence.
+    List[float]
+        optimal scalar value.
+    """
+    assert costs.shape[0] <= costs.shape[1], f"{costs.shape[0]} > {costs.shape[1]}"
+    rows, cols = linear_sum_assignment(costs)
+    # rows are returned in ascending order and every row gets assigned
+    return cols.tolist(), costs[rows, cols].tolist()
+
+
+def branch_and_bound(costs: np.ndarray, node_budget: int = DEFAULT_NODE_BUDGET) -> \
+        Tuple[List[List[int]], List[float], Dict[str, Any]]:
+    """
+    Finds the allocation with a minimal scalar value of two or more components by branch and bound.
+
+    The i-th row (batch of the first component) is allocated at depth i of the search tree, to a tuple
+    of batches of all further components. Partial allocations are pruned by two lower bounds of the remaining rows:
+    the sum of their row minima and, if this does not prune, the linear assignment of the remaining rows to the
+    batches of the second component, where the cost of each pair is its minimum over all further components.
+    For two components the assignment bound is exact.
+    The search stops after the given number of nodes, then the allocation may not be optimal,
+    and the optimality gap is the difference to the smallest lower bound of all unexplored nodes.
+
+    Parameters
+    ----------
+    costs
+        tensor where the entry (i, j, k, ...) is the scalar value of allocating the j-th element of the second,
+        k-th element of the third, ... component to the i-th element of the first component.
+        Must not have more rows than any other dimension.
+    node_budget
+        maximum number of explored nodes.
+
+    Returns
+    -------
+    List[List[int]]
+        for every further component, the best found allocation sequence.
+    List[float]
+        scalar values of the best found allocation.
+    Dict[str, Any]
+        the value ("upper_bound") and "lower_bound" of the optimal allocation, their difference ("gap"),
+        the number of explored "nodes" and whether the allocation is proven "optimal".
+    """
+    n_rows = costs.shape[0]
+    assert all(n_rows <= size for size in costs.shape[1:]), f"{n_rows} > {costs.shape[1:]}"
+    n_components = costs.ndim - 1
+
+    def available(path: Tuple[Tuple[int, ...], ...]) -> List[np.ndarray]:
+        used = [set(indices) for indices in zip(*path)] if path else [set() for _ in range(n_components)]
+        return [np.array([index for index in range(size) if index not in used[component]], dtype=np.intp)
+                for component, size in enumerate(costs.shape[1:])]
+
+    def remaining_costs(depth: int, columns: List[np.ndarray]) -> np.ndarray:
+        # shape (remaining rows, available batches of the second component, ...)
+        return costs[np.ix_(np.arange(depth, n_rows), *columns)]
+
+    def assignment_bound(remaining: np.ndarray) -> float:
+        projected = remaining.reshape(remaining.shape[:2] + (-1,)).min(axis=2)
+        rows, cols = linear_sum_assignment(projected)
+        return float(projected[rows, cols].sum())
+
+    # initial allocation: the assignment relaxation, completed greedily for further components
+    best_path: Tuple[Tuple[int, ...], ...] = ()
+    root = remaining_costs(0, available(()))
+    projected = root.reshape(root.shape[:2] + (-1,))
+    _, first_cols = linear_sum_assignment(projected.min(axis=2))
+    for row, first_col in enumerate(first_cols):
+        columns = available(best_path)
+        others = costs[(row, first_col) + np.ix_(*columns[1:])] if n_components > 1 else None
+        rest = () if others is None else tuple(
+            int(columns[c + 1][index]) for c, index in enumerate(np.unravel_index(np.argmin(others), others.shape)))
+        best_path += ((int(first_col),) + rest,)
+    best = float(sum(costs[(row,) + indices] for row, indices in enumerate(best_path)))
+
+    # depth first search, every node is (lower bound of its parent, partial value, allocated tuples)
+    stack: List[Tuple[float, float, Tuple[Tuple[int, ...], ...]]] = [(-np.inf, 0., ())]
+    nodes = 0
+    while stack and nodes < node_budget:
+        _, partial, path = stack.pop()
+        nodes += 1
+        depth = len(path)
+        if depth == n_rows:
+            if partial < best:
+                best, best_path = partial, path
+            continue
+
+        columns = available(path)
+        remaining = remaining_costs(depth, columns)
+        if partial + remaining.reshape(len(remaining), -1).min(axis=1).sum() >= best:
+            continue
+        bound = partial + assignment_bound(remaining)
+        if bound >= best:
+            continue
+
+        # children in the order of their cost, the cheapest is explored first
+        row_costs = remaining[0].ravel()
+        for flat_index in np.argsort(row_costs)[::-1]:
+            indices = np.unravel_index(flat_index, remaining.shape[1:])
+            child = tuple(int(columns[c][index]) for c, index in enumerate(indices))
+            stack.append((bound, partial + float(row_costs[flat_index]), path + (child,)))
+
+    lower_bound = min([best] + [parent_bound for parent_bound, _, _ in stack])
+    permutations = [list(indices) for indices in zip(*best_path)] if best_path else [[] for _ in range(n_components)]
+    values = [float(costs[(row,) + indices]) for row, indices in enumerate(best_path)]
+    return permutations, values, {
+        "upper_bound": best,
+        "lower_bound": float(lower_bound),
+        "gap": best - float(lower_bound),
+        "nodes": nodes,
+        "optimal": not stack,
+    }
@@ -1,13 +1,15 @@
 from typing import List
 
 import numpy as np
-from scipy.optimize import linprog
-from werkzeug.exceptions import InternalServerError
+from scipy.optimize import linprog, linear_sum_assignment
+from scipy.sparse import coo_matrix
+from werkzeug.exceptions import InternalServerError, BadRequest
 
 
-def solve_allocation(main_fulfillments: np.ndarray, mating_fulfillments: np.ndarray) -> List[int]:
+def solve_allocation(main_fulfillments: np.ndarray, mating_fulfillments: np.ndarray,
+                     method: str = "assignment") -> List[int]:
     """
-    Solves the allocation problem using the simplex algorithm.
+    Solves the allocation problem, i.e. minimizes the sum of the absolute assembled fulfillments.
 
     Parameters
     ----------
@@ -15,30 +17,84 @@ def solve_allocation(main_fulfillments: np.ndarray, mating_fulfillments: np.ndar
         list of main fulfillment values (averaged and as a row-vector with dim=2).
     mating_fulfillments
         list of mating fulfillment values (averaged and as a row-vector with dim=2).
+    method
+        "assignment" solves the linear assignment problem on the cost matrix directly (O(n^3) time, O(n^2) memory),
+        "highs" solves the linear program with a sparse constraint matrix and the HiGHS backend,
+        "simplex" solves the linear program with a dense constraint matrix and the legacy simplex method.
 
     Returns
     -------
     List[int]
         index order for mating component.
     """
-    n = main_fulfillments.shape[1]
-    ones = np.ones((n, 1))
     # Cost matrix
-    F = main_fulfillments.T * ones + mating_fulfillments * ones.T
+    F = np.add.outer(main_fulfillments[0], mating_fulfillments[0])
+
+    if method == "assignment":
+        return solve_assignment(abs(F))
+    elif method == "highs":
+        return solve_linear_program(abs(F), sparse=True)
+    elif method == "simplex":
+        return solve_linear_program(abs(F), sparse=False)
+    else:
+        raise BadRequest(f"unsupported allocation method {method}")
+
+
+def solve_assignment(costs: np.ndarray) -> List[int]:
+    """
+    Solves the allocation problem as linear assignment problem.
+
+    Parameters
+    ----------
+    costs
+        square cost matrix, where the entry (i, j) are the costs of allocating mating component j to main component i.
+
+    Returns
+    -------
+    List[int]
+        index order for mating component.
+    """
+    _, cols = linear_sum_assignment(costs)
+    return cols.tolist()
+
+
+def solve_linear_program(costs: np.ndarray, sparse: bool = True) -> List[int]:
+    """
+    Solves the allocation problem as linear program with n^2 variables x_ij and 2n equality constraints.
+
+    Parameters
+    ----------
+    costs
+        square cost matrix, where the entry (i, j) are the costs of allocating mating component j to main component i.
+    sparse
+        true if the constraint matrix should be sparse and solved with HiGHS,
+        false if it should be dense and solved with the (legacy) simplex method.
+
+    Returns
+    -------
+    List[int]
+        index order for mating component.
+    """
+    n = costs.shape[0]
 
     # Simplex Parameters
-    c = abs(F.flatten())
-    A_eq = []
-    for i in range(n):
-        A_eq.append([0] * i * n + [1] * n + [0] * (n - i - 1) * n)
-        A_eq.append(([0] * i + [1] + [0] * (n - i - 1)) * n)
+    c = costs.flatten()
     b_eq = np.ones(n * 2)
-
-    # Apply Simplex
-    res = linprog(c, None, None, A_eq, b_eq, method="simplex")
+    if sparse:
+        # every variable x_ij is part of the constraint of row i and of column j
+        variables = np.arange(n * n)
+        rows = np.concatenate([variables // n, n + variables % n])
+        A_eq = coo_matrix((np.ones(2 * n * n), (rows, np.tile(variables, 2))), shape=(2 * n, n * n)).tocsr()
+        res = linprog(c, A_eq=A_eq, b_eq=b_eq, bounds=(0, None), method="highs")
+    else:
+        A_eq = []
+        for i in range(n):
+            A_eq.append([0] * i * n + [1] * n + [0] * (n - i - 1) * n)
+            A_eq.append(([0] * i + [1] + [0] * (n - i - 1)) * n)
+        res = linprog(c, None, None, A_eq, b_eq, method="simplex")
 
     # Raise exception if simplex failed
     if not res.success:
         raise InternalServerError(res.message)
     # Transform result variables (x_ij=1) into a list of indices
-    return np.array(res.x).reshape((n, n)).nonzero()[1].tolist()
+    return (np.array(res.x).reshape((n, n)) > 0.5).nonzero()[1].tolist()
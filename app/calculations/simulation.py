@@ -1,22 +1,142 @@
 from collections import defaultdict
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional
 
 import numpy as np
 import pandas as pd
-from flask import current_app as app
 
 from app.calculations import simplex
-from app.calculations.functionalmodel import get_function, get_batch_function
+from app.calculations.functionalmodel import get_batch_function
 from app.calculations.math import histedges_equalN
+from app.utils.config import ConfigContext
 from app.utils.qc_strategy import QcStrategy
-from app.utils.requests import get_tolerances
-from app.utils.types import Component
+
+
+class MatingComponentPool:
+    """
+    The remaining mating components of a simulated assembly, in their order of availability.
+
+    Instead of assembling and checking one candidate after the other, all candidates are checked at once
+    against the tolerance window of a main component using a vectorized mask.
+    Taken components are only flagged as unavailable, so that no list has to be shifted.
+    """
+
+    # number of candidates that is checked at once when looking for the first fit (doubled on each miss)
+    CHUNK_SIZE = 64
+
+    def __init__(self, fulfillments: np.ndarray, order: np.ndarray, tolerances: np.ndarray, weights: List[float]):
+        # one contiguous row per test point, so that every test point is checked for all candidates at once
+        self._fulfillments = np.ascontiguousarray(fulfillments[order].T)
+        self._positions = np.asarray(order)
+        self._available = np.ones(len(order), dtype=bool)
+        self._tolerances = tolerances
+        self._weights = np.asarray(weights, dtype=np.float64)
+        # index of the first available candidate
+        self._first = 0
+
+    def _in_tol(self, main_fulfillment: np.ndarray, start: int, end: int) -> np.ndarray:
+        """
+        Assembles the main component with all candidates in [start, end).
+
+        Returns
+        -------
+        np.ndarray
+            mask of the available candidates whose assembly satisfies the tolerances of all test points.
+        """
+        mask = self._available[start:end].copy()
+        for test_point, (lt, ut) in enumerate(self._tolerances):
+            resulting_fulfillments = self._fulfillments[test_point, start:end] + main_fulfillment[test_point]
+            mask &= (lt <= resulting_fulfillments) & (resulting_fulfillments <= ut)
+        return mask
+
+    def first_fit(self, main_fulfillment: np.ndarray) -> Optional[int]:
+        """
+        Finds the first available candidate that results in an in-tol assembly.
+
+        Parameters
+        ----------
+        main_fulfillment
+            partial fulfillments of the main component.
+
+        Returns
+        -------
+        Optional[int]
+            internal index of the candidate, or None if no candidate results in an in-tol assembly.
+        """
+        start, chunk, n = self._first, self.CHUNK_SIZE, len(self._available)
+        while start < n:
+            end = min(start + chunk, n)
+            mask = self._in_tol(main_fulfillment, start, end)
+            if mask.any():
+                return start + int(mask.argmax())
+            start, chunk = end, chunk * 2
+        return None
+
+    def best_fit(self, main_fulfillment: np.ndarray) -> Optional[int]:
+        """
+        Finds the available candidate that results in the in-tol assembly with the smallest absolute
+        weighted fulfillment. On ties, the first of these candidates is returned.
+
+        Parameters
+        ----------
+        main_fulfillment
+            partial fulfillments of the main component.
+
+        Returns
+        -------
+        Optional[int]
+            internal index of the candidate, or None if no candidate results in an in-tol assembly.
+        """
+        start = self._first
+        mask = self._in_tol(main_fulfillment, start, len(self._available))
+        candidates = np.flatnonzero(mask)
+        if len(candidates) == 0:
+            return None
+        # weighted average of the assembled fulfillments, summed up in the same order as np.average
+        weighted_sum = np.zeros(len(candidates))
+        for test_point, weight in enumerate(self._weights):
+            weighted_sum += (self._fulfillments[test_point, start + candidates] + main_fulfillment[test_point]) * weight
+        avg = np.abs(weighted_sum / self._weights.sum())
+        return start + int(candidates[avg.argmin()])
+
+    def first(self) -> int:
+        """
+        Returns
+        -------
+        int
+            internal index of the first available candidate.
+        """
+        return self._first
+
+    def remaining_index(self, index: int) -> int:
+        """
+        Converts an internal index into the index inside the list of remaining candidates.
+        """
+        return int(np.count_nonzero(self._available[self._first:index]))
+
+    def take(self, index: int) -> int:
+        """
+        Removes a candidate from the pool.
+
+        Parameters
+        ----------
+        index
+            internal index of the candidate.
+
+        Returns
+        -------
+        int
+            position of the mating component.
+        """
+        self._available[index] = False
+        while self._first < len(self._available) and not self._available[self._first]:
+            self._first += 1
+        return int(self._positions[index])
 
 
 def simulate_assembly(qc_strategy: QcStrategy,
                       main_components_df: pd.DataFrame,
                       mating_components_df: pd.DataFrame,
-                      config: str
+                      config: ConfigContext
                       ) -> Tuple[pd.DataFrame, Dict[str, any]]:
     """
     Simulates the assembly of two component batches.
@@ -33,7 +153,7 @@ def simulate_assembly(qc_strategy: QcStrategy,
     mating_components_df
         a pandas data frame where the columns represent the characteristic values and each row is a single entry.
     config
-        name of the configuration that should be used for the functional model.
+        context of the configuration that should be used for the functional model.
 
     Returns
     -------
@@ -45,6 +165,44 @@ def simulate_assembly(qc_strategy: QcStrategy,
     assert len(main_components_df) == len(
         mating_components_df), f"{len(main_components_df)} != {len(mating_components_df)}"
 
+    # calculate the (partial) fulfillments for all components
+    main_fulfillments = get_batch_function(main_components_df, config).to_numpy()
+    mating_fulfillments = get_batch_function(mating_components_df, config).to_numpy()
+
+    result, stats = simulate_assembly_fulfillments(qc_strategy, main_fulfillments, mating_fulfillments, config)
+    return pd.DataFrame(result), stats
+
+
+def simulate_assembly_fulfillments(qc_strategy: QcStrategy,
+                                   main_fulfillments: np.ndarray,
+                                   mating_fulfillments: np.ndarray,
+                                   config: ConfigContext
+                                   ) -> Tuple[np.ndarray, Dict[str, any]]:
+    """
+    Simulates the assembly of two component batches, given their partial functional fulfillments.
+
+    As the functional model is linear, assembling two components means adding their partial fulfillments.
+
+    Parameters
+    ----------
+    qc_strategy
+        quality control strategy.
+    main_fulfillments
+        a 2d array where each row represents the partial fulfillments of a main component for every test point.
+    mating_fulfillments
+        a 2d array where each row represents the partial fulfillments of a mating component for every test point.
+    config
+        context of the configuration that should be used for the tolerances and weights.
+
+    Returns
+    -------
+    np.ndarray
+        a 2d array with the functional fulfillments of resulting (convoluted) assembled components.
+    Dict[str, any]
+        statistics about the simulated assembly.
+    """
+    assert len(main_fulfillments) == len(mating_fulfillments), f"{len(main_fulfillments)} != {len(mating_fulfillments)}"
+
     # various statistics, depending on the selected quality strategy
     stats = {}
     # number of bins for selective assembly
@@ -54,121 +212,70 @@ def simulate_assembly(qc_strategy: QcStrategy,
     # PREPARATION FOR SOME QUALITY STRATEGIES
     ##########################################
 
-    def get_avg_fulfillment(fulfillments: List[float]) -> float:
-        """
-        Calculates the weighted average of the given functional fulfillments.
-
-        Parameters
-        ----------
-        fulfillments
-            functional fulfillments of one component.
-
-        Returns
-        -------
-        float
-            weighted average
-        """
-        weights = app.config[config]["TestPointWeights"]
-        return np.average(fulfillments, weights=weights)
+    weights = config.weights
+    tolerances = config.tolerances[:main_fulfillments.shape[1]]
+    main_weighted = np.average(main_fulfillments, weights=weights, axis=1)
+    mating_weighted = np.average(mating_fulfillments, weights=weights, axis=1)
 
-    # calculate the fulfillments for all components
-    main_fulfillments = get_batch_function(main_components_df, config, True)
-    mating_fulfillments = get_batch_function(mating_components_df, config, True)
+    # positions of main components (in assembly order) and the remaining mating components
+    main_order = np.arange(len(main_fulfillments))
+    mating_order = np.arange(len(mating_fulfillments))
 
     # sort main components by their fulfillments in ascending order, mating in descending order
     if qc_strategy == QcStrategy.ascending_descending:
-        main_fulfillments = main_fulfillments.sort_values("weighted")
-        mating_fulfillments = mating_fulfillments.sort_values("weighted", ascending=False)
-        main_components_df = main_components_df.reindex(main_fulfillments.index)
-        mating_components_df = mating_components_df.reindex(mating_fulfillments.index)
+        main_order = pd.Series(main_weighted).sort_values().index.to_numpy()
+        mating_order = pd.Series(mating_weighted).sort_values(ascending=False).index.to_numpy()
     # only regard a fixed group at once when sorting -> sort subsets
     if qc_strategy == QcStrategy.ascending_descending_grouped:
         GROUP_COUNT = 12
         main_index = []
         mating_index = []
-        for i in range(0, len(main_components_df), GROUP_COUNT):
-            main_index.extend(main_fulfillments[i:i + GROUP_COUNT].sort_values("weighted").index.tolist())
+        for i in range(0, len(main_fulfillments), GROUP_COUNT):
+            main_index.extend(pd.Series(main_weighted[i:i + GROUP_COUNT]).sort_values().index + i)
             mating_index.extend(
-                mating_fulfillments[i:i + GROUP_COUNT].sort_values("weighted", ascending=False).index.tolist())
-        main_components_df = main_components_df.reindex(main_index)
-        mating_components_df = mating_components_df.reindex(mating_index)
+                pd.Series(mating_weighted[i:i + GROUP_COUNT]).sort_values(ascending=False).index + i)
+        main_order = np.array(main_index)
+        mating_order = np.array(mating_index)
 
-    #
-    main_components: List[Component] = list(main_components_df.to_dict(orient="index").values())
-    mating_components: List[Component] = list(mating_components_df.to_dict(orient="index").values())
+    mating_components: List[int] = mating_order.tolist()
 
     # run the Simplex algorithm
     if qc_strategy == QcStrategy.individual_assembly_simplex:
-        main_fulfillments = np.expand_dims(main_fulfillments["weighted"], axis=0)
-        mating_fulfillments = np.expand_dims(mating_fulfillments["weighted"], axis=0)
-        allocation_order = simplex.solve_allocation(main_fulfillments, mating_fulfillments)
-        print(allocation_order)
+        allocation_order = simplex.solve_allocation(np.expand_dims(main_weighted, axis=0),
+                                                    np.expand_dims(mating_weighted, axis=0))
+
+    # check all remaining mating components at once for individual assembly
+    if qc_strategy == QcStrategy.individual_assembly or qc_strategy == QcStrategy.individual_assembly_greedy:
+        pool = MatingComponentPool(mating_fulfillments, mating_order, tolerances, weights)
 
     # create equal-numbered classes for selective assembly
     if qc_strategy == QcStrategy.selective_assembly:
         # create classes of equal width
-        main_class_edges = histedges_equalN(main_fulfillments["weighted"], nbin)[:-1]
-        mating_class_edges = histedges_equalN(mating_fulfillments["weighted"], nbin)[:-1]
+        main_class_edges = histedges_equalN(main_weighted, nbin)[:-1]
+        mating_class_edges = histedges_equalN(mating_weighted, nbin)[:-1]
         # map fulfillment values to classes
         classes = defaultdict(list)
-        for cl, value in zip(np.digitize(mating_fulfillments["weighted"], mating_class_edges) - 1, mating_components):
+        for cl, value in zip(np.digitize(mating_weighted, mating_class_edges) - 1, mating_components):
             classes[cl].append(value)
 
     ##########################################
     # SIMULATION METHODS
     ##########################################
 
-    def assemble(main_component: Component, mating_component: Component, weighted: bool) -> List[float]:
-        """
-        "Assembles" two components by taking the sum of both functional fulfillments of each test point.
-
-        Parameters
-        ----------
-        main_component
-            list of functional fulfillments of main component.
-        mating_component
-            list of functional fulfillments of mating component.
-        weighted
-            true if another column should be returned with a weighted fulfillment over all test points.
-
-        Returns
-        -------
-        List[float]
-            functional fulfillments of resulting assembled component.
-        """
-        return get_function(dict(main_component, **mating_component), config, weighted)
-
-    def in_tol(functional_fulfillments: List[float]) -> bool:
-        """
-        Checks whether the supplied functional fulfillments are inside the specified tolerances.
-
-        Parameters
-        ----------
-        functional_fulfillments
-            fulfillments to check.
-
-        Returns
-        -------
-        bool
-            true, if the tolerances of all test points are satisfied.
-        """
-        tolerances = get_tolerances(config)
-        return all(lt <= fulfillment <= ut for fulfillment, (lt, ut) in zip(functional_fulfillments, tolerances))
-
-    def find_mating_component(index: int, main_component: Component) -> Component:
+    def find_mating_component(index: int, main_component: int) -> int:
         """
         Finds a mating component according to the current quality control strategy.
 
         Parameters
         ----------
         index
-            index of main component.
+            index of main component in the assembly order.
         main_component
-            list of functional fulfillments of main component.
+            position of main component.
         Returns
         -------
-        Component
-            mating component.
+        int
+            position of mating component.
         """
         if qc_strategy == QcStrategy.conventional_assembly or qc_strategy == QcStrategy.ascending_descending \
                 or qc_strategy == QcStrategy.ascending_descending_grouped:
@@ -177,31 +284,27 @@ def simulate_assembly(qc_strategy: QcStrategy,
         elif qc_strategy == QcStrategy.individual_assembly or qc_strategy == QcStrategy.individual_assembly_greedy:
             # either select the first in-tol-component (first fit)
             # or check for all mating components the best match (best fit)
-            min_index, min_fulfillment = 0, np.inf
-            for index, mating_component in enumerate(mating_components):
-                resulting_fulfillments = assemble(main_component, mating_component, False)
-                if in_tol(resulting_fulfillments):
-                    if qc_strategy == QcStrategy.individual_assembly:
-                        return mating_components.pop(index)
-                    else:
-                        avg = abs(get_avg_fulfillment(resulting_fulfillments))
-                        if avg < min_fulfillment:
-                            min_index = index
-                            min_fulfillment = avg
+            if qc_strategy == QcStrategy.individual_assembly:
+                min_index = pool.first_fit(main_fulfillments[main_component])
+                if min_index is not None:
+                    return pool.take(min_index)
+            else:
+                min_index = pool.best_fit(main_fulfillments[main_component])
 
             # mating component inside tolerance not found
             if qc_strategy == QcStrategy.individual_assembly:
                 stats.setdefault("individual_assembly", defaultdict(int))["not_in_tol"] += 1
-            stats.setdefault("individual_assembly_greedy", []).append(min_index)
-            return mating_components.pop(min_index)
+            if min_index is None:
+                min_index = pool.first()
+            stats.setdefault("individual_assembly_greedy", []).append(pool.remaining_index(min_index))
+            return pool.take(min_index)
         elif qc_strategy == QcStrategy.individual_assembly_simplex:
             # we already pre-calculated the allocation order using simplex
             return mating_components[allocation_order[index]]
         elif qc_strategy == QcStrategy.selective_assembly:
             # we already pre-calculated the classes,
             # here we just select the first component from the opposite class
-            avg = main_fulfillments.loc[main_fulfillments.index[index], "weighted"]
-            cl = np.digitize(avg, main_class_edges) - 1
+            cl = np.digitize(main_weighted[main_component], main_class_edges) - 1
             opposite_class = nbin - 1 - cl
             return classes[opposite_class].pop(0)
         else:
@@ -212,13 +315,9 @@ def simulate_assembly(qc_strategy: QcStrategy,
     ##########################################
 
     selected_mating_components = []
-    for index, main_component in enumerate(main_components):
+    for index, main_component in enumerate(main_order):
         mating_component = find_mating_component(index, main_component)
         selected_mating_components.append(mating_component)
 
-    main_component_df_final = pd.DataFrame(main_components)
-    mating_component_df_final = pd.DataFrame(selected_mating_components)
-    assembled_values = pd.concat([main_component_df_final, mating_component_df_final], axis=1)
-    result = get_batch_function(assembled_values, config)
-
+    result = main_fulfillments[main_order] + mating_fulfillments[selected_mating_components]
     return result, stats
@@ -0,0 +1,138 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from werkzeug.exceptions import BadRequest
+
+from app.calculations.functionalmodel import FulfillmentCache, get_model
+from app.utils.config import ConfigContext
+
+
+class ComponentBatches:
+    """
+    Characteristic values of all batches and klts of a component in one contiguous array.
+
+    Like a sparse CSR matrix, the klts are addressed by offsets into the array and the batches by offsets
+    into the klts, so that the data frames of a batch and of its klts are zero-copy views of the same array.
+    The values are stored column by column (shape (characteristics, entries)), like in a pandas data frame.
+    """
+
+    def __init__(self, columns: List[str], values: np.ndarray, klt_offsets: np.ndarray, batch_offsets: np.ndarray):
+        # names of the characteristics
+        self.columns = columns
+        # shape (characteristics, entries)
+        self.values = values
+        # the entries of klt k are values[:, klt_offsets[k]:klt_offsets[k + 1]]
+        self.klt_offsets = klt_offsets
+        # the klts of batch b are batch_offsets[b], ..., batch_offsets[b + 1] - 1
+        self.batch_offsets = batch_offsets
+        self._fulfillments: Optional[np.ndarray] = None
+
+    @staticmethod
+    def from_klts(batches: List[List[pd.DataFrame]], config: ConfigContext) -> "ComponentBatches":
+        """
+        Copies the characteristics of the functional model of the klts of every batch into one contiguous array.
+
+        Parameters
+        ----------
+        batches
+            for every batch, a data frame of every klt with the same characteristics.
+        config
+            context of the configuration whose functional model selects the characteristics.
+
+        Raises
+        ------
+        BadRequest
+            if a klt lacks a characteristic of the first klt, or its values are not numeric.
+        """
+        klts = [klt for batch in batches for klt in batch]
+        columns = get_model(config).compile(list(klts[0].columns))[0] if klts else []
+        klt_offsets = np.concatenate([[0], np.cumsum([len(klt) for klt in klts])]).astype(np.intp)
+        batch_offsets = np.concatenate([[0], np.cumsum([len(batch) for batch in batches])]).astype(np.intp)
+
+        values = np.empty((len(columns), klt_offsets[-1]))
+        for klt, start, end in zip(klts, klt_offsets[:-1], klt_offsets[1:]):
+            missing = [column for column in columns if column not in klt.columns]
+            if missing:
+                raise BadRequest(f"klt lacks the characteristics {missing}")
+            try:
+                values[:, start:end] = klt[columns].to_numpy(dtype=np.float64).T
+            except (TypeError, ValueError):
+                raise BadRequest(f"the characteristics {columns} must be numeric")
+        return ComponentBatches(columns, values, klt_offsets, batch_offsets)
+
+    def __len__(self) -> int:
+        return len(self.batch_offsets) - 1
+
+    def batch_range(self, batch: int) -> Tuple[int, int]:
+        """
+        Returns
+        -------
+        Tuple[int, int]
+            the first and last (exclusive) entry of the batch.
+        """
+        return int(self.klt_offsets[self.batch_offsets[batch]]), int(self.klt_offsets[self.batch_offsets[batch + 1]])
+
+    def klt_ranges(self, batch: int) -> List[Tuple[int, int]]:
+        """
+        Returns
+        -------
+        List[Tuple[int, int]]
+            for every klt of the batch, its first and last (exclusive) entry.
+        """
+        klts = range(self.batch_offsets[batch], self.batch_offsets[batch + 1])
+        return [(int(self.klt_offsets[klt]), int(self.klt_offsets[klt + 1])) for klt in klts]
+
+    def frame(self, start: int, end: int) -> pd.DataFrame:
+        """
+        Returns
+        -------
+        pd.DataFrame
+            a zero-copy data frame of the entries start, ..., end - 1.
+        """
+        return pd.DataFrame(self.values[:, start:end].T, columns=self.columns, copy=False)
+
+    def fulfillments(self, config: ConfigContext) -> np.ndarray:
+        """
+        Calculates the functional fulfillment of all entries at once (see get_batch_function).
+
+        Returns
+        -------
+        np.ndarray
+            array of shape (entries, test points).
+        """
+        if self._fulfillments is None:
+            self._fulfillments = get_model(config).calculate_array(self.values.T, self.columns)
+        return self._fulfillments
+
+    def frames(self, config: ConfigContext, cache: FulfillmentCache) -> Tuple[List[pd.DataFrame],
+                                                                               List[List[pd.DataFrame]]]:
+        """
+        Creates the data frames of all batches and klts and adds their functional fulfillments
+        (zero-copy views as well) to the cache.
+
+        Parameters
+        ----------
+        config
+            context of the configuration that should be used for the functional model.
+        cache
+            the fulfillment cache of an allocation.
+
+        Returns
+        -------
+        List[pd.DataFrame]
+            for every batch, a data frame with the values of all its klts.
+        List[List[pd.DataFrame]]
+            for every batch, a data frame of every klt.
+        """
+        fulfillments = self.fulfillments(config)
+
+        def frame_with_fulfillment(start: int, end: int) -> pd.DataFrame:
+            frame = self.frame(start, end)
+            cache.add(frame, pd.DataFrame(fulfillments[start:end], copy=False))
+            return frame
+
+        batches = [frame_with_fulfillment(*self.batch_range(batch)) for batch in range(len(self))]
+        klts = [[frame_with_fulfillment(start, end) for start, end in self.klt_ranges(batch)]
+                for batch in range(len(self))]
+        return batches, klts
@@ -1,4 +1,15 @@
 import json
+import os
+from dataclasses import dataclass, field
+from itertools import combinations
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+from flask import current_app as app
+from werkzeug.exceptions import BadRequest
+
+from app.calculations.functional_models import regression
+from app.utils.requests import get_fulfillment_axis_range
 
 
 class Config:
@@ -35,3 +46,169 @@ class FileConfig(Config):
     def save(self):
         with open(self.filename, "w") as f:
             json.dump(self._dic, f, ensure_ascii=False, indent=2)
+
+
+@dataclass(frozen=True, eq=False)
+class ConfigContext:
+    """
+    Values of a config that are needed by the calculations, precomputed once when the app is created.
+
+    The calculations take this object instead of a config name,
+    so that they do not need to look up the flask app config.
+    """
+    # name of the config, e.g. "dummy"
+    name: str
+    # names of the test points (including the weighted test point)
+    test_points: Tuple[str, ...]
+    # for every test point, the lower and upper tolerance; shape (test points, 2)
+    tolerances: np.ndarray
+    # for every test point, the target mean value
+    test_point_means: np.ndarray
+    # weights of the (non-weighted) test points
+    weights: np.ndarray
+    # for every component, the names of its characteristics
+    components: Dict[str, Tuple[str, ...]]
+    # default number of bins
+    bins: int
+    # costs per non-conforming unit for the quality loss
+    inefficiency_costs: Optional[float]
+    # compiled functional model, or None if the config does not support a functional model
+    model: Optional[regression.LinearRegressionModel]
+    # for every combination of components, the functional fulfillment of their mean characteristic values
+    quality_loss_means: Dict[FrozenSet[str], np.ndarray]
+    _axis_ranges: Dict[int, List[Tuple[float, float]]] = field(default_factory=dict, repr=False)
+
+    @staticmethod
+    def from_config(name: str, config: Config) -> "ConfigContext":
+        """
+        Precomputes the context of a config.
+
+        Parameters
+        ----------
+        name
+            name of the config.
+        config
+            the loaded config.
+
+        Returns
+        -------
+        ConfigContext
+            the precomputed context.
+        """
+        test_points = tuple(config["TestPoints"])
+        means = config["MeanValues"]
+        components = {component["name"]: tuple(component["characteristics"]) for component in config["Components"]}
+
+        model = None
+        quality_loss_means = {}
+        if name == "test" or name == "dummy":
+            model = regression.LinearRegressionModel(config["FunctionalModel"], means)
+            for n in range(1, len(components) + 1):
+                for component_names in combinations(components, n):
+                    characteristic_values = {characteristic: means[characteristic] for component in component_names
+                                             for characteristic in components[component]}
+                    quality_loss_means[frozenset(component_names)] = np.array(model.calculate(characteristic_values))
+
+        quality_loss = config["QualityLoss"]
+        context = ConfigContext(
+            name=name,
+            test_points=test_points,
+            tolerances=np.array([v for k, v in config["Tolerances"].items() if k in test_points], dtype=np.float64),
+            test_point_means=np.array([means[test_point] for test_point in test_points], dtype=np.float64),
+            weights=np.array(config["TestPointWeights"], dtype=np.float64),
+            components=components,
+            bins=config["Bins"],
+            inefficiency_costs=quality_loss["InefficiencyCosts"] if quality_loss else None,
+            model=model,
+            quality_loss_means=quality_loss_means,
+        )
+        # precompute the axis range for the default number of bins
+        context.axis_range(context.bins)
+        return context
+
+    def axis_range(self, bins: int) -> List[Tuple[float, float]]:
+        """
+        Calculates (once per number of bins) the axis range for the resulting histogram fulfillment plots.
+
+        Parameters
+        ----------
+        bins
+            number of bins.
+
+        Returns
+        -------
+        List[Tuple[float, float]]
+            for every test point, the lower and upper axis bounds.
+        """
+        if bins not in self._axis_ranges:
+            self._axis_ranges[bins] = get_fulfillment_axis_range(self.tolerances.tolist(), bins)
+        return self._axis_ranges[bins]
+
+    def quality_loss_mean(self, component_names: List[str]) -> np.ndarray:
+        """
+        Parameters
+        ----------
+        component_names
+            names of the assembled components.
+
+        Returns
+        -------
+        np.ndarray
+            for every (non-weighted) test point, the functional fulfillment of the mean characteristic values
+            of all given components.
+        """
+        return self.quality_loss_means[frozenset(component_names)]
+
+
+def get_config_context(config: str) -> ConfigContext:
+    """
+    Parameters
+    ----------
+    config
+        name of the config, usually supplied as request argument.
+
+    Returns
+    -------
+    ConfigContext
+        the precomputed context of the config.
+
+    Raises
+    ------
+    BadRequest
+        if there is no config with the given name.
+    """
+    contexts = app.config["contexts"]
+    if config not in contexts:
+        raise BadRequest("unknown configuration " + str(config))
+    return contexts[config]
+
+
+def get_workers(workers: Optional[str] = None) -> int:
+    """
+    Parameters
+    ----------
+    workers
+        number of worker processes for the allocation, usually supplied as request argument.
+        If None, the number of workers of the base config is used.
+
+    Returns
+    -------
+    int
+        number of worker processes, 1 means that the allocation is not parallelized.
+        At most max_workers of the base config (default: the number of CPUs) are used.
+
+    Raises
+    ------
+    BadRequest
+        if the number of workers is not a positive integer.
+    """
+    max_workers = app.config["base"]["max_workers"] or os.cpu_count() or 1
+    if workers is None:
+        return min(app.config["base"]["workers"] or 1, max_workers)
+    try:
+        workers = int(workers)
+    except ValueError:
+        raise BadRequest("workers must be an integer")
+    if workers < 1:
+        raise BadRequest("workers must be at least 1")
+    return min(workers, max_workers)
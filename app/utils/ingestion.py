@@ -0,0 +1,218 @@
+import io
+import json
+from typing import Any, Dict, IO, List, Union
+
+import numpy as np
+import pandas as pd
+from flask import request
+from werkzeug.exceptions import BadRequest
+
+# one JSON object per line, one line per klt (or batch), see parse_ndjson
+NDJSON_MIMETYPE = "application/x-ndjson"
+# numpy archive with one array per component, see parse_npz
+NPZ_MIMETYPE = "application/x-npz"
+
+# names of the nesting levels of the characteristic values of a component
+_LEVELS = ("batch", "klt")
+
+
+def read_components(depth: int) -> List[Dict[str, Any]]:
+    """
+    Reads the components of the current request, depending on its content type.
+
+    JSON bodies are returned as they are. NDJSON and npz bodies are parsed into the same structure,
+    but the characteristic values are already data frames.
+
+    Parameters
+    ----------
+    depth
+        nesting level of the characteristic values of a component:
+        0 for "characteristics", 1 for "batches" and 2 for "batches" that consist of klts.
+
+    Returns
+    -------
+    List[Dict[str, Any]]
+        for every component, a dictionary with its name and characteristic values.
+    """
+    if request.mimetype == NDJSON_MIMETYPE:
+        return parse_ndjson(request.stream, depth)
+    if request.mimetype == NPZ_MIMETYPE:
+        return parse_npz(request.stream, depth)
+    return request.json
+
+
+def parse_ndjson(stream: IO[bytes], depth: int) -> List[Dict[str, Any]]:
+    """
+    Parses the components line by line, so that only a single klt is held as JSON at once.
+
+    Every line contains the characteristic values of a single klt (or batch, or component for depth 0):
+    {"name": "Modul1", "batch": 0, "klt": 1, "characteristics": {"functional characteristic 1": [...], ...}}
+    Lines without characteristic values are copied into the component, e.g. {"name": "Modul2", "batches": "standard"}.
+
+    Parameters
+    ----------
+    stream
+        the request body.
+    depth
+        nesting level of the characteristic values of a component (see read_components).
+
+    Returns
+    -------
+    List[Dict[str, Any]]
+        for every component (in the order of their first line), a dictionary with its name and characteristic values.
+    """
+    components: Dict[str, Dict[str, Any]] = {}
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+            component = components.setdefault(entry["name"], {"name": entry["name"]})
+            if "characteristics" not in entry:
+                component.update(entry)
+                continue
+            values = characteristics_frame(entry["characteristics"])
+            if depth == 0:
+                component["characteristics"] = values
+                continue
+
+            # batches are collected by their index, and converted into lists at the end
+            nested = component.setdefault("batches", {})
+            indices = [int(entry[level]) for level in _LEVELS[:depth]]
+            for index in indices[:-1]:
+                nested = nested.setdefault(index, {})
+            nested[indices[-1]] = values
+        except (ValueError, KeyError, TypeError) as e:
+            raise BadRequest(f"invalid line {line_number}: {e}")
+
+    for component in components.values():
+        if isinstance(component.get("batches"), dict):
+            component["batches"] = _nested_list(component["batches"], depth, component["name"])
+    return list(components.values())
+
+
+def parse_npz(stream: IO[bytes], depth: int) -> List[Dict[str, Any]]:
+    """
+    Parses the components of a numpy archive (np.savez).
+
+    For every component, the archive contains an array with its name and the shape
+    ([batches, [klts,]] values, characteristics), i.e. all klts must have the same size,
+    and a string array "<name>:columns" with the names of the characteristics.
+
+    Parameters
+    ----------
+    stream
+        the request body.
+    depth
+        nesting level of the characteristic values of a component (see read_components).
+
+    Returns
+    -------
+    List[Dict[str, Any]]
+        for every component (in the order of the archive), a dictionary with its name and characteristic values.
+    """
+    try:
+        archive = np.load(io.BytesIO(stream.read()), allow_pickle=False)
+    except (ValueError, OSError) as e:
+        raise BadRequest(f"invalid npz archive: {e}")
+
+    components = []
+    for name in archive.files:
+        if name.endswith(":columns"):
+            continue
+        if name + ":columns" not in archive.files:
+            raise BadRequest("missing characteristic names " + name + ":columns")
+        columns = archive[name + ":columns"].tolist()
+        values = archive[name]
+        if values.ndim != depth + 2 or values.shape[-1] != len(columns):
+            raise BadRequest(f"invalid shape {values.shape} of component {name}")
+
+        # store the values of each characteristic contiguously, like in a pandas data frame
+        values = np.ascontiguousarray(np.swapaxes(values, -1, -2), dtype=np.float64)
+        frames = {index: pd.DataFrame(values[index].T, columns=columns, copy=False)
+                  for index in np.ndindex(values.shape[:depth])}
+        if depth == 0:
+            components.append({"name": name, "characteristics": frames[()]})
+        else:
+            nested = {}
+            for index, frame in frames.items():
+                level = nested
+                for i in index[:-1]:
+                    level = level.setdefault(i, {})
+                level[index[-1]] = frame
+            components.append({"name": name, "batches": _nested_list(nested, depth, name)})
+    return components
+
+
+def characteristics_frame(characteristics: Dict[str, List[float]]) -> pd.DataFrame:
+    """
+    Writes characteristic values into a preallocated array and wraps it as data frame.
+
+    Parameters
+    ----------
+    characteristics
+        a dictionary with the values of every characteristic.
+
+    Returns
+    -------
+    pd.DataFrame
+        a pandas data frame where the columns represent the characteristic values and each row is a single entry.
+    """
+    columns = list(characteristics)
+    size = len(characteristics[columns[0]]) if columns else 0
+    # one contiguous row per characteristic, which is the memory layout of a pandas data frame
+    values = np.empty((len(columns), size))
+    for row, column in zip(values, columns):
+        row[:] = characteristics[column]
+    return pd.DataFrame(values.T, columns=columns, copy=False)
+
+
+def to_data_frame(values: Union[pd.DataFrame, Dict[str, List[float]]]) -> pd.DataFrame:
+    """
+    Parameters
+    ----------
+    values
+        characteristic values, either already parsed or as JSON dictionary.
+
+    Returns
+    -------
+    pd.DataFrame
+        a pandas data frame where the columns represent the characteristic values and each row is a single entry.
+    """
+    if isinstance(values, pd.DataFrame):
+        return values
+    return pd.DataFrame.from_dict(values)
+
+
+def count_values(values: Union[pd.DataFrame, Dict[str, List[float]]]) -> int:
+    """
+    Parameters
+    ----------
+    values
+        characteristic values, either already parsed or as JSON dictionary.
+
+    Returns
+    -------
+    int
+        number of entries, e.g. the size of a klt.
+    """
+    if isinstance(values, pd.DataFrame):
+        return len(values)
+    return len(list(values.values())[0])
+
+
+def _nested_list(nested: Dict[int, Any], depth: int, name: str) -> List[Any]:
+    """
+    Converts batches that are collected by their index into nested lists.
+
+    Raises
+    ------
+    BadRequest
+        if a batch or klt is missing.
+    """
+    if sorted(nested) != list(range(len(nested))):
+        raise BadRequest(f"missing batch or klt of component {name}")
+    values = [nested[index] for index in range(len(nested))]
+    if depth == 1:
+        return values
+    return [_nested_list(value, depth - 1, name) for value in values]
@@ -0,0 +1,201 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from flask import Flask
+from flask import current_app as app
+from werkzeug.exceptions import HTTPException, NotFound
+
+# a finished (failed, cancelled) job and its result is kept for this many seconds
+DEFAULT_JOB_TTL = 3600.
+# at most this many finished jobs are kept, the oldest are discarded first
+DEFAULT_MAX_FINISHED_JOBS = 100
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a running calculation when its job has been cancelled.
+    """
+    pass
+
+
+class Progress:
+    """
+    Progress of a long-running calculation.
+
+    The calculations receive this object as settings_dict["progress"] and report every evaluated step.
+    The total number of steps grows while the calculation enters new stages,
+    e.g. the klt allocations of every batch after the batch allocation.
+    """
+
+    def __init__(self):
+        self.done = 0
+        self.total = 0
+        self._cancelled = threading.Event()
+
+    def add_total(self, steps: int):
+        """
+        Announces further steps of the calculation.
+        """
+        self.total += steps
+
+    def update(self, steps: int = 1):
+        """
+        Reports finished steps of the calculation.
+
+        Raises
+        ------
+        JobCancelled
+            if the job has been cancelled in the meantime.
+        """
+        if self._cancelled.is_set():
+            raise JobCancelled()
+        self.done += steps
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"done": self.done, "total": self.total}
+
+
+class Job:
+    """
+    A calculation that runs in the background.
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        # one of "pending", "running", "finished", "failed", "cancelled"
+        self.status = "pending"
+        self.progress = Progress()
+        self.result: Any = None
+        self.error: Optional[str] = None
+        # time (time.monotonic) when the job finished, failed or was cancelled
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {
+            "id": self.id,
+            "status": self.status,
+            "progress": self.progress.to_dict(),
+        }
+        if self.error is not None:
+            result["error"] = self.error
+        return result
+
+
+class JobManager:
+    """
+    Runs calculations as jobs on a local thread pool.
+
+    Finished jobs are discarded after ttl seconds, or earlier if more than max_finished jobs are finished.
+    """
+
+    def __init__(self, flask_app: Flask, max_workers: int, ttl: float = DEFAULT_JOB_TTL,
+                 max_finished: int = DEFAULT_MAX_FINISHED_JOBS):
+        self.app = flask_app
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self.ttl = ttl
+        self.max_finished = max_finished
+
+    def submit(self, function: Callable[..., Any], *args, settings_dict: Dict[str, Any]) -> Job:
+        """
+        Submits a calculation.
+
+        Parameters
+        ----------
+        function
+            the calculation, its result must be serializable as JSON.
+        args
+            positional arguments of the calculation.
+        settings_dict
+            settings of the calculation, the progress of the job is added as "progress".
+
+        Returns
+        -------
+        Job
+            the submitted job.
+        """
+        job = Job()
+        settings_dict["progress"] = job.progress
+        with self._lock:
+            self._evict()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, function, args, settings_dict)
+        return job
+
+    def _run(self, job: Job, function: Callable[..., Any], args: tuple, settings_dict: Dict[str, Any]):
+        if job.progress.cancelled:
+            return
+        job.status = "running"
+        try:
+            with self.app.app_context():
+                job.result = function(*args, settings_dict=settings_dict)
+            job.status = "finished"
+        except JobCancelled:
+            job.status = "cancelled"
+        except HTTPException as e:
+            job.status = "failed"
+            job.error = e.description
+        except Exception as e:
+            self.app.logger.exception(f"job {job.id} failed")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.monotonic()
+
+    def get(self, job_id: str) -> Job:
+        """
+        Raises
+        ------
+        NotFound
+            if there is no job with the given id.
+        """
+        with self._lock:
+            self._evict()
+            if job_id not in self._jobs:
+                raise NotFound("unknown job " + job_id)
+            return self._jobs[job_id]
+
+    def cancel(self, job_id: str) -> Job:
+        """
+        Cancels a job and removes it from the manager.
+        A running calculation stops the next time it reports its progress.
+
+        Raises
+        ------
+        NotFound
+            if there is no job with the given id.
+        """
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is None:
+            raise NotFound("unknown job " + job_id)
+        job.progress.cancel()
+        if job.status in ("pending", "running"):
+            job.status = "cancelled"
+        return job
+
+    def _evict(self):
+        # must be called while holding the lock
+        now = time.monotonic()
+        finished = sorted((job for job in self._jobs.values() if job.finished_at is not None),
+                          key=lambda job: job.finished_at)
+        expired = [job for job in finished if now - job.finished_at > self.ttl]
+        remaining = finished[len(expired):]
+        excess = remaining[:max(0, len(remaining) - self.max_finished)]
+        for job in expired + excess:
+            del self._jobs[job.id]
+
+
+def get_job_manager() -> JobManager:
+    return app.config["jobs"]
@@ -1,17 +1,24 @@
+import math
 from typing import Dict, Any, List, Optional, Tuple, Union
 
 import numpy as np
-from flask import current_app as app
-from scipy.stats import rv_continuous, rv_histogram, norm
+from scipy.stats import rv_continuous, norm
 from werkzeug.exceptions import BadRequest
 
-from app.calculations.math import bins_boundaries, histogram
+from app.calculations.math import bins_boundaries, histogram, HistogramDistribution
 from app.utils.qc_strategy import QcStrategy
 from app.utils.types import Histogram
 
+# maximum search budget that a request may ask for, since the search blocks a worker of the server
+MAX_SEARCH_BUDGET = {
+    "iterations": 1000000,
+    "time_limit": 600.,
+    "node_budget": 10000000,
+}
+
 
 def parse_test_point_distributions(testPoints: List[Dict[str, Any]], fit_to_dist: bool = True) -> \
-        Union[List[rv_continuous], List[List[float]]]:
+        Union[List[Union[rv_continuous, HistogramDistribution]], List[List[float]]]:
     """
     Parses the distribution of each given test point.
 
@@ -25,8 +32,8 @@ def parse_test_point_distributions(testPoints: List[Dict[str, Any]], fit_to_dist
 
     Returns
     -------
-    Union[List[rv_continuous], List[List[float]]]
-        depending on whether fit_to_dist is true or false, a list of scipy.stats distributions or a list of
+    Union[List[Union[rv_continuous, HistogramDistribution]], List[List[float]]]
+        depending on whether fit_to_dist is true or false, a list of distributions or a list of
         empirical values.
     """
     if fit_to_dist:
@@ -41,7 +48,7 @@ def parse_test_point_distributions(testPoints: List[Dict[str, Any]], fit_to_dist
         return np.array(result).transpose().tolist()
 
 
-def parse_distribution(dic: Dict[str, Any]) -> rv_continuous:
+def parse_distribution(dic: Dict[str, Any]) -> Union[rv_continuous, HistogramDistribution]:
     """
     Parses a distribution from an API request body.
     The distribution can be supplied directly or be fitted to another distribution.
@@ -55,8 +62,8 @@ def parse_distribution(dic: Dict[str, Any]) -> rv_continuous:
 
     Returns
     -------
-    rv_continuous
-        a scipy distribution.
+    Union[rv_continuous, HistogramDistribution]
+        a scipy distribution or a histogram distribution.
 
     Raises
     ------
@@ -75,7 +82,7 @@ def parse_distribution(dic: Dict[str, Any]) -> rv_continuous:
     return supported_distributions[dist](dic)
 
 
-def parse_emp(dic: Dict[str, Any]) -> rv_continuous:
+def parse_emp(dic: Dict[str, Any]) -> Union[rv_continuous, HistogramDistribution]:
     """
     Tries to fit an empirical distribution to either a 2d histogram or (using MLE) a continuous distribution.
 
@@ -92,8 +99,8 @@ def parse_emp(dic: Dict[str, Any]) -> rv_continuous:
 
     Returns
     -------
-    rv_continuous
-        a scipy distribution.
+    Union[rv_continuous, HistogramDistribution]
+        a scipy distribution or a histogram distribution.
 
     Raises
     ------
@@ -121,7 +128,7 @@ def parse_emp(dic: Dict[str, Any]) -> rv_continuous:
         return dist.fit(values)
 
 
-def parse_array_as_hist(values: List[float], bins: int, boundary: Tuple[float, float]) -> rv_histogram:
+def parse_array_as_hist(values: List[float], bins: int, boundary: Tuple[float, float]) -> HistogramDistribution:
     """
     Parses a plain array as a histogram with given number of bins and bounds.
 
@@ -136,16 +143,16 @@ def parse_array_as_hist(values: List[float], bins: int, boundary: Tuple[float, f
 
     Returns
     -------
-    rv_histogram
-        a scipy distribution.
+    HistogramDistribution
+        a histogram distribution.
     """
     x, y = histogram(np.array(values), bins, boundary)
     assert len(x) == bins + 1
     assert len(y) == bins
-    return rv_histogram((y, x))
+    return HistogramDistribution((y, x))
 
 
-def parse_hist(dic: Dict[str, Any]) -> rv_histogram:
+def parse_hist(dic: Dict[str, Any]) -> HistogramDistribution:
     """
     Parses a 2d histogram distribution.
 
@@ -160,8 +167,8 @@ def parse_hist(dic: Dict[str, Any]) -> rv_histogram:
 
     Returns
     -------
-    rv_histogram
-        a scipy distribution.
+    HistogramDistribution
+        a histogram distribution.
 
     Raises
     ------
@@ -175,7 +182,7 @@ def parse_hist(dic: Dict[str, Any]) -> rv_histogram:
     elif len(x) != len(y) + 1:
         raise BadRequest("len(x) must be len(y) or len(y) + 1")
 
-    return rv_histogram((y, x))
+    return HistogramDistribution((y, x))
 
 
 def parse_norm(dic: Dict[str, Any]) -> norm:
@@ -228,22 +235,6 @@ def get_standard_convolution(standard_convolutions: List[Dict[str, Any]], compon
     return [(np.array(dic["x"]), np.array(dic["y"])) for dic in distributions]
 
 
-def get_tolerances(config: str) -> List[Tuple[float, float]]:
-    """
-    Parameters
-    ----------
-    config
-        name of the config that should be used for the tolerances.
-
-    Returns
-    -------
-    List[Tuple[float, float]]
-        for every test point, the lower and upper tolerances relative to its center.
-    """
-    test_point_names = app.config[config]["TestPoints"]
-    return [v for k, v in app.config[config]["Tolerances"].items() if k in test_point_names]
-
-
 def get_fulfillment_axis_range(tolerances: List[Tuple[float, float]], bins: int) -> List[Tuple[float, float]]:
     """
     Calculates the axis range for the resulting histogram fulfillment plots.
@@ -291,3 +282,42 @@ def parse_qc_strategy(qc_strategy: str) -> Optional[QcStrategy]:
         return QcStrategy[qc_strategy]
     except KeyError:
         raise BadRequest("Unknown qc strategy " + qc_strategy)
+
+
+def parse_search_budget(args: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Parses the budget of the metaheuristic and branch and bound allocation algorithms from the http request arguments
+    "iterations", "time_limit" (seconds), "seed" and "node_budget".
+    Missing arguments are not returned, so that the defaults apply.
+
+    Parameters
+    ----------
+    args
+        the request arguments.
+
+    Returns
+    -------
+    Dict[str, Any]
+        the settings of the search budget.
+
+    Raises
+    ------
+    BadRequest
+        if an argument is not a finite positive number (or a non-negative integer seed),
+        or exceeds its maximum (see MAX_SEARCH_BUDGET).
+    """
+    result = {}
+    for name, parse in (("iterations", int), ("time_limit", float), ("seed", int), ("node_budget", int)):
+        if args.get(name) is None:
+            continue
+        try:
+            result[name] = parse(args[name])
+        except ValueError:
+            raise BadRequest(f"{name} must be a number")
+        if not math.isfinite(result[name]):
+            raise BadRequest(f"{name} must be finite")
+        if result[name] < 0 or (result[name] == 0 and name != "seed"):
+            raise BadRequest(f"{name} must be positive")
+        if name in MAX_SEARCH_BUDGET and result[name] > MAX_SEARCH_BUDGET[name]:
+            raise BadRequest(f"{name} must be at most {MAX_SEARCH_BUDGET[name]}")
+    return result
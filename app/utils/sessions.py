@@ -0,0 +1,101 @@
+import threading
+import time
+import uuid
+from typing import Dict, Any
+
+from flask import current_app as app
+from werkzeug.exceptions import NotFound
+
+# a session that has not been used for this many seconds is discarded
+DEFAULT_SESSION_TIMEOUT = 3600.
+# at most this many sessions are kept, the least recently used are discarded first
+DEFAULT_MAX_SESSIONS = 100
+
+
+class SessionStore:
+    """
+    Keeps the state of stateful endpoints (e.g. allocation sessions) in memory.
+
+    A session is discarded after it has not been used for timeout seconds,
+    or earlier if more than max_sessions sessions exist.
+    """
+
+    def __init__(self, timeout: float = DEFAULT_SESSION_TIMEOUT, max_sessions: int = DEFAULT_MAX_SESSIONS):
+        self._sessions: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        # time (time.monotonic) of the last access of every session
+        self._used: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.timeout = timeout
+        self.max_sessions = max_sessions
+
+    def add(self, session: Any) -> str:
+        """
+        Returns
+        -------
+        str
+            id of the added session.
+        """
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._evict(self.max_sessions - 1)
+            self._sessions[session_id] = session
+            self._locks[session_id] = threading.Lock()
+            self._used[session_id] = time.monotonic()
+        return session_id
+
+    def get(self, session_id: str) -> Any:
+        """
+        Raises
+        ------
+        NotFound
+            if there is no session with the given id.
+        """
+        with self._lock:
+            self._evict(self.max_sessions)
+            if session_id not in self._sessions:
+                raise NotFound("unknown session " + session_id)
+            self._used[session_id] = time.monotonic()
+            return self._sessions[session_id]
+
+    def lock(self, session_id: str) -> threading.Lock:
+        """
+        Returns
+        -------
+        threading.Lock
+            lock that must be held while a session is read or modified, since requests run concurrently.
+        """
+        self.get(session_id)
+        with self._lock:
+            if session_id not in self._locks:
+                raise NotFound("unknown session " + session_id)
+            return self._locks[session_id]
+
+    def remove(self, session_id: str):
+        """
+        Raises
+        ------
+        NotFound
+            if there is no session with the given id.
+        """
+        with self._lock:
+            if self._sessions.pop(session_id, None) is None:
+                raise NotFound("unknown session " + session_id)
+            del self._locks[session_id]
+            del self._used[session_id]
+
+    def _evict(self, max_sessions: int):
+        # must be called while holding the lock
+        now = time.monotonic()
+        by_use = sorted(self._used, key=self._used.get)
+        expired = [session_id for session_id in by_use if now - self._used[session_id] > self.timeout]
+        remaining = by_use[len(expired):]
+        excess = remaining[:max(0, len(remaining) - max_sessions)]
+        for session_id in expired + excess:
+            del self._sessions[session_id]
+            del self._locks[session_id]
+            del self._used[session_id]
+
+
+def get_session_store() -> SessionStore:
+    return app.config["sessions"]
@@ -1,8 +1,34 @@
 import os
 from typing import Optional, List
 
+import numpy as np
 import pandas as pd
 from flask import current_app as app
+from werkzeug.exceptions import BadRequest
+
+from app.utils.storage import ColumnarDataset, dataset_cache
+
+
+def get_standard_dataset(config: str, component: str) -> ColumnarDataset:
+    """
+    Loads the data extract of a component, which is used as standard batch.
+
+    Parameters
+    ----------
+    config
+        name of the config.
+    component
+        name of the component.
+
+    Returns
+    -------
+    ColumnarDataset
+        the characteristic values of every batch and klt.
+    """
+    dataset = dataset_cache.get(os.path.join(app.instance_path, "data", config), component)
+    if dataset is None:
+        raise BadRequest("missing standard data " + component)
+    return dataset
 
 
 def get_standard_characteristic_values(config: str, component: str, sample_size: Optional[int],
@@ -26,14 +52,11 @@ def get_standard_characteristic_values(config: str, component: str, sample_size:
     pd.DataFrame
         a data frame with characteristic values as columns and samples in rows.
     """
-    dir_name = os.path.join(app.instance_path, "data", config)
-    with open(os.path.join(dir_name, f"{component}.csv"), "r") as f:
-        df = pd.read_csv(f, sep=";", decimal=",")
-        df = df.drop(df.columns[:2], axis=1)
-        if sample_size:
-            return df.sample(n=sample_size, random_state=seed)
-        else:
-            return df
+    dataset = get_standard_dataset(config, component)
+    if sample_size:
+        return dataset.sample(sample_size, seed)
+    else:
+        return dataset.frame()
 
 
 def get_standard_characteristic_values_batches(config: str, component: str) -> List[List[pd.DataFrame]]:
@@ -52,13 +75,56 @@ def get_standard_characteristic_values_batches(config: str, component: str) -> L
     List[List[pd.DataFrame]]
         for every batch and every klt a data frame.
     """
-    dir_name = os.path.join(app.instance_path, "data", config)
-    with open(os.path.join(dir_name, f"{component}.csv"), "r") as f:
-        df = pd.read_csv(f, sep=";", decimal=",")
-        batches = []
-        for _, batch in df.groupby("Batch_ID"):
-            klts = []
-            for _, klt in batch.groupby("KLT_ID"):
-                klts.append(klt.drop(klt.columns[:2], axis=1).reset_index(drop=True))
-            batches.append(klts)
-        return batches
+    return get_standard_dataset(config, component).klts()
+
+
+def standard_klt_seeds(batch_number: int, klt_number: int) -> np.ndarray:
+    """
+    Seeds for sampling the standard klts of several batches, so that every klt is reproducible on its own.
+
+    Parameters
+    ----------
+    batch_number
+        number of batches.
+    klt_number
+        number of klts per batch.
+
+    Returns
+    -------
+    np.ndarray
+        array of shape (batch_number, klt_number), the seed of klt k in batch b is (b + 1) * klt_number + (k + 1).
+    """
+    return (np.arange(1, batch_number + 1)[:, np.newaxis] * klt_number + np.arange(1, klt_number + 1)).astype(np.int64)
+
+
+def sample_standard_klts(config: str, component: str, batch_number: int, klt_number: int,
+                         batch_size: int) -> np.ndarray:
+    """
+    Samples the characteristic values of all standard klts of several batches at once.
+
+    Every klt contains the same values as
+    get_standard_characteristic_values(config, component, batch_size, seed) with its seed of standard_klt_seeds.
+
+    Parameters
+    ----------
+    config
+        name of the config.
+    component
+        name of the component.
+    batch_number
+        number of batches.
+    klt_number
+        number of klts per batch.
+    batch_size
+        number of values per klt.
+
+    Returns
+    -------
+    np.ndarray
+        array of shape (batch_number, klt_number, batch_size, characteristics),
+        the characteristics are ordered like the columns of get_standard_dataset.
+    """
+    dataset = get_standard_dataset(config, component)
+    rows = dataset.sample_rows(batch_size, standard_klt_seeds(batch_number, klt_number))
+    # gather all samples at once, shape (characteristics, batches, klts, values)
+    return np.moveaxis(dataset.values[:, rows], 0, -1)
@@ -0,0 +1,389 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, IO, List, Optional, Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+# file extensions of the columnar storage
+VALUES_EXTENSION = ".npy"
+COLUMNS_EXTENSION = ".columns.json"
+# file extensions of the legacy storage, in the order they are looked up
+LEGACY_EXTENSIONS = (".csv", ".json")
+# maximum size of all datasets that are kept in memory by the dataset cache
+DATASET_CACHE_BUDGET = 256 * 2 ** 20
+# a dataset whose files do not match (another process is replacing them) is loaded again up to this many times
+LOAD_RETRIES = 5
+LOAD_RETRY_DELAY = 0.05
+
+# one lock per dataset path, held while a dataset is migrated, saved or loaded by this process
+_path_locks: Dict[str, threading.Lock] = {}
+_path_locks_lock = threading.Lock()
+
+
+class ColumnarDataset:
+    """
+    Characteristic values of a component, indexed by batch and klt.
+
+    The values are stored column by column in a .npy file (shape (characteristics, rows)) that is memory mapped,
+    so that loading the dataset does not parse or copy the values.
+    The column names are stored in a separate .columns.json file, which is replaced after the .npy file,
+    so a dataset is only consistent if its number of columns matches the .npy file (see load).
+    The first two rows of the .npy file are the Batch_ID and KLT_ID of every entry.
+    """
+
+    def __init__(self, columns: List[str], values: np.ndarray, batch_ids: np.ndarray, klt_ids: np.ndarray):
+        # names of the characteristics
+        self.columns = columns
+        # shape (characteristics, entries)
+        self.values = values
+        self.batch_ids = batch_ids
+        self.klt_ids = klt_ids
+
+    @staticmethod
+    def from_csv(file_name: str) -> "ColumnarDataset":
+        """
+        Reads a legacy data extract, i.e. a csv file with the columns Batch_ID, KLT_ID and the characteristics.
+        """
+        with open(file_name, "r") as f:
+            df = pd.read_csv(f, sep=";", decimal=",")
+        ids = df[df.columns[:2]].to_numpy(dtype=np.int64)
+        values = np.ascontiguousarray(df[df.columns[2:]].to_numpy(dtype=np.float64).T)
+        return ColumnarDataset(list(df.columns[2:]), values, ids[:, 0], ids[:, 1])
+
+    @staticmethod
+    def from_batches(batches: List[List[Dict[str, List[float]]]]) -> "ColumnarDataset":
+        """
+        Converts characteristic values of every batch and klt (e.g. uploaded by the customer) into a dataset.
+        The batch and klt indices are used as Batch_ID and KLT_ID.
+        """
+        klts = [(batch_idx, klt_idx, pd.DataFrame.from_dict(klt)) for batch_idx, batch in enumerate(batches)
+                for klt_idx, klt in enumerate(batch)]
+        if len(klts) == 0:
+            return ColumnarDataset([], np.empty((0, 0)), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+        columns = list(klts[0][2].columns)
+        values = np.concatenate([klt[columns].to_numpy(dtype=np.float64).T for _, _, klt in klts], axis=1)
+        batch_ids = np.concatenate([np.full(len(klt), batch_idx, dtype=np.int64) for batch_idx, _, klt in klts])
+        klt_ids = np.concatenate([np.full(len(klt), klt_idx, dtype=np.int64) for _, klt_idx, klt in klts])
+        return ColumnarDataset(columns, values, batch_ids, klt_ids)
+
+    @staticmethod
+    def load(path: str) -> "ColumnarDataset":
+        """
+        Loads (memory maps) a dataset in the columnar storage.
+
+        If the column names do not match the values, another process is replacing the files (see save),
+        and they are loaded again.
+
+        Parameters
+        ----------
+        path
+            file name without extension.
+
+        Raises
+        ------
+        ValueError
+            if the column names still do not match the values after LOAD_RETRIES attempts.
+        """
+        for attempt in range(LOAD_RETRIES):
+            if attempt > 0:
+                time.sleep(LOAD_RETRY_DELAY)
+            stored = np.load(path + VALUES_EXTENSION, mmap_mode="r")
+            with open(path + COLUMNS_EXTENSION, "r") as f:
+                columns = json.load(f)
+            if len(columns) + 2 == stored.shape[0]:
+                return ColumnarDataset(columns, stored[2:], stored[0].astype(np.int64), stored[1].astype(np.int64))
+        raise ValueError(f"the columns of {path} do not match its values")
+
+    def save(self, path: str):
+        """
+        Saves the dataset in the columnar storage.
+
+        Parameters
+        ----------
+        path
+            file name without extension.
+        """
+        stored = np.concatenate([self.batch_ids[np.newaxis], self.klt_ids[np.newaxis], self.values]).astype(np.float64)
+        # write to unique temporary files first, so that concurrent readers never see half written files
+        # and the (possibly memory mapped) files of other writers are never truncated
+        values_file = _write_temporary(path, lambda f: np.save(f, stored))
+        try:
+            columns_file = _write_temporary(path, lambda f: f.write(json.dumps(self.columns).encode()))
+        except BaseException:
+            os.remove(values_file)
+            raise
+        # the values first, the columns commit the dataset (see load)
+        os.replace(values_file, path + VALUES_EXTENSION)
+        os.replace(columns_file, path + COLUMNS_EXTENSION)
+
+    def __len__(self) -> int:
+        return len(self.batch_ids)
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes + self.batch_ids.nbytes + self.klt_ids.nbytes
+
+    def in_memory(self) -> "ColumnarDataset":
+        """
+        Returns
+        -------
+        ColumnarDataset
+            the dataset with all values read into memory, instead of being memory mapped.
+        """
+        values, batch_ids, klt_ids = np.array(self.values), np.array(self.batch_ids), np.array(self.klt_ids)
+        # the arrays may be shared by several requests (see DatasetCache)
+        for array in (values, batch_ids, klt_ids):
+            array.flags.writeable = False
+        return ColumnarDataset(self.columns, values, batch_ids, klt_ids)
+
+    def sample(self, sample_size: int, seed: Optional[int] = 42) -> pd.DataFrame:
+        """
+        Samples entries without replacement.
+
+        This draws the same entries as DataFrame.sample(n=sample_size, random_state=seed) on the data frame
+        of all entries, but only the sampled entries are copied.
+
+        Parameters
+        ----------
+        sample_size
+            size of the sample.
+        seed
+            seed for random sampling. Use None for random seed.
+
+        Returns
+        -------
+        pd.DataFrame
+            a data frame with characteristic values as columns and the sampled entries in rows,
+            indexed by their position in the dataset.
+        """
+        rows = np.random.RandomState(seed).choice(len(self), size=sample_size, replace=False)
+        return pd.DataFrame(self.values[:, rows].T, index=rows, columns=self.columns, copy=False)
+
+    def sample_rows(self, sample_size: int, seeds: np.ndarray) -> np.ndarray:
+        """
+        Draws the entries of several samples without replacement, each one like sample(sample_size, seed).
+
+        Parameters
+        ----------
+        sample_size
+            size of every sample.
+        seeds
+            an array of seeds (any shape), one per sample.
+
+        Returns
+        -------
+        np.ndarray
+            the positions of the sampled entries, with the shape (*seeds.shape, sample_size).
+        """
+        rows = np.empty(seeds.shape + (sample_size,), dtype=np.intp)
+        for index in np.ndindex(seeds.shape):
+            rows[index] = np.random.RandomState(seeds[index]).choice(len(self), size=sample_size, replace=False)
+        return rows
+
+    def frame(self) -> pd.DataFrame:
+        """
+        Returns
+        -------
+        pd.DataFrame
+            a data frame with characteristic values as columns and all entries in rows (in the stored order).
+        """
+        return pd.DataFrame(self.values.T, columns=self.columns, copy=False)
+
+    def klts(self) -> List[List[pd.DataFrame]]:
+        """
+        Returns
+        -------
+        List[List[pd.DataFrame]]
+            for every batch and every klt (ordered by their ids) a data frame.
+        """
+        # stable sort, so that the entries of a klt keep their stored order
+        order = np.lexsort((self.klt_ids, self.batch_ids))
+        batch_ids, klt_ids = self.batch_ids[order], self.klt_ids[order]
+        starts = np.flatnonzero(np.r_[True, (batch_ids[1:] != batch_ids[:-1]) | (klt_ids[1:] != klt_ids[:-1])])
+        ends = np.r_[starts[1:], len(order)]
+
+        batches = []
+        for start, end in zip(starts, ends):
+            if start == 0 or batch_ids[start] != batch_ids[start - 1]:
+                batches.append([])
+            values = self.values[:, order[start:end]]
+            batches[-1].append(pd.DataFrame(values.T, columns=self.columns, copy=False))
+        return batches
+
+
+def load_dataset(dir_name: str, name: str) -> Optional[ColumnarDataset]:
+    """
+    Loads a dataset from the columnar storage.
+
+    Legacy files (.csv data extracts and .json uploads) are migrated transparently:
+    if there is no columnar file or the legacy file has been modified since, it is converted and saved.
+
+    Parameters
+    ----------
+    dir_name
+        directory of the dataset.
+    name
+        name of the dataset, e.g. the component name.
+
+    Returns
+    -------
+    Optional[ColumnarDataset]
+        the dataset, or None if there is neither a columnar nor a legacy file.
+    """
+    path = os.path.join(dir_name, name)
+    # concurrent requests must not migrate the same dataset at once
+    with _path_lock(path):
+        return _load_dataset(path)
+
+
+def _load_dataset(path: str) -> Optional[ColumnarDataset]:
+    values_file = path + VALUES_EXTENSION
+    stored_time = os.path.getmtime(values_file) if os.path.isfile(values_file) else None
+
+    for extension in LEGACY_EXTENSIONS:
+        legacy_file = path + extension
+        if not os.path.isfile(legacy_file):
+            continue
+        if stored_time is not None and os.path.getmtime(legacy_file) <= stored_time:
+            break
+        if extension == ".csv":
+            dataset = ColumnarDataset.from_csv(legacy_file)
+        else:
+            with open(legacy_file, "r") as f:
+                dataset = ColumnarDataset.from_batches(json.load(f))
+        try:
+            dataset.save(path)
+        except OSError:
+            # e.g. read-only instance folder: keep using the legacy file
+            return dataset
+        break
+
+    if not os.path.isfile(values_file):
+        return None
+    return ColumnarDataset.load(path)
+
+
+def save_dataset(dir_name: str, name: str, dataset: ColumnarDataset):
+    """
+    Saves a dataset in the columnar storage.
+
+    Parameters
+    ----------
+    dir_name
+        directory of the dataset, which is created if necessary.
+    name
+        name of the dataset, e.g. the component name.
+    dataset
+        the dataset.
+    """
+    os.makedirs(dir_name, exist_ok=True)
+    path = os.path.join(dir_name, name)
+    with _path_lock(path):
+        dataset.save(path)
+
+
+def _path_lock(path: str) -> threading.Lock:
+    path = os.path.abspath(path)
+    with _path_locks_lock:
+        return _path_locks.setdefault(path, threading.Lock())
+
+
+def _write_temporary(path: str, write: Callable[[IO[bytes]], Any]) -> str:
+    """
+    Writes a new temporary file next to the given path.
+
+    Returns
+    -------
+    str
+        name of the temporary file, which must be renamed or removed by the caller.
+    """
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".",
+                                     suffix=".tmp", delete=False) as f:
+        try:
+            write(f)
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+    # temporary files are only readable by their owner, the dataset files are readable like any other file
+    os.chmod(f.name, 0o644)
+    return f.name
+
+
+class DatasetCache:
+    """
+    Least recently used cache of loaded datasets, with a memory budget.
+
+    A cached dataset is reloaded if its columnar or legacy files have been modified.
+    """
+
+    def __init__(self, max_bytes: int = DATASET_CACHE_BUDGET):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Tuple[float, ...], ColumnarDataset]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, dir_name: str, name: str) -> Optional[ColumnarDataset]:
+        """
+        Loads a dataset (see load_dataset), or returns the cached dataset if its files have not been modified since.
+
+        Parameters
+        ----------
+        dir_name
+            directory of the dataset.
+        name
+            name of the dataset, e.g. the component name.
+
+        Returns
+        -------
+        Optional[ColumnarDataset]
+            the dataset, or None if there is neither a columnar nor a legacy file.
+        """
+        key = (dir_name, name)
+        path = os.path.join(dir_name, name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == _modification_times(path):
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        dataset = load_dataset(dir_name, name)
+        if dataset is not None:
+            dataset = dataset.in_memory()
+        # the modification times after a possible migration
+        modification_times = _modification_times(path)
+
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1].nbytes
+            if dataset is None:
+                return None
+            self._entries[key] = (modification_times, dataset)
+            self._bytes += dataset.nbytes
+            # evict the least recently used datasets, but always keep the current one
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+        return dataset
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+def _modification_times(path: str) -> Tuple[float, ...]:
+    """
+    Returns the modification times of the columnar and legacy files of a dataset (0 for missing files).
+    """
+    return tuple(os.path.getmtime(path + extension) if os.path.isfile(path + extension) else 0.
+                 for extension in (VALUES_EXTENSION, COLUMNS_EXTENSION) + LEGACY_EXTENSIONS)
+
+
+# datasets of all configs, standard data extracts as well as customer uploads
+dataset_cache = DatasetCache()
@@ -1,8 +1,11 @@
 import json
 import os
+from typing import Dict, List, Optional
 
 from flask import current_app as app
 
+from app.utils.storage import ColumnarDataset, dataset_cache, save_dataset
+
 
 def get_user_data(config: str) -> dict:
     file_name = os.path.join(app.instance_path, "saved_data", config, "settings.json")
@@ -22,3 +25,23 @@ def save_user_data(config: str, data: dict):
     file_name = os.path.join(dir_name, "settings.json")
     with open(file_name, "w") as f:
         return json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def get_component_data(config: str, component: str) -> Optional[ColumnarDataset]:
+    """
+    Loads the characteristic values of a component that have been uploaded by the customer.
+
+    Returns
+    -------
+    Optional[ColumnarDataset]
+        the characteristic values of every batch and klt, or None if no values have been uploaded.
+    """
+    return dataset_cache.get(os.path.join(app.instance_path, "saved_data", config), component)
+
+
+def save_component_data(config: str, component: str, batches: List[List[Dict[str, List[float]]]]):
+    """
+    Saves the characteristic values of every batch and klt of a component.
+    """
+    save_dataset(os.path.join(app.instance_path, "saved_data", config), component,
+                 ColumnarDataset.from_batches(batches))
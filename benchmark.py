@@ -0,0 +1,128 @@
+import argparse
+import time
+from typing import List, Callable
+
+import numpy as np
+import pandas as pd
+from werkzeug.exceptions import InternalServerError
+
+from app.calculations import simplex
+
+
+def measure(function: Callable, *args):
+    """
+    Runs the given function and measures the elapsed wall time.
+
+    Returns
+    -------
+    Tuple[Any, float]
+        result of the function and elapsed time in seconds.
+    """
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def benchmark_simplex(sizes: List[int], max_lp_size: int, max_dense_size: int, seed: int):
+    """
+    Compares the allocation methods of the individual assembly (simplex) strategy.
+
+    The linear programs are only solved up to the given sizes, since their memory grows with n^2 (sparse)
+    or n^3 (dense).
+    """
+    rng = np.random.default_rng(seed)
+    print(f"{'n':>6} {'method':>10} {'time [s]':>10} {'objective':>12} {'optimal':>8} {'same order':>10}")
+    for n in sizes:
+        main_fulfillments = rng.normal(0, 1, (1, n))
+        mating_fulfillments = rng.normal(0, 1, (1, n))
+        costs = abs(np.add.outer(main_fulfillments[0], mating_fulfillments[0]))
+
+        reference, reference_objective = None, None
+        for method, max_size in (("assignment", n), ("highs", max_lp_size), ("simplex", max_dense_size)):
+            if n > max_size:
+                print(f"{n:>6} {method:>10} {'skipped':>10}")
+                continue
+            try:
+                order, elapsed = measure(simplex.solve_allocation, main_fulfillments, mating_fulfillments, method)
+            except (ValueError, MemoryError, InternalServerError) as e:
+                print(f"{n:>6} {method:>10} {'failed':>10} {type(e).__name__}: {e}")
+                continue
+            objective = costs[np.arange(n), order].sum()
+            if reference is None:
+                reference, reference_objective = order, objective
+            # the allocation order may differ if there are several optimal allocations
+            optimal = np.isclose(objective, reference_objective)
+            print(f"{n:>6} {method:>10} {elapsed:>10.3f} {objective:>12.6f} {str(optimal):>8} "
+                  f"{str(order == reference):>10}")
+
+
+def benchmark_moments(config: str, batches: int, batch_size: int, bins: int):
+    """
+    Compares the "moments" convolution with the histogram convolution of conventional assembly,
+    in speed and in accuracy of the scalar values and the resulting allocation.
+    The regret is the additional cost of the allocation, valuated with the histogram convolution.
+
+    The batches are sampled from the standard data extracts of the config.
+    """
+    from app import create_app
+    from app.calculations.allocation.convolution_methods import supported_convolution_methods
+    from app.calculations.allocation.optimization_algorithms import PairwiseEvaluator
+    from app.calculations.allocation.valuation_methods import supported_valuation_methods
+    from app.calculations.optimization import linear_assignment
+    from app.utils.standards import get_standard_dataset, sample_standard_klts
+
+    flask_app = create_app()
+    with flask_app.app_context():
+        context = flask_app.config["contexts"][config]
+        components = []
+        component_names = list(context.components)[:2]
+        for component in component_names:
+            columns = get_standard_dataset(config, component).columns
+            klts = sample_standard_klts(config, component, batches, 1, batch_size)
+            components.append([pd.DataFrame(batch[0], columns=columns, copy=False) for batch in klts])
+        settings_dict = {"config": context, "bins": bins, "batch_size": batch_size, "workers": 1,
+                         "component_names": component_names}
+
+        print(f"{'method':>9} {'convolution':>12} {'time [s]':>10} {'max abs err':>12} {'max rel err':>12} "
+              f"{'same allocation':>16} {'regret':>10}")
+        for method in ("mean", "mean_std", "cpk"):
+            reference, reference_order = None, None
+            for convolution in (None, "moments"):
+                evaluator = PairwiseEvaluator(components, supported_convolution_methods[convolution],
+                                              supported_valuation_methods[method], settings_dict)
+                costs, elapsed = measure(evaluator.cost_matrix)
+                order, _ = linear_assignment(costs)
+                if reference is None:
+                    reference, reference_order = costs, order
+                # additional cost of the allocation, valuated with the histogram convolution
+                rows = np.arange(len(order))
+                regret = reference[rows, order].sum() - reference[rows, reference_order].sum()
+                abs_error = np.abs(costs - reference)
+                rel_error = abs_error / np.maximum(np.abs(reference), np.finfo(float).tiny)
+                print(f"{method:>9} {convolution or 'histogram':>12} {elapsed:>10.3f} {abs_error.max():>12.2e} "
+                      f"{rel_error.max():>12.2e} {str(order == reference_order):>16} {regret:>10.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the allocation calculations.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    simplex_parser = subparsers.add_parser("simplex", help="individual assembly allocation methods")
+    simplex_parser.add_argument("sizes", type=int, nargs="*", default=[100, 1000, 5000])
+    simplex_parser.add_argument("--max-lp-size", type=int, default=1000,
+                                help="largest n for the sparse linear program (HiGHS)")
+    simplex_parser.add_argument("--max-dense-size", type=int, default=100,
+                                help="largest n for the dense linear program (legacy simplex)")
+    simplex_parser.add_argument("--seed", type=int, default=42)
+
+    moments_parser = subparsers.add_parser("moments", help="moments convolution against the histogram convolution")
+    moments_parser.add_argument("--config", default="dummy")
+    moments_parser.add_argument("--batches", type=int, default=20)
+    moments_parser.add_argument("--batch-size", type=int, default=100)
+    moments_parser.add_argument("--bins", type=int, default=31)
+
+    args = parser.parse_args()
+    if args.benchmark == "simplex":
+        benchmark_simplex(args.sizes, args.max_lp_size, args.max_dense_size, args.seed)
+    elif args.benchmark == "moments":
+        benchmark_moments(args.config, args.batches, args.batch_size, args.bins)